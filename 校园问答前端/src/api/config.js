@@ -1,6 +1,7 @@
 // @/api/config.js
 export const API = {
     GENERATE: '/chat/generate',
+    GENERATE_STREAM: '/chat/generate/stream',
 
 }
 
@@ -48,3 +48,45 @@ export const post = (url, data) => {
     data
   })
 }
+
+// 流式请求（Server-Sent Events），每收到一个事件回调 onEvent(event, data)
+export const postStream = async (url, data, onEvent) => {
+  const response = await fetch(BASE_URL + url, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(data)
+  })
+  if (!response.ok || !response.body) {
+    throw new Error(`请求失败：${response.status}`)
+  }
+
+  const reader = response.body.getReader()
+  const decoder = new TextDecoder('utf-8')
+  let buffer = ''
+
+  while (true) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+
+    // 事件之间以空行分隔
+    let boundary
+    while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+      const rawEvent = buffer.slice(0, boundary)
+      buffer = buffer.slice(boundary + 2)
+
+      let event = 'message'
+      const dataLines = []
+      for (const line of rawEvent.split('\n')) {
+        if (line.startsWith('event:')) {
+          event = line.slice(6).trim()
+        } else if (line.startsWith('data:')) {
+          dataLines.push(line.slice(5).trim())
+        }
+      }
+      if (dataLines.length) {
+        onEvent(event, JSON.parse(dataLines.join('\n')))
+      }
+    }
+  }
+}
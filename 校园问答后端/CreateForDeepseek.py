@@ -1,6 +1,6 @@
 import os
-import re
-from typing import List, Dict
+import time
+from typing import List, Dict, Iterator, Tuple
 
 from langchain.document_loaders import (
     PyPDFLoader,#.pdf
@@ -11,16 +11,23 @@ from langchain.document_loaders import (
     UnstructuredExcelLoader,  # 处理.xlsx
 )
 
-from langchain.text_splitter import (
-    RecursiveCharacterTextSplitter,
-    MarkdownHeaderTextSplitter
-)
-
-from langchain.embeddings import OllamaEmbeddings
 from langchain.vectorstores import Chroma
 from langchain.docstore.document import Document
 import argparse
 
+from embedding_factory import (
+    EMBEDDING_BACKENDS,
+    EmbeddingMismatchError,
+    create_embeddings,
+    open_vectorstore,
+    probe_dimension,
+)
+from ingest_manifest import IngestManifest, chunk_ids_for
+from ingest_splitter import DocumentSplitter
+from embed_pipeline import EmbedUpsertPipeline
+from keyword_index import build_from_collection
+from faq_store import answers_stale
+
 
 class MultiFormatLoader:
     def __init__(self, file_path):
@@ -40,13 +47,19 @@ class MultiFormatLoader:
                 return UnstructuredFileLoader(self.file_path).load()
        except Exception as e:
            raise ValueError(f"Failed to load {self.file_path}: {str(e)}")
-class NWUKnowledgeTrainer:
-    def __init__(self):
-        self.embeddings = OllamaEmbeddings(model="deepseek-r1:14b")
-        self.exclude_files = ['.DS_Store', 'Thumbs.db']  # 排除系统文件
+
+
+class NWUKnowledgeTrainer(DocumentSplitter):
+    def __init__(self, embedding_cache_dir: str = "./embedding_cache",
+                 embedding_model: str = "deepseek-r1:14b", embedding_backend: str = "ollama"):
+        self.embedding_cache_dir = embedding_cache_dir
+        self.embedding_model = embedding_model
+        self.embedding_backend = embedding_backend
+        # 嵌入结果按文本内容缓存，未变化的文档重复训练时不再请求模型
+        self.embeddings = create_embeddings(embedding_model, embedding_backend, embedding_cache_dir)
 
         #定义各目录的处理配置
-        self.category_config = {
+        super().__init__({
             "培养方案相关": {
                 "chunk_size": 1500,
                 "chunk_overlap": 400,
@@ -79,133 +92,202 @@ class NWUKnowledgeTrainer:
             },
 
 
-        }
+        })
 
-    def clean_text(self, text: str) -> str:
-        """清理文档文本"""
-        # 去除特殊字符
-        text = re.sub(r'[\x00-\x1f\x7f-\x9f]', ' ', text)
-        # 合并多余空格和换行
-        text = re.sub(r'\s+', ' ', text)
-        # 移除文档头尾的无关信息
-        lines = [line.strip() for line in text.split('\n') if line.strip()]
-        return ' '.join(lines[:1000])  # 限制最大长度
-
-    def load_category_documents(self, base_dir: str) -> List[Document]:
-        """修复后的文档加载方法"""
-        all_documents = []
-
-        for category, config in self.category_config.items():
-            category_dir = os.path.join(base_dir, category)
-            if not os.path.exists(category_dir):
-                print(f"⚠️ 目录不存在: {category_dir}")
-                continue
+    def iter_file_chunks(self, files: List[Tuple[str, str]], workers: int,
+                         chunk_index: Dict[str, Tuple[str, List[str]]]) -> Iterator[Tuple[str, Document]]:
+        """多进程加载、清洗并分割文件，流式产出 (文本块id, 文本块)
 
-            print(f"\n📂 正在处理类别: {category}")
-
-            for root, _, files in os.walk(category_dir):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    file_ext = os.path.splitext(file)[1].lower()
-
-                    # 过滤文件
-                    if any(exclude in file for exclude in self.exclude_files):
-                        continue
-                    if file_ext not in config["file_types"]:
-                        continue
-
-                    # 动态选择加载器
-                    try:
-                        if file_ext == '.pdf':
-                            docs = PyPDFLoader(file_path).load()
-                        elif file_ext == '.docx':
-                            docs = Docx2txtLoader(file_path).load()
-                        elif file_ext == '.doc':
-                            docs = UnstructuredWordDocumentLoader(file_path).load()
-                        elif file_ext == '.xlsx':
-                            docs = UnstructuredExcelLoader(file_path).load()
-                        else:
-                            docs = UnstructuredFileLoader(file_path).load()
-
-                        # 清洗和增强元数据
-                        for doc in docs:
-                            doc.metadata.update({
-                                "category": category,
-                                "source_path": file_path
-                            })
-                            doc.page_content = self.clean_text(doc.page_content)
-                            all_documents.append(doc)
-                            print(f"✅ 已加载: {file}")
-                    except Exception as e:
-                        print(f"❌ 加载失败 {file}: {str(e)}")
-
-        return all_documents
-
-    def split_documents(self, documents: List[Document]) -> List[Document]:
-        """根据类别使用不同策略分割文档"""
-        split_docs = []
-
-        for doc in documents:
-            category = doc.metadata["category"]
-            config = self.category_config.get(category, {})
-
-            splitter = RecursiveCharacterTextSplitter(
-                chunk_size=config.get("chunk_size", 1000),
-                chunk_overlap=config.get("chunk_overlap", 200),
-                length_function=len
-            )
-
-            try:
-                splits = splitter.split_documents([doc])
-                for split in splits:
-                    split.metadata.update(doc.metadata)  # 保留原始元数据
-                split_docs.extend(splits)
-            except Exception as e:
-                print(f"分割文档出错: {str(e)}")
+        chunk_index 记录每个成功处理的文件的 (文件哈希, 文本块id列表)，用于写入清单。
+        """
+        total_docs = 0
+        for _, (_, file_path), result, error in self.split_files(files, workers):
+            file = os.path.basename(file_path)
+            if error:
+                print(f"❌ 加载失败 {file}: {error}")
+                continue
+            n_docs, splits = result
+            total_docs += n_docs
+            print(f"✅ 已加载: {file}（{len(splits)} 块）")
+            if not splits:
                 continue
 
-        return split_docs
+            ids = chunk_ids_for(splits)
+            chunk_index[file_path] = (splits[0].metadata["file_hash"], ids)
+            yield from zip(ids, splits)
+
+        print(f"\n📑 共加载 {total_docs} 个文档")
 
-    def train(self, docs_dir: str, db_dir: str):
-        """训练知识库"""
+    def train(self, docs_dir: str, db_dir: str, workers: int = 1,
+              batch_size: int = 64, embed_concurrency: int = 4):
+        """训练知识库：解析、分割、嵌入、写入以流水线方式进行，中断后重跑可续传"""
         print("🔍 开始扫描文档目录...")
-        documents = self.load_category_documents(docs_dir)
+        files = list(self.iter_category_files(docs_dir))
 
-        if not documents:
+        if not files:
             print("❌ 未找到任何有效文档，请检查目录结构")
             return False
 
-        print(f"\n📑 共加载 {len(documents)} 个文档，开始分割...")
-        splits = self.split_documents(documents)
-        print(f"✂️ 分割为 {len(splits)} 个文本块")
+        print(f"\n📑 共 {len(files)} 个文件，使用 {workers} 个进程加载并分割，"
+              f"每批 {batch_size} 块、{embed_concurrency} 路并发嵌入")
 
         print("\n🧠 正在创建向量数据库...")
         try:
-            vectorstore = Chroma.from_documents(
-                documents=splits,
-                embedding=self.embeddings,
-                persist_directory=db_dir,
-                collection_metadata={
-                    "hnsw:space": "cosine",
-                    "institution": "西北大学"
-                }
-            )
+            vectorstore = self._open_vectorstore(db_dir)
+            chunk_index = {}
+            pipeline = EmbedUpsertPipeline(vectorstore, self.embeddings, batch_size, embed_concurrency)
+            stats = pipeline.run(self.iter_file_chunks(files, workers, chunk_index))
+
+            if not stats["total"]:
+                print("❌ 未找到任何有效文档，请检查目录结构")
+                return False
+
+            # 删除上次清单中已修改和已移除文件的旧文本块（加载失败的文件保留旧文本块）
+            manifest = IngestManifest(db_dir, docs_dir)
+            stale_ids = self._stale_chunk_ids(manifest, files, chunk_index)
+            if stale_ids:
+                vectorstore.delete(ids=stale_ids)
             vectorstore.persist()
 
-            print(f"\n🎉 知识库训练完成！")
+            # 记录清单，供后续增量训练使用
+            self._record_manifest(manifest, files, chunk_index)
+            if stats["written"]:
+                manifest.avg_chunk_seconds = stats["seconds"] / stats["written"]
+            manifest.save()
+
+            # 关键词索引与向量库使用同一批文本块
+            keyword_index = build_from_collection(vectorstore._collection, db_dir)
+
+            print(f"\n🎉 知识库训练完成！用时 {stats['seconds']:.1f}s")
             print(f"- 文档类别: {len(self.category_config)} 类")
+            print(f"- 文本块: {stats['total']}（本次写入 {stats['written']}，已存在跳过 {stats['skipped']}，"
+                  f"删除过期 {len(stale_ids)}）")
+            print(f"- 吞吐量: {stats['chunks_per_second']:.1f} 块/秒")
+            print(f"- 关键词索引: {len(keyword_index)} 块")
             print(f"- 向量存储位置: {db_dir}")
+            self._report_faq(db_dir)
+            cache_stats = self.embeddings.stats()
+            print(f"- 嵌入缓存: 命中 {cache_stats['hits']}，新计算 {cache_stats['misses']}")
             return True
 
         except Exception as e:
             print(f"❌ 创建向量数据库失败: {str(e)}")
+            print("已写入的批次会保留，重新运行将从中断处继续")
+            return False
+
+    @staticmethod
+    def _stale_chunk_ids(manifest: IngestManifest, files: List[Tuple[str, str]],
+                         chunk_index: Dict[str, Tuple[str, List[str]]]) -> List[str]:
+        """全量训练后不再需要的文本块 id，并从清单中移除已不存在的文件
+
+        文件修改后块 id 随内容哈希变化，旧块不会被新块覆盖；文件删除后旧块也无人清理，
+        两者都按上次清单中记录的 id 删除。
+        """
+        present = {manifest.key(file_path) for _, file_path in files}
+        stale = []
+        for key in [key for key in manifest.files if key not in present]:
+            stale.extend(manifest.chunk_ids(key))
+            manifest.remove(key)
+        for file_path, (_, ids) in chunk_index.items():
+            current = set(ids)
+            stale.extend(chunk_id for chunk_id in manifest.chunk_ids(manifest.key(file_path))
+                         if chunk_id not in current)
+        return stale
+
+    def train_incremental(self, docs_dir: str, db_dir: str, workers: int = 1,
+                          batch_size: int = 64, embed_concurrency: int = 4):
+        """增量训练：只处理新增或修改的文件，删除已移除文件的文本块"""
+        started = time.time()
+        print("🔍 开始扫描文档目录（增量模式）...")
+        manifest = IngestManifest(db_dir, docs_dir)
+        files = list(self.iter_category_files(docs_dir))
+        diff = manifest.diff(files)
+
+        print(f"\n📋 新增 {len(diff.added)} 个，修改 {len(diff.updated)} 个，"
+              f"删除 {len(diff.deleted)} 个，未变化 {len(diff.unchanged)} 个文件")
+
+        try:
+            vectorstore = self._open_vectorstore(db_dir)
+
+            # 删除已修改和已移除文件的旧文本块
+            stale_keys = [manifest.key(path) for _, path in diff.updated] + diff.deleted
+            stale_ids = [chunk_id for key in stale_keys for chunk_id in manifest.chunk_ids(key)]
+            if stale_ids:
+                vectorstore.delete(ids=stale_ids)
+            for key in diff.deleted:
+                manifest.remove(key)
+
+            # 加载、分割、嵌入新增和修改的文件
+            written, throughput = 0, 0.0
+            if diff.changed:
+                chunk_index = {}
+                pipeline = EmbedUpsertPipeline(vectorstore, self.embeddings, batch_size, embed_concurrency)
+                stats = pipeline.run(self.iter_file_chunks(diff.changed, workers, chunk_index))
+                written, throughput = stats["written"], stats["chunks_per_second"]
+                if written:
+                    manifest.avg_chunk_seconds = stats["seconds"] / written
+                for key in (manifest.key(path) for _, path in diff.updated):
+                    manifest.remove(key)
+                self._record_manifest(manifest, diff.changed, chunk_index)
+            vectorstore.persist()
+            manifest.save()
+            keyword_index = build_from_collection(vectorstore._collection, db_dir)
+
+            saved = manifest.chunk_count(diff.unchanged) * manifest.avg_chunk_seconds
+            print(f"\n🎉 增量训练完成！用时 {time.time() - started:.1f}s")
+            print(f"- 新增文件: {len(diff.added)}，修改文件: {len(diff.updated)}，删除文件: {len(diff.deleted)}")
+            print(f"- 写入文本块: {written}（{throughput:.1f} 块/秒），删除文本块: {len(stale_ids)}")
+            print(f"- 跳过未变化文件 {len(diff.unchanged)} 个，预计节省 {saved:.1f}s")
+            print(f"- 关键词索引: {len(keyword_index)} 块")
+            print(f"- 向量存储位置: {db_dir}")
+            self._report_faq(db_dir)
+            return True
+
+        except Exception as e:
+            print(f"❌ 增量更新向量数据库失败: {str(e)}")
             return False
 
+    def _report_faq(self, db_dir: str):
+        """知识库内容变化后，预生成答案库随之失效，提示重建"""
+        if answers_stale(db_dir):
+            print("- 预生成答案库已过期（服务端暂停使用），请运行 python build_faq.py 重建")
+
+    def _open_vectorstore(self, db_dir: str) -> Chroma:
+        """打开（或新建）向量库，已有知识库的嵌入模型和维度必须与当前模型一致"""
+        dim = probe_dimension(self.embeddings)
+        try:
+            return open_vectorstore(db_dir, self.embeddings, self.embedding_model, self.embedding_backend,
+                                    dim, metadata=self.collection_metadata)
+        except EmbeddingMismatchError as e:
+            raise ValueError(f"{e}，请使用 migrate_collection.py 迁移或换一个 --db_dir") from None
+
+    @property
+    def collection_metadata(self) -> Dict[str, str]:
+        return {
+            "hnsw:space": "cosine",
+            "institution": "西北大学"
+        }
+
+    def _record_manifest(self, manifest: IngestManifest, files: List[Tuple[str, str]],
+                         chunk_index: Dict[str, Tuple[str, List[str]]]):
+        """把各文件对应的文本块 id 写入清单（加载失败的文件不记录，下次重试）"""
+        for category, file_path in files:
+            if file_path in chunk_index:
+                file_hash, ids = chunk_index[file_path]
+                manifest.record(category, file_path, file_hash, ids)
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="西北大学知识库训练系统")
     parser.add_argument("--docs_dir", default="./数据集", help="文档根目录路径")
     parser.add_argument("--db_dir", default="./nwu_knowledge_v1", help="向量数据库存储路径")
+    parser.add_argument("--embedding_cache_dir", default="./embedding_cache", help="嵌入向量缓存目录")
+    parser.add_argument("--embedding_model", default="deepseek-r1:14b", help="嵌入模型名称")
+    parser.add_argument("--embedding_backend", default="ollama", choices=EMBEDDING_BACKENDS, help="嵌入模型后端")
+    parser.add_argument("--incremental", action="store_true", help="增量训练：只处理新增、修改和删除的文件")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="加载与分割文档的进程数")
+    parser.add_argument("--batch_size", type=int, default=64, help="每批嵌入并写入的文本块数")
+    parser.add_argument("--embed_concurrency", type=int, default=4, help="同时进行的嵌入请求批数")
 
     args = parser.parse_args()
 
@@ -225,6 +307,17 @@ if __name__ == "__main__":
             for d in dirs:
                 print(f"{subindent}{d}/")
     else:
-        trainer = NWUKnowledgeTrainer()
-        success = trainer.train(args.docs_dir, args.db_dir)
+        trainer = NWUKnowledgeTrainer(
+            embedding_cache_dir=args.embedding_cache_dir,
+            embedding_model=args.embedding_model,
+            embedding_backend=args.embedding_backend
+        )
+        if args.incremental:
+            success = trainer.train_incremental(args.docs_dir, args.db_dir, workers=args.workers,
+                                                batch_size=args.batch_size,
+                                                embed_concurrency=args.embed_concurrency)
+        else:
+            success = trainer.train(args.docs_dir, args.db_dir, workers=args.workers,
+                                    batch_size=args.batch_size,
+                                    embed_concurrency=args.embed_concurrency)
         exit(0 if success else 1)
\ No newline at end of file
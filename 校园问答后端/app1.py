@@ -1,17 +1,43 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 import ollama
-from langchain.chains import ConversationChain, RetrievalQA
-from langchain.memory import ConversationBufferWindowMemory
 from langchain.llms.base import LLM
 from langchain.prompts import PromptTemplate
-from typing import Dict, Any
+from langchain_core.outputs import GenerationChunk
+from typing import Dict, Any, Iterator, List, Optional, Tuple, Union
 import uuid
-from collections import defaultdict
-from langchain_community.embeddings import OllamaEmbeddings
+import json
+import asyncio
 from langchain_community.vectorstores import Chroma
 import os
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from llm_scheduler import GenerateScheduler
+from model_keeper import ModelKeeper
+from semantic_cache import SemanticAnswerCache
+from faq_store import FAQStore
+from model_cascade import CascadePolicy
+from reasoning import (
+    ANSWER, REASONING, RESULT, ReasonedText, ReasoningSplitter, failure_events, split_reasoning, split_stream
+)
+from keyword_index import exact_term_hits, load_or_build, reciprocal_rank_fusion
+from category_router import CategoryRouter, CentroidClassifier
+from model_profiles import (
+    DEFAULT_SYSTEM_PROMPT,
+    CollectionConfig,
+    ModelProfile,
+    UnknownModelError,
+    load_registry,
+)
+from context_budget import PackedContext, estimate_tokens, pack_context
+from session_store import Turn, create_session_store, format_history
+from history_compactor import HistoryCompactor
+from prompt_layout import ChatPrompt
+from startup import StartupTracker
+from embedding_factory import create_embeddings, probe_dimension, stored_embedding_dim, stored_embedding_model
 
 # ====================== 应用初始化 ======================
 app = Flask(__name__)
@@ -27,138 +53,446 @@ logger = logging.getLogger(__name__)
 
 # ====================== 全局配置 ======================
 class Config:
-    CHROMA_DB_DIR = "./nwu_knowledge_v2"  # 知识库存储目录
-    EMBEDDING_MODEL = "deepseek-r1:14b"  # 嵌入模型名称
-    LLM_MODEL = "deepseek-r1:14b"  # 大语言模型名称
-    TEMPERATURE = 0.1  # 生成温度系数
+    MODEL_PROFILES_PATH = os.environ.get("NWU_MODEL_PROFILES")  # 模型注册表 JSON（见 model_profiles.py），为空时使用默认注册表
     RETRIEVAL_THRESHOLD = 0.4  # 检索相似度阈值（调低以提高召回率）
     RETRIEVAL_K = 5  # 检索文档数量
-    EMBEDDING_DIM = 5120  # 嵌入维度（必须与知识库一致）
+    KEYWORD_K = 5  # 关键词（BM25）检索文档数量
+    RRF_K = 60  # 倒数排名融合的平滑常数
+    LEXICAL_SHORTCUT_MIN_COVERAGE = 0.4  # 精确词命中时，文本块至少覆盖问题中该比例的关键词才跳过向量检索
+    ROUTER_MIN_CONFIDENCE = 0.6  # 关键词路由的最低置信度（命中类别的得分占比），低于该值全库检索
+    ROUTER_USE_CLASSIFIER = True  # 关键词未命中时，用问题向量与各类别中心向量判断类别
+    ROUTER_MIN_MARGIN = 0.05  # 分类器最相近与次相近类别的最小相似度差
+    ANSWER_TOKEN_RESERVE = 1024  # 为回答预留的 token 数，其余为提示词预算
+    CONTEXT_MIN_CHUNK_TOKENS = 64  # 预算剩余不足该值时不再截断放入文本块
+    EMBEDDING_CACHE_DIR = "./embedding_cache"  # 嵌入向量缓存目录（与训练脚本共用）
+    OLLAMA_MAX_CONCURRENCY = int(os.environ.get("NWU_OLLAMA_MAX_CONCURRENCY", 2))  # 每个工作进程同时发往ollama的生成请求上限（普通与流式生成共用调度器的名额）
+    SCHEDULER_WINDOW_MS = 5  # 调度准入窗口（毫秒），窗口内相同问题合并为一次生成
+    SCHEDULER_MAX_QUEUE = 64  # 调度队列上限，超出直接拒绝
+    SEMANTIC_CACHE_THRESHOLD = 0.95  # 语义缓存命中的余弦相似度阈值
+    SEMANTIC_CACHE_TTL = 3600  # 语义缓存条目存活时间（秒）
+    SEMANTIC_CACHE_SIZE = 1024  # 语义缓存最大条目数
+    FAQ_ENABLED = True  # 问题命中预生成答案库（build_faq.py 生成）时直接返回
+    INCLUDE_REASONING = False  # 默认是否返回推理过程（请求可用 include_reasoning 字段覆盖）
+    REASONING_MAX_CHARS = 4000  # 返回的推理过程最大字符数，超出部分丢弃
+    CASCADE_ENABLED = os.environ.get("NWU_CASCADE_ENABLED", "0") == "1"  # 开启后未指定模型的知识库问答按注册表的 cascade 配置先用小模型，没有把握时升级到大模型
+    OLLAMA_KEEP_ALIVE = -1  # 模型在ollama中的保留时间，-1 表示常驻不卸载
+    MODEL_WARMUP_INTERVAL = 240  # 模型保活检查间隔（秒）
+    MODEL_KEEPER_LOCK = os.environ.get("NWU_MODEL_KEEPER_LOCK")  # 多进程部署时的保活文件锁，只有持锁进程定期保活
+    SESSION_BACKEND = os.environ.get("NWU_SESSION_BACKEND", "memory")  # 会话存储后端：memory 或 sqlite（重启保留、多进程共享）
+    SESSION_DB_PATH = os.environ.get("NWU_SESSION_DB_PATH", "./sessions.sqlite3")  # sqlite 会话存储文件
+    SESSION_MAX = 10000  # 最多保存的会话数，超出淘汰最久未访问的会话
+    SESSION_TTL = 1800  # 会话空闲过期时间（秒）
+    SESSION_TURNS = 5  # 每个会话保留的历史轮数
+    HISTORY_MODE = os.environ.get("NWU_HISTORY_MODE", "window")  # 历史放入提示词的方式：window（最近几轮原样）或 compact（滚动摘要 + 最后一轮）
+    HISTORY_KEEP_TURNS = 1  # compact 模式下原样保留的最近轮数
+    HISTORY_MAX_TOKENS = 800  # compact 模式下提示词中历史部分的 token 上限
+    HISTORY_SUMMARY_MAX_TOKENS = 300  # 滚动摘要的 token 上限
+    HISTORY_SUMMARY_MODEL = os.environ.get("NWU_HISTORY_SUMMARY_MODEL")  # 生成摘要的模型，未设置时用普通对话的默认模型
 
 
-# ====================== 提示词模板 ======================
-NWU_PROMPT_TEMPLATE = """【系统指令】你叫"西小北"，是西北大学官方AI助手，必须遵守以下规则：
-1. 身份声明："我是西小北，西北大学校园助手"
-2. 回答结构：
-   - 开头：明确声明身份
-   - 正文：基于上下文回答
-   - 结尾：标注数据来源（如适用）
+SERVICE_UNAVAILABLE = "当前服务不可用，请稍后再试"
 
-对话历史：{chat_history}
+# ====================== 模型注册表 ======================
+# 各模型的生成模型、提示词模板、上下文窗口及所用知识库，请求按 model 字段选择
+registry = load_registry(Config.MODEL_PROFILES_PATH)
 
-相关上下文：{context}
 
-用户问题：{question}
-
-请按要求回答："""
+# ====================== 自定义LLM ======================
+PromptInput = Union[str, ChatPrompt]
 
 
-# ====================== 自定义LLM ======================
 class NWU_LLM(LLM):
-    """西北大学定制LLM"""
+    """西北大学定制LLM，每个模型配置一个实例，共用同一个调度器与ollama客户端
+
+    推理模型输出的 <think> 推理过程在这一层与回答拆开：invoke / stream 只返回回答，
+    reasoned / stream_reasoned 同时返回推理过程（见 reasoning.py）。
+    通过 ollama chat 接口生成，提示词为 ChatPrompt（静态前缀 → 会话历史 → 本次请求，见 prompt_layout.py）
+    或字符串。
+    """
+
+    ollama_model: str
+    temperature: float = 0.1
+    num_ctx: int = 5120
+    system_prompt: str = DEFAULT_SYSTEM_PROMPT
 
     @property
     def _llm_type(self) -> str:
-        return "nwu-deepseek"
+        return "nwu-ollama"
 
     def _call(self, prompt: str, **kwargs) -> str:
+        return self.reasoned(prompt).answer
+
+    def reasoned(self, prompt: PromptInput) -> ReasonedText:
+        """生成并拆分推理过程与回答"""
         try:
-            response = ollama.generate(
-                model=Config.LLM_MODEL,
-                prompt=self._format_prompt(prompt),
-                options={
-                    "temperature": Config.TEMPERATURE,
-                    "system": self._system_prompt(),
-                    "num_ctx": 5120  # 增加上下文窗口
-                }
-            )
-            return response["response"]
+            response = scheduler.submit(**self._request(prompt))
+            metrics.record_generation(response)
+            return self._split(response["message"]["content"])
+        except Exception as e:
+            logger.error(f"模型调用失败: {str(e)}")
+            return ReasonedText(SERVICE_UNAVAILABLE, failed=True)
+
+    def _stream(self, prompt: str, stop: Optional[List[str]] = None,
+                run_manager=None, **kwargs) -> Iterator[GenerationChunk]:
+        """流式生成：只转发回答部分"""
+        for channel, text in self.stream_reasoned(prompt):
+            if channel != ANSWER:
+                continue
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    def stream_reasoned(self, prompt: PromptInput) -> Iterator:
+        """流式生成：ollama每产出一段token即拆分后转发，逐段返回 (通道, 文本)，
+        通道为 reasoning 或 answer，最后一项为 (result, ReasonedText)，中途失败时结果标记为 failed"""
+        for channel, value in split_stream(self._stream_chunks(prompt), Config.REASONING_MAX_CHARS,
+                                           SERVICE_UNAVAILABLE):
+            if channel == RESULT and not value.failed:
+                self._record_reasoning(value)
+            yield channel, value
+
+    def _stream_chunks(self, prompt: PromptInput) -> Iterator[str]:
+        """经调度器排队并占用一个并发名额，逐段返回ollama产出的文本"""
+        for part in scheduler.stream(**self._request(prompt)):
+            if part.get("done"):
+                metrics.record_generation(part)
+            yield part["message"]["content"]
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager=None, **kwargs) -> str:
+        return (await self.areasoned(prompt)).answer
+
+    async def areasoned(self, prompt: PromptInput) -> ReasonedText:
+        """异步生成：等待期间只占用协程，并受并发上限约束"""
+        try:
+            async with _ollama_slots:
+                response = await _async_client.chat(**self._request(prompt))
+            metrics.record_generation(response)
+            return self._split(response["message"]["content"])
         except Exception as e:
             logger.error(f"模型调用失败: {str(e)}")
-            return "当前服务不可用，请稍后再试"
+            return ReasonedText(SERVICE_UNAVAILABLE, failed=True)
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs):
+        """异步流式生成：只转发回答部分"""
+        async for channel, text in self.astream_reasoned(prompt):
+            if channel != ANSWER:
+                continue
+            chunk = GenerationChunk(text=text)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def astream_reasoned(self, prompt: PromptInput):
+        """异步流式生成，逐段返回 (通道, 文本)，最后一项为 (result, ReasonedText)"""
+        splitter = ReasoningSplitter(Config.REASONING_MAX_CHARS)
+        try:
+            async with _ollama_slots:
+                async for part in await _async_client.chat(stream=True, **self._request(prompt)):
+                    if part.get("done"):
+                        metrics.record_generation(part)
+                    for event in splitter.feed(part["message"]["content"]):
+                        yield event
+            for event in splitter.finish():
+                yield event
+            result = splitter.result()
+            self._record_reasoning(result)
+            yield RESULT, result
+        except Exception as e:
+            logger.error(f"模型流式调用失败: {str(e)}")
+            for event in failure_events(SERVICE_UNAVAILABLE):
+                yield event
+
+    def _split(self, text: str) -> ReasonedText:
+        result = split_reasoning(text, Config.REASONING_MAX_CHARS)
+        self._record_reasoning(result)
+        return result
+
+    @staticmethod
+    def _record_reasoning(result: ReasonedText):
+        if result.reasoning:
+            metrics.record_reasoning(estimate_tokens(result.reasoning), result.truncated)
+
+    def _request(self, prompt: PromptInput) -> Dict[str, Any]:
+        """ollama chat 请求参数，字符串提示词作为 user 消息，前面加系统提示词"""
+        if isinstance(prompt, str):
+            prompt = ChatPrompt(self.system_prompt, prompt)
+        return {
+            "model": self.ollama_model,
+            "messages": prompt.messages(),
+            "options": {"temperature": self.temperature, "num_ctx": self.num_ctx},
+            "keep_alive": Config.OLLAMA_KEEP_ALIVE
+        }
+
+
+
+# 生成调度器：合并相同请求、短问题优先、限制并发（普通与流式生成都经过这里）
+scheduler = GenerateScheduler(
+    ollama.chat,
+    window_ms=Config.SCHEDULER_WINDOW_MS,
+    max_queue=Config.SCHEDULER_MAX_QUEUE,
+    workers=Config.OLLAMA_MAX_CONCURRENCY
+)
+
+# 模型保活：固定各生成模型与嵌入模型在ollama中常驻，被卸载时自动重新加载
+model_keeper = ModelKeeper(
+    generate_models=registry.generate_models(),
+    embedding_models=registry.embedding_models(),
+    keep_alive=Config.OLLAMA_KEEP_ALIVE,
+    interval=Config.MODEL_WARMUP_INTERVAL,
+    lock_path=Config.MODEL_KEEPER_LOCK
+)
+
+# 异步客户端与并发闸门（仅异步服务模式使用）
+_async_client = ollama.AsyncClient()
+_ollama_slots = asyncio.Semaphore(Config.OLLAMA_MAX_CONCURRENCY)
+
 
-    def _format_prompt(self, prompt: str) -> str:
-        return f"[INST] {self._system_prompt()} [/INST]\n用户问题：{prompt}"
+# ====================== 知识库与模型运行时 ======================
+class KnowledgeBase:
+    """一个知识库（向量库目录）及其检索组件，多个模型共用时只加载一次"""
 
-    def _system_prompt(self) -> str:
-        return "【系统指令】你必须永远以'西小北'身份回答，角色设定：西北大学官方AI助手"
+    def __init__(self, config: CollectionConfig):
+        self.config = config
+        self.name = config.name
+        self.db_dir = config.db_dir
+        self.embeddings = None
+        self.vectorstore = None  # 绑定嵌入模型并通过维度校验后才设置，之前知识库问答不可用
+        self.keyword_index = None
+        self.router = CategoryRouter(min_confidence=Config.ROUTER_MIN_CONFIDENCE, min_margin=Config.ROUTER_MIN_MARGIN)
+        self.faq_store = FAQStore(config.db_dir)
+        self.search_kwargs = {"k": Config.RETRIEVAL_K, "score_threshold": Config.RETRIEVAL_THRESHOLD}
 
+    def step(self, name: str) -> str:
+        """启动步骤名（/readyz 中按知识库区分）"""
+        return f"{self.name}:{name}"
+
+
+class ModelRuntime:
+    """一个模型配置的运行时：生成模型、提示词模板、所用知识库与语义缓存"""
+
+    def __init__(self, profile: ModelProfile, kb: KnowledgeBase):
+        self.profile = profile
+        self.name = profile.name
+        self.kb = kb
+        self.llm = NWU_LLM(
+            ollama_model=profile.llm_model,
+            temperature=profile.temperature,
+            num_ctx=profile.num_ctx,
+            system_prompt=profile.system_prompt
+        )
+        self.prompt = PromptTemplate.from_template(profile.prompt_template)
+        self.knowledge_system = profile.knowledge_system_prompt()
+        # 语义缓存按模型区分，同一问题不同模型的回答不混用
+        self.answer_cache = SemanticAnswerCache(
+            kb.db_dir,
+            threshold=Config.SEMANTIC_CACHE_THRESHOLD,
+            ttl=Config.SEMANTIC_CACHE_TTL,
+            max_entries=Config.SEMANTIC_CACHE_SIZE
+        )
+
+    def knowledge_prompt(self, context: str, question: str, history: Tuple[str, List[Turn]]) -> ChatPrompt:
+        """知识库问答：system 为系统提示词 + 回答规则，user 为按模板填充的上下文与问题"""
+        summary, turns = history
+        return ChatPrompt(self.knowledge_system, self.prompt.format(context=context, question=question), summary, turns)
+
+    def conversation_prompt(self, question: str, history: Tuple[str, List[Turn]]) -> ChatPrompt:
+        """普通对话：system 为系统提示词，user 为问题本身"""
+        summary, turns = history
+        return ChatPrompt(self.profile.system_prompt, question, summary, turns)
 
 
 # ====================== 服务初始化 ======================
+KNOWLEDGE_BASE_STEPS = ("embeddings", "vectorstore", "keyword_index", "router", "knowledge_base")
+STARTUP_STEPS = [f"llm:{model}" for model in registry.generate_models()] + \
+    [f"{name}:{step}" for name in registry.collections for step in KNOWLEDGE_BASE_STEPS]
+startup = StartupTracker(STARTUP_STEPS)
+
+
 def initialize_services():
-    """初始化核心服务组件"""
-
-    # 验证嵌入维度
-    embeddings = OllamaEmbeddings(model=Config.EMBEDDING_MODEL)
-    test_embed = embeddings.embed_query("维度测试")
-    assert len(test_embed) == Config.EMBEDDING_DIM, \
-        f"嵌入维度不匹配！当前：{len(test_embed)}，要求：{Config.EMBEDDING_DIM}，请重建知识库"
-
-    # 初始化LLM
-    llm = NWU_LLM()
-
-    # 初始化对话系统
-    conversation_chains = defaultdict(
-        lambda: ConversationChain(
-            llm=llm,
-            memory=ConversationBufferWindowMemory(k=5),
-            verbose=True
-        )
-    )
+    """后台并行预热各生成模型、嵌入模型并打开各知识库，知识库就绪后启用对应模型的知识库问答
 
-    # 加载知识库
-    knowledge_qa = load_knowledge_base(llm, embeddings)
+    服务在此之前已可处理普通对话；任一步骤失败只影响用到该知识库或生成模型的请求，状态见 /readyz。
+    """
+    models = registry.generate_models()
+    workers = len(models) + 4 * len(knowledge_bases)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nwu-startup") as pool:
+        llm_futures = {model: pool.submit(startup.run, f"llm:{model}", model_keeper.warm, model) for model in models}
+        kb_futures = [(kb, start_knowledge_base(pool, kb)) for kb in knowledge_bases.values()]
 
-    return llm, embeddings, conversation_chains, knowledge_qa
+        for kb, futures in kb_futures:
+            finish_knowledge_base(kb, *futures)
 
+        for model, future in llm_futures.items():
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"生成模型 {model} 预热失败: {str(e)}")
 
-def load_knowledge_base(llm, embeddings):
-    """加载向量知识库"""
-    try:
-        # 连接向量数据库
-        vectorstore = Chroma(
-            persist_directory=Config.CHROMA_DB_DIR,
-            embedding_function=embeddings
-        )
+    # 之后由后台线程定期保活
+    model_keeper.start()
 
-        # 配置检索器
-        retriever = vectorstore.as_retriever(
-            search_type="similarity_score_threshold",
-            search_kwargs={
-                "k": Config.RETRIEVAL_K,
-                "score_threshold": Config.RETRIEVAL_THRESHOLD,
-                "filter": {"source": "nwu"}
-            }
-        )
 
-        # 创建问答链（关键修复：添加memory配置）
-        return RetrievalQA.from_chain_type(
-            llm=llm,
-            chain_type="stuff",
-            retriever=retriever,
-            memory=ConversationBufferWindowMemory(
-                memory_key="chat_history",
-                input_key="query",
-                k=5  # 保留5轮历史对话
-            ),
-            chain_type_kwargs={
-                "prompt": PromptTemplate(
-                    template=NWU_PROMPT_TEMPLATE,
-                    input_variables=["context", "question", "chat_history"]
-                ),
-                "verbose": True
-            },
-            return_source_documents=True
-        )
+def start_knowledge_base(pool, kb: KnowledgeBase):
+    """提交一个知识库的各启动步骤，返回 (嵌入模型, 向量库, 关键词索引, 类别分类器) 的 future"""
+    embeddings_future = pool.submit(startup.run, kb.step("embeddings"), load_embeddings, kb.config)
+    vectorstore_future = pool.submit(startup.run, kb.step("vectorstore"), open_vectorstore, kb.config)
+    keyword_future = pool.submit(startup.run, kb.step("keyword_index"), load_keyword_index,
+                                 kb.config, vectorstore_future)
+    router_future = pool.submit(startup.run, kb.step("router"), load_router_classifier, vectorstore_future)
+    return embeddings_future, vectorstore_future, keyword_future, router_future
+
 
+def finish_knowledge_base(kb: KnowledgeBase, embeddings_future, vectorstore_future, keyword_future, router_future):
+    """等待知识库的各启动步骤完成，绑定嵌入模型并校验后启用"""
+    try:
+        embeddings, dim = embeddings_future.result()
+        # 嵌入模型就绪后即可启用语义缓存
+        kb.embeddings = embeddings
+        vectorstore = vectorstore_future.result()
+        kb.vectorstore = startup.run(kb.step("knowledge_base"), load_knowledge_base,
+                                     kb.config, vectorstore, embeddings, dim)
+        logger.info(f"知识库 {kb.name} 加载完成")
+    except Exception as e:
+        logger.error(f"知识库 {kb.name} 加载失败: {str(e)}")
+        if not startup.is_ready(kb.step("vectorstore")) or not startup.is_ready(kb.step("embeddings")):
+            startup.fail(kb.step("knowledge_base"), "依赖的启动步骤失败")
+
+    try:
+        kb.keyword_index = keyword_future.result()
     except Exception as e:
-        logger.error(f"知识库加载失败: {str(e)}")
-        raise
+        logger.error(f"知识库 {kb.name} 关键词索引加载失败，仅使用向量检索: {str(e)}")
+
+    try:
+        kb.router.classifier = router_future.result()
+    except Exception as e:
+        logger.error(f"知识库 {kb.name} 类别分类器加载失败，仅使用关键词路由: {str(e)}")
+
+
+def load_embeddings(config: CollectionConfig):
+    """创建嵌入模型（独立于生成模型配置），计算一次嵌入完成预热并得到维度"""
+    if config.embedding_backend == "ollama" and config.embedding_model not in registry.generate_models():
+        model_keeper.warm(config.embedding_model)
+    embeddings = create_embeddings(
+        config.embedding_model,
+        backend=config.embedding_backend,
+        cache_dir=Config.EMBEDDING_CACHE_DIR,
+        persist_queries=False  # 用户问题各不相同，只在进程内缓存，避免缓存文件无限增长
+    )
+    return embeddings, probe_dimension(embeddings)
+
+
+def open_vectorstore(config: CollectionConfig):
+    """连接向量数据库（此时嵌入模型可能尚未就绪，检索时再绑定）"""
+    return Chroma(persist_directory=config.db_dir)
+
+
+def load_keyword_index(config: CollectionConfig, vectorstore_future):
+    """加载与向量库同目录的关键词索引，缺失或过期时由向量库重建"""
+    vectorstore = vectorstore_future.result()
+    return load_or_build(vectorstore._collection, config.db_dir)
+
+
+def load_router_classifier(vectorstore_future):
+    """由知识库中各类别文本块的向量计算类中心（未启用分类器时返回 None）"""
+    vectorstore = vectorstore_future.result()
+    if not Config.ROUTER_USE_CLASSIFIER:
+        return None
+    return CentroidClassifier.from_collection(vectorstore._collection)
+
+
+def load_knowledge_base(config: CollectionConfig, vectorstore, embeddings, dim: int):
+    """绑定嵌入模型并校验，返回可检索的向量库"""
+    # 复用已打开的连接
+    vectorstore = Chroma(
+        client=vectorstore._client,
+        collection_name=vectorstore._collection.name,
+        embedding_function=embeddings
+    )
+
+    # 验证嵌入维度（以知识库记录的模型与维度为准）
+    check_embedding_dim(config, vectorstore, dim)
+    return vectorstore
+
+
+def check_embedding_dim(config: CollectionConfig, vectorstore, current_dim: int):
+    """校验当前嵌入模型与知识库是否一致"""
+    stored_model = stored_embedding_model(vectorstore)
+    if stored_model and stored_model != config.embedding_model:
+        logger.warning(f"知识库 {config.name} 由 {stored_model} 构建，当前嵌入模型为 {config.embedding_model}")
+
+    stored_dim = stored_embedding_dim(vectorstore)
+    if stored_dim is None:
+        logger.warning(f"知识库 {config.name} 为空，跳过嵌入维度校验")
+        return
+
+    assert current_dim == stored_dim, \
+        f"嵌入维度不匹配！当前：{current_dim}，知识库：{stored_dim}，请重建知识库或运行 migrate_collection.py"
 
 
 # ====================== 全局服务实例 ======================
-llm, embeddings, conversation_chains, knowledge_qa = initialize_services()
+# 启动时只创建轻量对象，模型预热与知识库加载在后台线程进行
+knowledge_bases = {name: KnowledgeBase(config) for name, config in registry.collections.items()}
+runtimes = {
+    name: ModelRuntime(profile, knowledge_bases[profile.collection.name])
+    for name, profile in registry.profiles.items()
+}
+threading.Thread(target=initialize_services, name="nwu-startup", daemon=True).start()
+
+# 模型级联（NWU_CASCADE_ENABLED=1 时开启）：未指定模型的知识库问答先用小模型，检索没有把握或回答未通过检查时改用默认的大模型
+cascade_policy = CascadePolicy(
+    registry.cascade["small"],
+    registry.default_knowledge,
+    **{key: value for key, value in registry.cascade.items() if key != "small"}
+) if Config.CASCADE_ENABLED and registry.cascade else None
+
+sessions = create_session_store(
+    Config.SESSION_BACKEND,
+    path=Config.SESSION_DB_PATH,
+    max_sessions=Config.SESSION_MAX,
+    ttl=Config.SESSION_TTL,
+    max_turns=Config.SESSION_TURNS
+)
+
+
+def summarize_history(prompt: str) -> str:
+    """用摘要模型生成会话摘要（后台线程调用），模型未就绪或生成失败时抛出异常"""
+    runtime = resolve_runtime(Config.HISTORY_SUMMARY_MODEL, use_knowledge=False)
+    if not startup.is_ready(f"llm:{runtime.profile.llm_model}"):
+        raise RuntimeError(f"摘要模型 {runtime.profile.llm_model} 尚未就绪")
+    result = runtime.llm.reasoned(prompt)
+    if result.failed:
+        raise RuntimeError("摘要模型调用失败")
+    return result.answer
+
+
+# 历史压缩：较早的轮次在回答返回后由后台线程折叠进滚动摘要，提示词中的历史长度保持恒定
+if Config.HISTORY_MODE not in ("window", "compact"):
+    raise ValueError(f"不支持的历史模式: {Config.HISTORY_MODE}，可选: window, compact")
+compactor = HistoryCompactor(
+    sessions,
+    summarize_history,
+    keep_turns=Config.HISTORY_KEEP_TURNS,
+    max_tokens=Config.HISTORY_MAX_TOKENS,
+    summary_max_tokens=Config.HISTORY_SUMMARY_MAX_TOKENS
+) if Config.HISTORY_MODE == "compact" else None
+
+
+def resolve_runtime(name: Optional[str], use_knowledge: bool) -> ModelRuntime:
+    """按请求的 model 字段（模型名或别名）选择模型，未指定时按模式取默认模型"""
+    return runtimes[registry.resolve(name, use_knowledge).name]
+
+
+def use_cascade(data: Dict) -> bool:
+    """未指定模型的请求在启用级联时先用小模型"""
+    return cascade_policy is not None and not data.get('model')
+
+
+def model_ready(runtime: ModelRuntime) -> bool:
+    """生成模型已预热且知识库已加载"""
+    return startup.is_ready(f"llm:{runtime.profile.llm_model}") and runtime.kb.vectorstore is not None
 
 
 # ====================== API接口 ======================
@@ -173,81 +507,718 @@ def handle_query():
     # 输入验证
     if not question:
         return error_response(400, "问题不能为空", session_id)
+    try:
+        runtime = resolve_runtime(data.get('model'), use_knowledge)
+    except UnknownModelError as e:
+        return error_response(400, str(e), session_id)
 
+    timings = metrics.start_request(request_mode(use_knowledge), debug=bool(data.get('debug')),
+                                    include_reasoning=wants_reasoning(data))
+    metrics.record_model(runtime.name)
     try:
         # 选择处理模式
         if use_knowledge:
-            return process_knowledge_query(question, session_id)
-        return process_conversation(question, session_id)
+            return process_knowledge_query(runtime, question, session_id, cascade=use_cascade(data))
+        return process_conversation(runtime, question, session_id)
 
     except Exception as e:
         logger.error(f"请求处理异常: {str(e)}")
         return error_response(500, "服务器内部错误", session_id)
+    finally:
+        metrics.finish_request(timings)
 
 
-def process_knowledge_query(question: str, session_id: str) -> Dict:
-    """处理知识库查询（包含降级逻辑）"""
-    if not knowledge_qa:
-        return error_response(503, "知识库未就绪", session_id)
+def process_knowledge_query(runtime: ModelRuntime, question: str, session_id: str, cascade: bool = False) -> Dict:
+    """处理知识库查询（包含降级逻辑），cascade 为 True 时先尝试级联的小模型"""
+    found = lookup_knowledge(runtime, question)
+    if found.hit:
+        return jsonify(answer_hit(found, question, session_id))
+    if found.loading:
+        return error_response(503, "知识库加载中，请稍后再试", session_id)
+
+    # 处理空结果
+    if not found.scored_docs:
+        record_no_documents(found, question)
+        return process_conversation(runtime, question, session_id)
 
     try:
-        # 关键修复：显式传递对话历史
-        result = knowledge_qa({
-            "query": question,
-            "chat_history": conversation_chains[session_id].memory.buffer_as_str
-        })
-
-        # 处理空结果
-        if not result.get("source_documents"):
-            logger.warning(f"知识库未找到'{question}'的匹配内容")
-            return process_conversation(question, session_id)
-
-        # 提取来源信息
-        sources = list({os.path.basename(doc.metadata["source"])
-                        for doc in result["source_documents"]})
-
-        return success_response(
-            answer=result["result"],
-            session_id=session_id,
-            sources=sources,
-            is_knowledge_based=True
+        result, docs = generate_knowledge_answer(
+            runtime, question, found.scored_docs, found.confidence, session_id, cascade
         )
+        return jsonify(knowledge_reply(runtime, found, question, session_id, result, docs))
 
     except Exception as e:
         logger.error(f"知识库查询失败: {str(e)}")
-        return process_conversation(question, session_id)  # 降级到普通对话
+        metrics.record_fallback("error")
+        return process_conversation(runtime, question, session_id)  # 降级到普通对话
 
 
-def process_conversation(question: str, session_id: str) -> Dict:
+def process_conversation(runtime: ModelRuntime, question: str, session_id: str) -> Dict:
     """处理普通对话"""
     try:
-        answer = conversation_chains[session_id].predict(input=question)
-        return success_response(
-            answer=answer,
-            session_id=session_id,
-            is_knowledge_based=False
-        )
+        with metrics.span("prompt"):
+            prompt = build_conversation_prompt(runtime, question, session_id)
+        with metrics.span("generate"):
+            result = runtime.llm.reasoned(prompt)
+        return jsonify(conversation_reply(question, session_id, result))
     except Exception as e:
         logger.error(f"对话处理失败: {str(e)}")
         return error_response(500, "对话服务暂时不可用", session_id)
 
 
-# ====================== 响应工具 ======================
-def success_response(answer: str, session_id: str, **extras) -> Dict:
+# ====================== 流式接口 ======================
+@app.route('/chat/generate/stream', methods=['POST'])
+def handle_stream_query():
+    """流式处理用户查询（Server-Sent Events）
+
+    事件顺序：sources（仅知识库模式）→ reasoning*（仅请求推理过程时）→ token* → done；出错时发送 error。
+    done 事件的数据与 /chat/generate 的成功响应结构一致。
+    """
+    data = request.json
+    question = data.get('prompt', '').strip()
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    use_knowledge = data.get('use_knowledge', False)
+
+    if not question:
+        return error_response(400, "问题不能为空", session_id)
+    try:
+        runtime = resolve_runtime(data.get('model'), use_knowledge)
+    except UnknownModelError as e:
+        return error_response(400, str(e), session_id)
+
+    if use_knowledge:
+        events = stream_knowledge_query(runtime, question, session_id, cascade=use_cascade(data))
+    else:
+        events = stream_conversation(runtime, question, session_id)
+    events = timed_events(events, request_mode(use_knowledge), runtime.name, debug=bool(data.get('debug')),
+                          include_reasoning=wants_reasoning(data))
+
+    return Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"  # 关闭nginx等反向代理的缓冲
+        }
+    )
+
+
+def stream_knowledge_query(runtime: ModelRuntime, question: str, session_id: str,
+                           cascade: bool = False) -> Iterator[str]:
+    """流式知识库查询：先检索并推送来源，再逐token推送回答"""
+    found = lookup_knowledge(runtime, question)
+    if found.hit:
+        yield from hit_events(answer_hit(found, question, session_id))
+        return
+    if found.loading:
+        yield sse_event("error", error_payload(503, "知识库加载中，请稍后再试", session_id))
+        return
+
+    # 无检索结果时降级到普通对话
+    if not found.scored_docs:
+        record_no_documents(found, question)
+        yield from stream_conversation(runtime, question, session_id)
+        return
+
+    try:
+        result, docs = yield from stream_knowledge_answer(
+            runtime, question, found.scored_docs, found.confidence, session_id, cascade
+        )
+        yield sse_event("done", knowledge_reply(runtime, found, question, session_id, result, docs))
+    except Exception as e:
+        logger.error(f"知识库流式查询失败: {str(e)}")
+        yield sse_event("error", error_payload(500, "服务器内部错误", session_id))
+
+
+def stream_conversation(runtime: ModelRuntime, question: str, session_id: str) -> Iterator[str]:
+    """流式普通对话"""
+    try:
+        with metrics.span("prompt"):
+            prompt = build_conversation_prompt(runtime, question, session_id)
+        result = yield from stream_answer(runtime, prompt)
+        yield sse_event("done", conversation_reply(question, session_id, result))
+    except Exception as e:
+        logger.error(f"对话流式处理失败: {str(e)}")
+        yield sse_event("error", error_payload(500, "对话服务暂时不可用", session_id))
+
+
+def stream_answer(runtime: ModelRuntime, prompt: str):
+    """逐块推送模型输出（回答为 token 事件，请求推理过程时推理过程为 reasoning 事件），结束后返回 ReasonedText"""
+    collector = AnswerStream()
+    with metrics.span("generate"):
+        for channel, value in runtime.llm.stream_reasoned(prompt):
+            event = collector.event(channel, value)
+            if event:
+                yield event
+    return collector.result()
+
+
+# ====================== 问答流程（app1 与 app_async 共用） ======================
+# 除模型生成外的各步都在这里实现一次；其中检索、向量计算、会话读写等是阻塞调用，
+# app_async 通过 asyncio.to_thread 在线程池中执行，只有等待模型生成时在事件循环上 await。
+class KnowledgeLookup:
+    """知识库问答在生成之前的准备结果"""
+
+    def __init__(self):
+        self.loading = False  # 知识库加载中
+        self.hit = None  # 预生成答案或语义缓存命中的 {"answer", "sources"}
+        self.hit_flag = None  # 命中来源，写入响应："faq" 或 "cached"
+        self.query_embedding = None
+        self.scored_docs = []
+        self.confidence = 0.0
+        self.fallback_reason = "no_documents"  # 没有检索结果时降级到普通对话的原因
+
+
+def lookup_knowledge(runtime: ModelRuntime, question: str) -> KnowledgeLookup:
+    """生成之前的各步：预生成答案 → 关键词检索 → 问题向量与语义缓存 → 向量检索"""
+    kb = runtime.kb
+    found = KnowledgeLookup()
+    # 高频问题直接使用预生成答案（知识库加载期间也可用）
+    faq = lookup_faq(kb, question)
+    if faq:
+        found.hit, found.hit_flag = faq, "faq"
+        return found
+
+    if kb.vectorstore is None:
+        found.loading = True
+        return found
+
+    # 精确词（课程代码、电话号码等）命中关键词索引时，跳过嵌入和向量检索
+    category = route_question(kb, question)
+    with metrics.span("lexical"):
+        lexical_docs = lexical_search(kb, question, category)
+    exact_hits = lexical_shortcut(question, lexical_docs)
+
+    # 语义缓存命中时跳过检索与生成
+    if not exact_hits:
+        with metrics.span("embed"):
+            found.query_embedding, cached = lookup_cached_answer(runtime, question)
+        if cached:
+            found.hit, found.hit_flag = cached, "cached"
+            return found
+
+    try:
+        with metrics.span("retrieve"):
+            found.scored_docs, found.confidence = (exact_hits, 1.0) if exact_hits else retrieve_scored(
+                kb, question, lexical_docs, category or classify_question(kb, found.query_embedding)
+            )
+    except Exception as e:
+        logger.error(f"知识库检索失败: {str(e)}")
+        found.fallback_reason = "error"
+        found.scored_docs = []
+    return found
+
+
+def record_no_documents(found: KnowledgeLookup, question: str):
+    logger.warning(f"知识库未找到'{question}'的匹配内容")
+    metrics.record_fallback(found.fallback_reason)
+
+
+def answer_hit(found: KnowledgeLookup, question: str, session_id: str) -> Dict:
+    """预生成答案或语义缓存命中：保存本轮问答，返回响应内容"""
+    record_turn(session_id, question, found.hit["answer"])
+    return success_payload(
+        answer=found.hit["answer"],
+        session_id=session_id,
+        sources=found.hit["sources"],
+        is_knowledge_based=True,
+        **{found.hit_flag: True}
+    )
+
+
+def hit_events(payload: Dict) -> List[str]:
+    """命中时的流式事件：sources → token → done"""
+    return [
+        sse_event("sources", {"sources": payload["sources"], "session_id": payload["session_id"]}),
+        sse_event("token", {"content": payload["data"]}),
+        sse_event("done", payload)
+    ]
+
+
+def knowledge_reply(runtime: ModelRuntime, found: KnowledgeLookup, question: str, session_id: str,
+                    result: ReasonedText, docs) -> Dict:
+    """保存模型生成的知识库回答并写入语义缓存，返回响应内容"""
+    record_reply(session_id, question, result)
+    sources = extract_sources(docs)
+    remember_answer(runtime, found.query_embedding, result, sources)
+    return success_payload(
+        answer=result.answer,
+        session_id=session_id,
+        reasoning=result,
+        sources=sources,
+        is_knowledge_based=True
+    )
+
+
+def conversation_reply(question: str, session_id: str, result: ReasonedText) -> Dict:
+    """保存普通对话的回答，返回响应内容"""
+    record_reply(session_id, question, result)
+    return success_payload(
+        answer=result.answer,
+        session_id=session_id,
+        reasoning=result,
+        is_knowledge_based=False
+    )
+
+
+class AnswerStream:
+    """把模型的流式输出转成 SSE 事件并收集各段：回答为 token 事件，请求推理过程时推理过程为 reasoning 事件"""
+
+    def __init__(self):
+        self.parts = {ANSWER: [], REASONING: []}
+        self.include_reasoning = reasoning_requested()
+        self.sent = False
+
+    def event(self, channel: str, value) -> Optional[str]:
+        """一段输出对应的事件，不需要推送时返回 None"""
+        if channel == RESULT:
+            self.parts[RESULT] = value
+            return None
+        self.parts[channel].append(value)
+        if channel == REASONING and not self.include_reasoning:
+            return None
+        if not self.sent:
+            metrics.mark_first_token()
+            self.sent = True
+        return sse_event("token" if channel == ANSWER else "reasoning", {"content": value})
+
+    def result(self) -> ReasonedText:
+        return streamed_reasoning(self.parts)
+
+
+# ====================== 模型级联 ======================
+def generate_knowledge_answer(runtime: ModelRuntime, question: str, scored_docs, confidence: float,
+                              session_id: str, cascade: bool = False):
+    """生成知识库回答，返回 (ReasonedText, 放入提示词的文本块)
+
+    cascade 为 True 时先用级联的小模型，检索没有把握或回答未通过检查时再用 runtime 的模型。
+    会话历史只读取一次，提示词的装箱指标只记录最终回答所用的那一级。
+    """
+    with metrics.span("prompt"):
+        history = session_history(session_id)
+    reason, wasted = None, 0.0
+    if cascade:
+        reason = cascade_policy.precheck(confidence, scored_docs)
+        if reason is None:
+            small = runtimes[cascade_policy.small_model]
+            result, built, seconds = invoke_knowledge(small, question, scored_docs, history)
+            reason = accept_small_answer(small, result, built, seconds)
+            if reason is None:
+                return result, built.docs
+            wasted = seconds
+
+    result, built, seconds = invoke_knowledge(runtime, question, scored_docs, history)
+    built.record()
+    if cascade:
+        record_cascade(runtime, "large", seconds, reason, wasted)
+    return result, built.docs
+
+
+def stream_knowledge_answer(runtime: ModelRuntime, question: str, scored_docs, confidence: float,
+                            session_id: str, cascade: bool = False):
+    """流式生成知识库回答：推送 sources 与 token 事件，返回 (ReasonedText, 放入提示词的文本块)
+
+    小模型的回答要先通过检查，因此生成完后一次推送；大模型逐token推送。
+    """
+    with metrics.span("prompt"):
+        history = session_history(session_id)
+    reason, wasted = None, 0.0
+    if cascade:
+        reason = cascade_policy.precheck(confidence, scored_docs)
+        if reason is None:
+            small = runtimes[cascade_policy.small_model]
+            result, built, seconds = invoke_knowledge(small, question, scored_docs, history)
+            reason = accept_small_answer(small, result, built, seconds)
+            if reason is None:
+                yield from small_answer_events(result, built, session_id)
+                return result, built.docs
+            wasted = seconds
+
+    with metrics.span("prompt"):
+        built = build_knowledge_prompt(runtime, question, scored_docs, history)
+    built.record()
+    yield sources_event(built, session_id)
+    started = time.perf_counter()
+    result = yield from stream_answer(runtime, built.prompt)
+    if cascade:
+        record_cascade(runtime, "large", time.perf_counter() - started, reason, wasted)
+    return result, built.docs
+
+
+def invoke_knowledge(runtime: ModelRuntime, question: str, scored_docs, history: Tuple[str, List[Turn]]):
+    """用指定模型组装提示词并生成，返回 (ReasonedText, KnowledgePrompt, 生成耗时)"""
+    with metrics.span("prompt"):
+        built = build_knowledge_prompt(runtime, question, scored_docs, history)
+    started = time.perf_counter()
+    with metrics.span("generate"):
+        result = runtime.llm.reasoned(built.prompt)
+    return result, built, time.perf_counter() - started
+
+
+def accept_small_answer(small: ModelRuntime, result: ReasonedText, built, seconds: float) -> Optional[str]:
+    """检查小模型的回答：通过时记录提示词与级联指标并返回 None，否则返回升级原因"""
+    reason = cascade_policy.check_answer(result.answer, extract_sources(built.docs), SERVICE_UNAVAILABLE)
+    if reason is None:
+        built.record()
+        record_cascade(small, "small", seconds)
+    return reason
+
+
+def small_answer_events(result: ReasonedText, built, session_id: str) -> List[str]:
+    """通过检查的小模型回答一次推送：sources → reasoning（请求推理过程时）→ token"""
+    events = [sources_event(built, session_id)]
+    metrics.mark_first_token()
+    if result.reasoning and reasoning_requested():
+        events.append(sse_event("reasoning", {"content": result.reasoning}))
+    events.append(sse_event("token", {"content": result.answer}))
+    return events
+
+
+def sources_event(built, session_id: str) -> str:
+    return sse_event("sources", {"sources": extract_sources(built.docs), "session_id": session_id})
+
+
+def record_cascade(runtime: ModelRuntime, tier: str, seconds: float, reason: Optional[str] = None,
+                   wasted: float = 0.0):
+    """记录级联结果：实际回答的一级与模型、生成耗时、升级原因及升级前小模型花掉的时间"""
+    cascade_policy.record(tier, seconds, reason, wasted)
+    metrics.record_cascade(tier, runtime.name, reason)
+
+
+def timed_events(events: Iterator[str], mode: str, model: str, debug: bool = False,
+                 include_reasoning: bool = False) -> Iterator[str]:
+    """在事件流生成期间统计请求耗时（流式响应在视图函数返回后才开始执行）"""
+    timings = metrics.start_request(mode, debug, include_reasoning)
+    metrics.record_model(model)
+    try:
+        yield from events
+    finally:
+        metrics.finish_request(timings)
+
+
+def route_question(kb: KnowledgeBase, question: str):
+    """按关键词规则判断问题类别，没有把握时返回 None（全库检索）"""
+    category, _ = kb.router.route(question)
+    if category:
+        metrics.record_route(category, "rules")
+    return category
+
+
+def classify_question(kb: KnowledgeBase, query_embedding):
+    """关键词未能判断时，用问题向量判断类别；仍没有把握时返回 None"""
+    category, _ = kb.router.classify(query_embedding)
+    metrics.record_route(category, "classifier" if category else "global")
+    return category
+
+
+def search_kwargs_for(kb: KnowledgeBase, category):
+    """检索参数，指定类别时只检索该类别的文本块"""
+    search_kwargs = dict(kb.search_kwargs)
+    if category:
+        search_kwargs["filter"] = {"category": category}
+    return search_kwargs
+
+
+def lexical_search(kb: KnowledgeBase, question: str, category=None):
+    """关键词（BM25）检索，索引未就绪时返回空列表"""
+    if kb.keyword_index is None:
+        return []
+    if category:
+        results = kb.keyword_index.search(question, Config.KEYWORD_K, where={"category": category})
+        if results:
+            return results
+    return kb.keyword_index.search(question, Config.KEYWORD_K)
+
+
+def lexical_shortcut(question: str, lexical_docs):
+    """问题含精确词且关键词检索结果包含这些词时，直接使用这些结果"""
+    hits = exact_term_hits(question, lexical_docs, min_coverage=Config.LEXICAL_SHORTCUT_MIN_COVERAGE)
+    if hits:
+        metrics.record_lexical_shortcut()
+    return hits
+
+
+def retrieve_scored(kb: KnowledgeBase, question: str, lexical_docs=(), category=None):
+    """向量检索并与关键词检索结果融合，返回 ([(文本块, 相关度)], 向量检索最高相关度)
+
+    指定类别时只检索该类别，没有结果时退回全库检索。融合后的分数是排名分，
+    检索置信度（用于模型级联）取融合前向量检索的最高相关度。
+    """
+    vector_docs = kb.vectorstore.similarity_search_with_relevance_scores(question, **search_kwargs_for(kb, category))
+    if not vector_docs and category:
+        vector_docs = kb.vectorstore.similarity_search_with_relevance_scores(question, **search_kwargs_for(kb, None))
+    return fuse_results(vector_docs, lexical_docs), top_score(vector_docs)
+
+
+def top_score(scored_docs) -> float:
+    return max((score for _, score in scored_docs), default=0.0)
+
+
+def fuse_results(vector_docs, lexical_docs):
+    """倒数排名融合两路检索结果"""
+    if not lexical_docs:
+        return vector_docs
+    return reciprocal_rank_fusion([vector_docs, lexical_docs], k=Config.RRF_K)
+
+
+class KnowledgePrompt:
+    """组装好的知识库提示词；级联时两级各组装一次，选定回答的一级后再调用 record 记录一次指标"""
+
+    def __init__(self, prompt: ChatPrompt, packed: PackedContext, overhead: int, history_tokens: int):
+        self.prompt = prompt
+        self.docs = packed.docs  # 实际放入的文本块
+        self.packed = packed
+        self.overhead = overhead  # 系统提示词、历史、模板与问题的估算 token 数
+        self.history_tokens = history_tokens
+
+    def record(self):
+        metrics.record_history(self.history_tokens)
+        metrics.record_context(self.packed.tokens, self.overhead + self.packed.tokens,
+                               len(self.packed.docs), self.packed.dropped)
+
+
+def build_knowledge_prompt(runtime: ModelRuntime, question: str, scored_docs,
+                           history: Tuple[str, List[Turn]]) -> KnowledgePrompt:
+    """按模型的提示词模板组装知识库提示词
+
+    检索结果去重、按相关度排序后装入 token 预算：num_ctx 减去回答预留和系统提示词、历史、模板、问题占用的部分。
+    """
+    overhead = estimate_tokens(runtime.knowledge_prompt("", question, history).text())
+    budget = max(runtime.llm.num_ctx - Config.ANSWER_TOKEN_RESERVE - overhead, Config.CONTEXT_MIN_CHUNK_TOKENS)
+    packed = pack_context(scored_docs, budget, min_chunk_tokens=Config.CONTEXT_MIN_CHUNK_TOKENS)
+    prompt = runtime.knowledge_prompt(packed.text, question, history)
+    return KnowledgePrompt(prompt, packed, overhead, history_tokens(history))
+
+
+def build_conversation_prompt(runtime: ModelRuntime, question: str, session_id: str) -> ChatPrompt:
+    """普通对话提示词（系统提示词 + 会话历史 + 问题）"""
+    history = session_history(session_id)
+    metrics.record_history(history_tokens(history))
+    return runtime.conversation_prompt(question, history)
+
+
+# ====================== 会话历史 ======================
+def session_history(session_id: str) -> Tuple[str, List[Turn]]:
+    """放进提示词的会话历史 (摘要, 各轮问答)：window 模式为最近几轮原样，compact 模式为滚动摘要 + 最后一轮"""
+    if compactor is None:
+        return "", sessions.history(session_id)
+    return compactor.history(session_id)
+
+
+def history_tokens(history: Tuple[str, List[Turn]]) -> int:
+    """会话历史的估算 token 数"""
+    summary, turns = history
+    return estimate_tokens(summary + format_history(turns))
+
+
+def record_turn(session_id: str, question: str, answer: str):
+    """保存一轮问答，compact 模式下提交后台压缩（不等待摘要生成）"""
+    sessions.append(session_id, question, answer)
+    if compactor is not None:
+        compactor.schedule(session_id)
+
+
+def record_reply(session_id: str, question: str, result: ReasonedText):
+    """保存模型生成的一轮问答，生成失败（兜底回答）时不写入会话历史"""
+    if not result.failed:
+        record_turn(session_id, question, result.answer)
+
+
+def request_mode(use_knowledge: bool) -> str:
+    return "knowledge" if use_knowledge else "conversation"
+
+
+# ====================== 推理过程 ======================
+def wants_reasoning(data: Dict) -> bool:
+    """请求是否需要返回推理过程（include_reasoning 字段，默认 Config.INCLUDE_REASONING）"""
+    return bool(data.get('include_reasoning', Config.INCLUDE_REASONING))
+
+
+def reasoning_requested() -> bool:
+    timings = metrics.current_timings()
+    return bool(timings and timings.include_reasoning)
+
+
+def joined_reasoning(answer_parts: List[str], reasoning_parts: List[str]) -> ReasonedText:
+    """由流式输出的各段拼出 ReasonedText（推理过程达到长度上限即视为被截断）"""
+    reasoning = "".join(reasoning_parts)
+    return ReasonedText(
+        answer="".join(answer_parts).strip(),
+        reasoning=reasoning.strip(),
+        truncated=len(reasoning) >= Config.REASONING_MAX_CHARS
+    )
+
+
+def streamed_reasoning(parts: dict) -> ReasonedText:
+    """流式输出结束后的 ReasonedText：以拆分器给出的结果为准（生成失败时带 failed 标记），没有结果时由已推送的各段拼出"""
+    return parts.get(RESULT) or joined_reasoning(parts[ANSWER], parts[REASONING])
+
+
+# ====================== 语义缓存 ======================
+def lookup_faq(kb: KnowledgeBase, question: str):
+    """查询知识库的预生成答案库，未启用、未命中或答案库已过期时返回 None"""
+    if not Config.FAQ_ENABLED:
+        return None
+    faq = kb.faq_store.lookup(question)
+    if faq:
+        metrics.record_faq_answer()
+    return faq
+
+
+def lookup_cached_answer(runtime: ModelRuntime, question: str):
+    """计算问题向量并查询该模型的语义缓存，返回 (问题向量, 命中结果)"""
+    if runtime.kb.embeddings is None:
+        return None, None
+    try:
+        query_embedding = runtime.kb.embeddings.embed_query(question)
+    except Exception as e:
+        logger.error(f"问题向量计算失败: {str(e)}")
+        return None, None
+    return query_embedding, runtime.answer_cache.lookup(query_embedding)
+
+
+def remember_answer(runtime: ModelRuntime, query_embedding, result: ReasonedText, sources: List[str]):
+    """写入请求所选模型的语义缓存（级联中由小模型回答时也记在该模型下，与查找时一致；生成失败时不缓存）"""
+    if query_embedding is not None and not result.failed:
+        runtime.answer_cache.store(query_embedding, result.answer, sources)
+
+
+# ====================== 运维接口 ======================
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """存活检查：进程在运行即返回 200"""
+    return jsonify({"status": "ok"})
+
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """就绪检查：所有模型已预热、知识库已加载且维度校验通过时返回 200，否则 503"""
+    ready = startup.ready()
     return jsonify({
+        "ready": ready,
+        "models": {name: model_ready(runtime) for name, runtime in runtimes.items()},
+        "steps": startup.snapshot()
+    }), 200 if ready else 503
+
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """可选模型、默认模型与各模型的知识库问答是否就绪"""
+    described = registry.describe()
+    for name, runtime in runtimes.items():
+        described["models"][name]["ready"] = model_ready(runtime)
+    return jsonify(described)
+
+
+@app.route('/scheduler/stats', methods=['GET'])
+def scheduler_stats():
+    """生成调度统计：队列深度、排队时间、合并命中率"""
+    return jsonify(scheduler.stats())
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """各模型的语义缓存统计"""
+    return jsonify({name: runtime.answer_cache.stats() for name, runtime in runtimes.items()})
+
+
+@app.route('/faq/stats', methods=['GET'])
+def faq_stats():
+    """各知识库的预生成答案库统计：条目数、是否过期、命中率"""
+    return jsonify({name: kb.faq_store.stats() for name, kb in knowledge_bases.items()})
+
+
+@app.route('/cascade/stats', methods=['GET'])
+def cascade_stats():
+    """模型级联统计：各级回答次数与平均生成耗时、预判直接交给大模型的次数、小模型回答后的升级率与原因、估算节省的生成时间"""
+    if cascade_policy is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **cascade_policy.stats()})
+
+
+@app.route('/sessions/stats', methods=['GET'])
+def session_stats():
+    """会话存储统计：会话数、淘汰与过期数，compact 模式下附带历史压缩统计"""
+    stats = sessions.stats()
+    stats["history_mode"] = Config.HISTORY_MODE
+    if compactor is not None:
+        stats["compaction"] = compactor.stats()
+    return jsonify(stats)
+
+
+@app.route('/models/stats', methods=['GET'])
+def model_stats():
+    """模型常驻状态：最近加载耗时、加载/卸载时间与次数"""
+    return jsonify(model_keeper.stats())
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus 指标：请求与各阶段耗时、token 数、生成速度、调度与缓存状态"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def cache_hit_rate() -> float:
+    """所有模型语义缓存的总命中率"""
+    stats = [runtime.answer_cache.stats() for runtime in runtimes.values()]
+    hits = sum(s["hits"] for s in stats)
+    total = hits + sum(s["misses"] for s in stats)
+    return hits / total if total else 0.0
+
+
+def faq_stale() -> int:
+    """任一知识库的预生成答案库过期时为 1"""
+    return int(any(kb.faq_store.stats()["stale"] for kb in knowledge_bases.values()))
+
+
+metrics.Gauge("nwu_scheduler_queue_depth", "生成调度队列深度", lambda: scheduler.stats()["queue_depth"])
+metrics.Gauge("nwu_scheduler_inflight", "正在执行的生成请求数", lambda: scheduler.stats()["inflight"])
+metrics.Gauge("nwu_scheduler_coalesce_hit_rate", "生成请求合并命中率", lambda: scheduler.stats()["coalesce_hit_rate"])
+metrics.Gauge("nwu_semantic_cache_hit_rate", "语义缓存命中率（所有模型）", cache_hit_rate)
+metrics.Gauge("nwu_cascade_escalation_rate", "级联模式下小模型回答后升级到大模型的比例",
+              lambda: cascade_policy.stats()["escalation_rate"] if cascade_policy else 0.0)
+metrics.Gauge("nwu_model_unloads", "启动后模型被ollama卸载的次数", model_keeper.unloads)
+metrics.Gauge("nwu_sessions", "当前保存的会话数", lambda: sessions.stats()["sessions"])
+metrics.Gauge("nwu_faq_stale", "预生成答案库是否因知识库更新而过期（1 为过期）", faq_stale)
+
+
+# ====================== 响应工具 ======================
+def extract_sources(documents) -> List[str]:
+    return list({os.path.basename(doc.metadata["source"]) for doc in documents})
+
+
+def sse_event(event: str, payload: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+
+def success_payload(answer: str, session_id: str, reasoning: Optional[ReasonedText] = None, **extras) -> Dict:
+    # 请求带 debug 时附带各阶段耗时
+    timings = metrics.current_timings()
+    if timings and timings.debug:
+        extras["timings"] = timings.as_dict()
+    # 请求推理过程时单独附带，data 只有回答
+    if reasoning and reasoning.reasoning and timings and timings.include_reasoning:
+        extras["reasoning"] = reasoning.reasoning
+        if reasoning.truncated:
+            extras["reasoning_truncated"] = True
+    return {
         "code": 100,
         "data": answer,
         "session_id": session_id,
         **extras
-    })
+    }
 
 
-def error_response(code: int, error: str, session_id: str) -> Dict:
-    return jsonify({
+def error_payload(code: int, error: str, session_id: str) -> Dict:
+    return {
         "code": code,
         "error": error,
         "session_id": session_id
-    }), code
+    }
+
+
+def error_response(code: int, error: str, session_id: str) -> Dict:
+    return jsonify(error_payload(code, error, session_id)), code
 
 
 # ====================== 主程序 ======================
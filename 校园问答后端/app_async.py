@@ -0,0 +1,351 @@
+"""西小北异步服务入口（ASGI）
+
+与 app1.py 提供相同的 /chat/generate 接口与响应结构，但请求在协程中处理：
+等待模型生成时只占用一个协程而不是一个线程，发往ollama的并发数由
+Config.OLLAMA_MAX_CONCURRENCY 控制。
+
+问答流程的各步与 app1.py 共用（见 app1.py 的“问答流程”一节），这里只负责等待模型生成；
+检索、向量计算、会话读写等阻塞调用通过 asyncio.to_thread 在线程池中执行，不占用事件循环。
+
+启动方式：
+    uvicorn app_async:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import time
+import uuid
+from typing import AsyncIterator
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+import metrics
+from app1 import (
+    UnknownModelError,
+    ModelRuntime,
+    AnswerStream,
+    resolve_runtime,
+    model_ready,
+    use_cascade,
+    wants_reasoning,
+    cascade_policy,
+    record_cascade,
+    registry,
+    runtimes,
+    logger,
+    lookup_knowledge,
+    record_no_documents,
+    answer_hit,
+    hit_events,
+    knowledge_reply,
+    conversation_reply,
+    accept_small_answer,
+    small_answer_events,
+    sources_event,
+    build_knowledge_prompt,
+    build_conversation_prompt,
+    session_history,
+    request_mode,
+    sse_event,
+    startup,
+    error_payload,
+)
+
+
+# ====================== API接口 ======================
+async def handle_query(request: Request) -> JSONResponse:
+    """处理用户查询请求"""
+    data = await request.json()
+    question = data.get('prompt', '').strip()
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    use_knowledge = data.get('use_knowledge', False)
+
+    # 输入验证
+    if not question:
+        return error_response(400, "问题不能为空", session_id)
+    try:
+        runtime = resolve_runtime(data.get('model'), use_knowledge)
+    except UnknownModelError as e:
+        return error_response(400, str(e), session_id)
+
+    timings = metrics.start_request(request_mode(use_knowledge), debug=bool(data.get('debug')),
+                                    include_reasoning=wants_reasoning(data))
+    metrics.record_model(runtime.name)
+    try:
+        # 选择处理模式
+        if use_knowledge:
+            return await process_knowledge_query(runtime, question, session_id, cascade=use_cascade(data))
+        return await process_conversation(runtime, question, session_id)
+
+    except Exception as e:
+        logger.error(f"请求处理异常: {str(e)}")
+        return error_response(500, "服务器内部错误", session_id)
+    finally:
+        metrics.finish_request(timings)
+
+
+async def process_knowledge_query(runtime: ModelRuntime, question: str, session_id: str,
+                                  cascade: bool = False) -> JSONResponse:
+    """处理知识库查询（包含降级逻辑），cascade 为 True 时先尝试级联的小模型"""
+    found = await asyncio.to_thread(lookup_knowledge, runtime, question)
+    if found.hit:
+        return JSONResponse(await asyncio.to_thread(answer_hit, found, question, session_id))
+    if found.loading:
+        return error_response(503, "知识库加载中，请稍后再试", session_id)
+
+    # 处理空结果
+    if not found.scored_docs:
+        record_no_documents(found, question)
+        return await process_conversation(runtime, question, session_id)
+
+    try:
+        result, docs = await generate_knowledge_answer(
+            runtime, question, found.scored_docs, found.confidence, session_id, cascade
+        )
+        return JSONResponse(await asyncio.to_thread(
+            knowledge_reply, runtime, found, question, session_id, result, docs
+        ))
+
+    except Exception as e:
+        logger.error(f"知识库查询失败: {str(e)}")
+        metrics.record_fallback("error")
+        return await process_conversation(runtime, question, session_id)  # 降级到普通对话
+
+
+async def process_conversation(runtime: ModelRuntime, question: str, session_id: str) -> JSONResponse:
+    """处理普通对话"""
+    try:
+        with metrics.span("prompt"):
+            prompt = await asyncio.to_thread(build_conversation_prompt, runtime, question, session_id)
+        with metrics.span("generate"):
+            result = await runtime.llm.areasoned(prompt)
+        return JSONResponse(await asyncio.to_thread(conversation_reply, question, session_id, result))
+    except Exception as e:
+        logger.error(f"对话处理失败: {str(e)}")
+        return error_response(500, "对话服务暂时不可用", session_id)
+
+
+# ====================== 流式接口 ======================
+async def handle_stream_query(request: Request):
+    """流式处理用户查询（Server-Sent Events），事件格式同 app1.py"""
+    data = await request.json()
+    question = data.get('prompt', '').strip()
+    session_id = data.get('session_id') or str(uuid.uuid4())
+    use_knowledge = data.get('use_knowledge', False)
+
+    if not question:
+        return error_response(400, "问题不能为空", session_id)
+    try:
+        runtime = resolve_runtime(data.get('model'), use_knowledge)
+    except UnknownModelError as e:
+        return error_response(400, str(e), session_id)
+
+    if use_knowledge:
+        events = stream_knowledge_query(runtime, question, session_id, cascade=use_cascade(data))
+    else:
+        events = stream_conversation(runtime, question, session_id)
+    events = timed_events(events, request_mode(use_knowledge), runtime.name, debug=bool(data.get('debug')),
+                          include_reasoning=wants_reasoning(data))
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no"
+        }
+    )
+
+
+async def stream_knowledge_query(runtime: ModelRuntime, question: str, session_id: str,
+                                 cascade: bool = False) -> AsyncIterator[str]:
+    """流式知识库查询：先检索并推送来源，再逐token推送回答"""
+    found = await asyncio.to_thread(lookup_knowledge, runtime, question)
+    if found.hit:
+        for event in hit_events(await asyncio.to_thread(answer_hit, found, question, session_id)):
+            yield event
+        return
+    if found.loading:
+        yield sse_event("error", error_payload(503, "知识库加载中，请稍后再试", session_id))
+        return
+
+    if not found.scored_docs:
+        record_no_documents(found, question)
+        async for event in stream_conversation(runtime, question, session_id):
+            yield event
+        return
+
+    try:
+        result = {}
+        async for event in stream_knowledge_answer(runtime, question, found.scored_docs, found.confidence,
+                                                   session_id, cascade, result):
+            yield event
+        yield sse_event("done", await asyncio.to_thread(
+            knowledge_reply, runtime, found, question, session_id, result["reasoned"], result["docs"]
+        ))
+    except Exception as e:
+        logger.error(f"知识库流式查询失败: {str(e)}")
+        yield sse_event("error", error_payload(500, "服务器内部错误", session_id))
+
+
+async def stream_conversation(runtime: ModelRuntime, question: str, session_id: str) -> AsyncIterator[str]:
+    """流式普通对话"""
+    try:
+        with metrics.span("prompt"):
+            prompt = await asyncio.to_thread(build_conversation_prompt, runtime, question, session_id)
+        collector = AnswerStream()
+        async for event in stream_answer(runtime, prompt, collector):
+            yield event
+        yield sse_event("done", await asyncio.to_thread(
+            conversation_reply, question, session_id, collector.result()
+        ))
+    except Exception as e:
+        logger.error(f"对话流式处理失败: {str(e)}")
+        yield sse_event("error", error_payload(500, "对话服务暂时不可用", session_id))
+
+
+async def stream_answer(runtime: ModelRuntime, prompt, collector: AnswerStream) -> AsyncIterator[str]:
+    """逐块推送模型输出，各段与拆分结果收集在 collector 中"""
+    with metrics.span("generate"):
+        async for channel, value in runtime.llm.astream_reasoned(prompt):
+            event = collector.event(channel, value)
+            if event:
+                yield event
+
+
+# ====================== 模型级联 ======================
+async def generate_knowledge_answer(runtime: ModelRuntime, question: str, scored_docs, confidence: float,
+                                    session_id: str, cascade: bool = False):
+    """生成知识库回答，返回 (ReasonedText, 放入提示词的文本块)，级联规则同 app1.py"""
+    with metrics.span("prompt"):
+        history = await asyncio.to_thread(session_history, session_id)
+    reason, wasted = None, 0.0
+    if cascade:
+        reason = cascade_policy.precheck(confidence, scored_docs)
+        if reason is None:
+            small = runtimes[cascade_policy.small_model]
+            result, built, seconds = await ainvoke_knowledge(small, question, scored_docs, history)
+            reason = accept_small_answer(small, result, built, seconds)
+            if reason is None:
+                return result, built.docs
+            wasted = seconds
+
+    result, built, seconds = await ainvoke_knowledge(runtime, question, scored_docs, history)
+    built.record()
+    if cascade:
+        record_cascade(runtime, "large", seconds, reason, wasted)
+    return result, built.docs
+
+
+async def stream_knowledge_answer(runtime: ModelRuntime, question: str, scored_docs, confidence: float,
+                                  session_id: str, cascade: bool, result: dict) -> AsyncIterator[str]:
+    """流式生成知识库回答，推送 sources 与 token 事件；ReasonedText 与文本块写入 result"""
+    with metrics.span("prompt"):
+        history = await asyncio.to_thread(session_history, session_id)
+    reason, wasted = None, 0.0
+    if cascade:
+        reason = cascade_policy.precheck(confidence, scored_docs)
+        if reason is None:
+            small = runtimes[cascade_policy.small_model]
+            reasoned, built, seconds = await ainvoke_knowledge(small, question, scored_docs, history)
+            reason = accept_small_answer(small, reasoned, built, seconds)
+            if reason is None:
+                for event in small_answer_events(reasoned, built, session_id):
+                    yield event
+                result.update(reasoned=reasoned, docs=built.docs)
+                return
+            wasted = seconds
+
+    with metrics.span("prompt"):
+        built = build_knowledge_prompt(runtime, question, scored_docs, history)
+    built.record()
+    yield sources_event(built, session_id)
+    started = time.perf_counter()
+    collector = AnswerStream()
+    async for event in stream_answer(runtime, built.prompt, collector):
+        yield event
+    if cascade:
+        record_cascade(runtime, "large", time.perf_counter() - started, reason, wasted)
+    result.update(reasoned=collector.result(), docs=built.docs)
+
+
+async def ainvoke_knowledge(runtime: ModelRuntime, question: str, scored_docs, history):
+    """异步版 app1.invoke_knowledge：返回 (ReasonedText, KnowledgePrompt, 生成耗时)"""
+    with metrics.span("prompt"):
+        built = build_knowledge_prompt(runtime, question, scored_docs, history)
+    started = time.perf_counter()
+    with metrics.span("generate"):
+        result = await runtime.llm.areasoned(built.prompt)
+    return result, built, time.perf_counter() - started
+
+
+async def timed_events(events: AsyncIterator[str], mode: str, model: str, debug: bool = False,
+                       include_reasoning: bool = False) -> AsyncIterator[str]:
+    """在事件流生成期间统计请求耗时"""
+    timings = metrics.start_request(mode, debug, include_reasoning)
+    metrics.record_model(model)
+    try:
+        async for event in events:
+            yield event
+    finally:
+        metrics.finish_request(timings)
+
+
+# ====================== 运维接口 ======================
+async def healthz(request: Request) -> JSONResponse:
+    """存活检查"""
+    return JSONResponse({"status": "ok"})
+
+
+async def readyz(request: Request) -> JSONResponse:
+    """就绪检查，内容同 app1.py 的 /readyz"""
+    ready = startup.ready()
+    return JSONResponse({
+        "ready": ready,
+        "models": {name: model_ready(runtime) for name, runtime in runtimes.items()},
+        "steps": startup.snapshot()
+    }, status_code=200 if ready else 503)
+
+
+async def list_models(request: Request) -> JSONResponse:
+    """可选模型及就绪状态，内容同 app1.py 的 /models"""
+    described = registry.describe()
+    for name, runtime in runtimes.items():
+        described["models"][name]["ready"] = model_ready(runtime)
+    return JSONResponse(described)
+
+
+async def prometheus_metrics(request: Request) -> PlainTextResponse:
+    """Prometheus 指标，内容同 app1.py 的 /metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+# ====================== 响应工具 ======================
+def error_response(code: int, error: str, session_id: str) -> JSONResponse:
+    return JSONResponse(error_payload(code, error, session_id), status_code=code)
+
+
+# ====================== 应用初始化 ======================
+app = Starlette(
+    routes=[
+        Route('/chat/generate', handle_query, methods=['POST']),
+        Route('/chat/generate/stream', handle_stream_query, methods=['POST']),
+        Route('/metrics', prometheus_metrics, methods=['GET']),
+        Route('/healthz', healthz, methods=['GET']),
+        Route('/readyz', readyz, methods=['GET']),
+        Route('/models', list_models, methods=['GET']),
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])
+    ]
+)
+
+
+# ====================== 主程序 ======================
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=5000)
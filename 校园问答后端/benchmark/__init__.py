@@ -0,0 +1,8 @@
+"""性能基准测试
+
+- mock_ollama：本地模拟 ollama HTTP 服务（可配置生成速度、首 token 延迟、嵌入维度）；
+- load_test：按问题语料压测 /chat/generate，输出延迟分位数、吞吐量、错误率 JSON 报告；
+- ingest_bench：对 数据集/ 做加载、分割、嵌入三个阶段的微基准。
+
+均在 校园问答后端/ 目录下以 python -m benchmark.<模块名> 运行。
+"""
@@ -0,0 +1,114 @@
+"""知识库构建微基准
+
+对 数据集/ 分别计时训练流程的三个阶段：
+- load：逐个文件加载并清洗（按扩展名汇总，找出最慢的格式和文件）；
+- split：按类别配置分割文本块；
+- embed：分批计算嵌入（不使用嵌入缓存，可配合模拟 ollama 排除模型本身的耗时）。
+
+用法：
+    python -m benchmark.ingest_bench --docs_dir ../数据集 --embedding_model nomic-embed-text \\
+        --batch_size 64 --embed_limit 512 --output ingest_report.json
+"""
+import argparse
+import json
+import os
+import time
+from typing import Dict, List, Tuple
+
+from CreateForDeepseek import NWUKnowledgeTrainer
+from embedding_factory import EMBEDDING_BACKENDS
+from benchmark.load_test import percentile
+
+
+def bench_load(trainer: NWUKnowledgeTrainer, files) -> Tuple[List, Dict]:
+    documents, per_file, by_ext, errors = [], [], {}, []
+    for category, file_path in files:
+        ext = os.path.splitext(file_path)[1].lower()
+        started = time.perf_counter()
+        try:
+            docs = trainer.load_file(file_path, category)
+        except Exception as e:
+            errors.append({"file": os.path.basename(file_path), "error": str(e)})
+            continue
+        seconds = time.perf_counter() - started
+        documents.extend(docs)
+        per_file.append((seconds, os.path.basename(file_path)))
+        stats = by_ext.setdefault(ext, {"files": 0, "seconds": 0.0, "chars": 0})
+        stats["files"] += 1
+        stats["seconds"] += seconds
+        stats["chars"] += sum(len(doc.page_content) for doc in docs)
+
+    total = sum(seconds for seconds, _ in per_file)
+    return documents, {
+        "files": len(per_file),
+        "documents": len(documents),
+        "seconds": round(total, 3),
+        "file_ms_p50": round(percentile([s * 1000 for s, _ in per_file], 50), 1),
+        "file_ms_p95": round(percentile([s * 1000 for s, _ in per_file], 95), 1),
+        "by_extension": {ext: {**stats, "seconds": round(stats["seconds"], 3)} for ext, stats in sorted(by_ext.items())},
+        "slowest": [{"file": name, "ms": round(seconds * 1000, 1)} for seconds, name in sorted(per_file, reverse=True)[:5]],
+        "errors": errors
+    }
+
+
+def bench_split(trainer: NWUKnowledgeTrainer, documents) -> Tuple[List, Dict]:
+    started = time.perf_counter()
+    chunks = trainer.split_documents(documents)
+    seconds = time.perf_counter() - started
+    chars = sum(len(chunk.page_content) for chunk in chunks)
+    return chunks, {
+        "chunks": len(chunks),
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(len(chunks) / seconds, 1) if seconds else 0.0,
+        "avg_chunk_chars": round(chars / len(chunks), 1) if chunks else 0.0
+    }
+
+
+def bench_embed(trainer: NWUKnowledgeTrainer, chunks, batch_size: int, limit: int) -> Dict:
+    texts = [chunk.page_content for chunk in chunks[:limit or None]]
+    batch_ms: List[float] = []
+    started = time.perf_counter()
+    for i in range(0, len(texts), batch_size):
+        batch_started = time.perf_counter()
+        trainer.embeddings.embed_documents(texts[i:i + batch_size])
+        batch_ms.append((time.perf_counter() - batch_started) * 1000)
+    seconds = time.perf_counter() - started
+    return {
+        "chunks": len(texts),
+        "batch_size": batch_size,
+        "seconds": round(seconds, 3),
+        "chunks_per_second": round(len(texts) / seconds, 1) if seconds else 0.0,
+        "batch_ms_p50": round(percentile(batch_ms, 50), 1),
+        "batch_ms_p95": round(percentile(batch_ms, 95), 1)
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="知识库构建微基准")
+    parser.add_argument("--docs_dir", default="../数据集", help="文档根目录路径")
+    parser.add_argument("--embedding_model", default="deepseek-r1:14b", help="嵌入模型名称")
+    parser.add_argument("--embedding_backend", default="ollama", choices=EMBEDDING_BACKENDS, help="嵌入模型后端")
+    parser.add_argument("--batch_size", type=int, default=64, help="每批嵌入的文本块数")
+    parser.add_argument("--embed_limit", type=int, default=0, help="最多嵌入的文本块数（0 表示全部）")
+    parser.add_argument("--skip_embed", action="store_true", help="只测加载和分割")
+    parser.add_argument("--output", default="ingest_report.json", help="报告输出路径")
+    args = parser.parse_args()
+
+    # 不使用嵌入缓存，每次都真实计算
+    trainer = NWUKnowledgeTrainer(embedding_cache_dir=None, embedding_model=args.embedding_model,
+                                  embedding_backend=args.embedding_backend)
+    files = list(trainer.iter_category_files(args.docs_dir))
+    print(f"🔍 共 {len(files)} 个文件")
+
+    documents, load_report = bench_load(trainer, files)
+    print(f"📄 load: {load_report['files']} 个文件，{load_report['seconds']}s")
+    chunks, split_report = bench_split(trainer, documents)
+    print(f"✂️ split: {split_report['chunks']} 块，{split_report['seconds']}s")
+    report = {"docs_dir": args.docs_dir, "load": load_report, "split": split_report}
+    if not args.skip_embed:
+        report["embed"] = bench_embed(trainer, chunks, args.batch_size, args.embed_limit)
+        print(f"🧠 embed: {report['embed']['chunks']} 块，{report['embed']['chunks_per_second']} 块/秒")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 报告已写入 {args.output}")
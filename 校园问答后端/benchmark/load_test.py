@@ -0,0 +1,204 @@
+"""/chat/generate 压测
+
+按问题语料（每行一个 JSON，含 prompt 字段）以固定随机种子重放请求，
+对 use_knowledge 为 true / false 两种模式分别在各并发数下运行，
+输出每组的延迟分位数（p50/p95/p99）、吞吐量和错误率，写成 JSON 报告。
+请求带 "debug": true，报告同时汇总服务端返回的各阶段耗时中位数，以及 ollama 实际预填充的
+提示词 token 数（prompt_tokens）与预填充耗时（prompt_eval_ms）的中位数，用于对比提示词布局改动前后的预填充开销。
+
+用法（先启动模拟 ollama 和服务端）：
+    python -m benchmark.load_test --url http://127.0.0.1:5000 --concurrency 1 4 8 \\
+        --requests 200 --output bench_report.json --baseline bench_baseline.json
+
+给出 --baseline 时逐组对比 p95 延迟和吞吐量，退化超过 --max_regression 时以非零状态退出。
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+DEFAULT_QUESTIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "questions.jsonl")
+MODES = {"knowledge": True, "conversation": False}
+
+
+def load_questions(path: str) -> List[str]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line)["prompt"] for line in f if line.strip()]
+
+
+def percentile(values: List[float], q: float) -> float:
+    """线性插值分位数，q 取 0–100"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def send(url: str, question: str, use_knowledge: bool, timeout: float, model: Optional[str] = None) -> Dict:
+    """发送一次请求，返回耗时、错误类型（成功时为 None）和服务端耗时明细"""
+    request_body = {
+        "prompt": question,
+        "session_id": f"bench-{uuid.uuid4()}",  # 每个请求独立会话，避免历史长度影响结果
+        "use_knowledge": use_knowledge,
+        "debug": True
+    }
+    if model:
+        request_body["model"] = model
+    body = json.dumps(request_body, ensure_ascii=False).encode("utf-8")
+    req = urllib.request.Request(f"{url}/chat/generate", data=body,
+                                 headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            payload = json.loads(response.read())
+        error = None if payload.get("code") == 100 else f"code_{payload.get('code')}"
+    except urllib.error.HTTPError as e:
+        payload, error = {}, f"http_{e.code}"
+    except Exception as e:
+        payload, error = {}, type(e).__name__
+    return {
+        "seconds": time.perf_counter() - started,
+        "error": error,
+        "timings": payload.get("timings") or {}
+    }
+
+
+def run(url: str, questions: List[str], use_knowledge: bool, concurrency: int,
+        requests: int, timeout: float, model: Optional[str] = None) -> Dict:
+    """以固定并发发送 requests 个请求，汇总结果"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda i: send(url, questions[i % len(questions)], use_knowledge, timeout, model),
+                                range(requests)))
+    elapsed = time.perf_counter() - started
+
+    ok = [r["seconds"] * 1000 for r in results if r["error"] is None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if r["error"]:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    # 服务端各阶段耗时（*_ms 字段）的中位数
+    stages: Dict[str, List[float]] = {}
+    prompt_tokens: List[float] = []
+    for r in results:
+        for key, value in r["timings"].items():
+            if key.endswith("_ms") and isinstance(value, (int, float)):
+                stages.setdefault(key, []).append(value)
+        if isinstance(r["timings"].get("prompt_tokens"), (int, float)):
+            prompt_tokens.append(r["timings"]["prompt_tokens"])
+
+    return {
+        "requests": requests,
+        "succeeded": len(ok),
+        "error_rate": round((requests - len(ok)) / requests, 4) if requests else 0.0,
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(ok) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.mean(ok), 1) if ok else 0.0,
+            "p50": round(percentile(ok, 50), 1),
+            "p95": round(percentile(ok, 95), 1),
+            "p99": round(percentile(ok, 99), 1),
+            "max": round(max(ok), 1) if ok else 0.0
+        },
+        "server_stages_p50_ms": {key: round(percentile(values, 50), 1) for key, values in sorted(stages.items())},
+        "prompt_tokens_p50": round(percentile(prompt_tokens, 50), 1)
+    }
+
+
+def compare(report: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """与基线报告逐组对比，返回超出阈值的退化项"""
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base:
+            continue
+        p95, base_p95 = result["latency_ms"]["p95"], base["latency_ms"]["p95"]
+        rps, base_rps = result["throughput_rps"], base["throughput_rps"]
+        p95_change = (p95 - base_p95) / base_p95 if base_p95 else 0.0
+        rps_change = (rps - base_rps) / base_rps if base_rps else 0.0
+        print(f"{name:<28} p95 {base_p95:>9.1f} → {p95:>9.1f}ms ({p95_change:+.1%})  "
+              f"吞吐 {base_rps:>7.2f} → {rps:>7.2f}/s ({rps_change:+.1%})")
+        if "prompt_tokens_p50" in base:
+            prefill = result["server_stages_p50_ms"].get("prompt_eval_ms", 0.0)
+            base_prefill = base["server_stages_p50_ms"].get("prompt_eval_ms", 0.0)
+            print(f"{'':<28} 预填充 {base['prompt_tokens_p50']:>7.1f} → {result['prompt_tokens_p50']:>7.1f} token  "
+                  f"{base_prefill:>7.1f} → {prefill:>7.1f}ms")
+        if p95_change > max_regression:
+            regressions.append(f"{name} p95 延迟上升 {p95_change:.1%}")
+        if -rps_change > max_regression:
+            regressions.append(f"{name} 吞吐量下降 {-rps_change:.1%}")
+        if result["error_rate"] > base["error_rate"]:
+            regressions.append(f"{name} 错误率 {base['error_rate']:.2%} → {result['error_rate']:.2%}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="/chat/generate 压测")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="服务地址")
+    parser.add_argument("--questions", default=DEFAULT_QUESTIONS, help="问题语料（JSON Lines，含 prompt 字段）")
+    parser.add_argument("--model", help="请求的模型名（服务端 /models 列出的名称或别名），不指定时使用服务端默认模型")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES), help="压测模式")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="并发数，可给多个")
+    parser.add_argument("--requests", type=int, default=100, help="每组请求数")
+    parser.add_argument("--warmup", type=int, default=5, help="每种模式正式压测前的预热请求数（不计入结果）")
+    parser.add_argument("--timeout", type=float, default=300.0, help="单个请求超时（秒）")
+    parser.add_argument("--seed", type=int, default=0, help="问题重放顺序的随机种子")
+    parser.add_argument("--output", default="bench_report.json", help="报告输出路径")
+    parser.add_argument("--baseline", help="用于对比的基线报告")
+    parser.add_argument("--max_regression", type=float, default=0.1, help="允许的最大退化比例")
+    args = parser.parse_args(argv)
+
+    questions = load_questions(args.questions)
+    random.Random(args.seed).shuffle(questions)
+
+    report = {
+        "url": args.url,
+        "model": args.model,
+        "questions": os.path.basename(args.questions),
+        "seed": args.seed,
+        "requests": args.requests,
+        "started_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": {}
+    }
+    for mode in args.modes:
+        use_knowledge = MODES[mode]
+        for i in range(args.warmup):
+            send(args.url, questions[i % len(questions)], use_knowledge, args.timeout, args.model)
+        for concurrency in args.concurrency:
+            name = f"{mode}_c{concurrency}"
+            print(f"🚀 {name}: {args.requests} 个请求...")
+            result = run(args.url, questions, use_knowledge, concurrency, args.requests, args.timeout, args.model)
+            report["results"][name] = result
+            latency = result["latency_ms"]
+            print(f"   p50 {latency['p50']}ms  p95 {latency['p95']}ms  p99 {latency['p99']}ms  "
+                  f"吞吐 {result['throughput_rps']}/s  错误率 {result['error_rate']:.2%}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 报告已写入 {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print("❌ 性能退化:\n- " + "\n- ".join(regressions))
+            return 1
+        print("✅ 未发现超出阈值的退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+"""模拟 ollama HTTP 服务
+
+不依赖 GPU 和真实模型，按配置的速度返回生成结果和固定维度的嵌入向量，
+用于压测服务端自身（检索、调度、会话、序列化）的开销，结果可重复对比。
+
+支持的接口（与 ollama 一致）：
+- POST /api/generate、/api/chat：按 --token_rate 逐 token 输出，首 token 前等待 --latency_ms，
+  stream 为 false 时等全部生成完一次返回；返回 prompt_eval_count、eval_count 等计数字段；
+  --prefix_cache_slots 大于 0 时模拟 ollama 的 KV 缓存前缀复用：每个模型记住最近几次的提示词，
+  与其中之一相同的前缀不计入 prompt_eval_count，首 token 延迟按需要预填充的比例缩短；
+- POST /api/embeddings、/api/embed：由文本哈希生成确定性的单位向量，维度为 --dim；
+- GET /api/ps、/api/tags：列出已"加载"的模型。
+
+用法：
+    python -m benchmark.mock_ollama --port 11434 --token_rate 30 --latency_ms 200 --dim 768
+
+服务端的 ollama 客户端读取 OLLAMA_HOST 环境变量，嵌入模型默认连接 localhost:11434，
+因此压测时可停掉真实 ollama，让模拟服务监听 11434 端口。
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from context_budget import estimate_tokens
+
+# 生成内容取自固定文本，保证每次压测的输出长度一致
+FILLER = ("西北大学本科生可登录教务系统查看培养方案、选课安排与考试信息，"
+          "具体以学校及学院最新发布的通知为准，如有疑问请联系所在学院教务办公室。")
+
+
+class MockOllama:
+    def __init__(self, token_rate: float = 30.0, latency_ms: float = 200.0, dim: int = 768,
+                 answer_tokens: int = 128, load_ms: float = 0.0, jitter: float = 0.0, seed: int = 0,
+                 prefix_cache_slots: int = 0):
+        self.token_rate = token_rate  # 每秒生成 token 数
+        self.latency = latency_ms / 1000  # 首 token 前的等待（模拟预填充）
+        self.dim = dim
+        self.answer_tokens = answer_tokens
+        self.load_seconds = load_ms / 1000  # 模型首次被请求时的加载耗时
+        self.jitter = jitter  # 延迟的随机浮动比例
+        self.prefix_cache_slots = prefix_cache_slots  # 每个模型缓存的提示词数（对应 OLLAMA_NUM_PARALLEL），0 为不模拟
+        self._prefixes: Dict[str, List[str]] = {}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._loaded: Dict[str, float] = {}
+        self.requests = {"generate": 0, "chat": 0, "embeddings": 0}
+
+    def load(self, model: str) -> float:
+        """模型未加载时模拟加载耗时，返回本次加载用时（秒）"""
+        with self._lock:
+            if model in self._loaded:
+                return 0.0
+            self._loaded[model] = time.time()
+        time.sleep(self.load_seconds)
+        return self.load_seconds
+
+    def delay(self, seconds: float) -> float:
+        with self._lock:
+            factor = 1 + self._random.uniform(-self.jitter, self.jitter)
+        return max(0.0, seconds * factor)
+
+    def prefill(self, model: str, prompt: str) -> Tuple[int, int]:
+        """返回 (提示词 token 数, 需要预填充的 token 数)，未模拟前缀复用时两者相同"""
+        total = estimate_tokens(prompt)
+        if self.prefix_cache_slots <= 0:
+            return total, total
+        with self._lock:
+            cached = self._prefixes.setdefault(model, [])
+            best_index, best = -1, 0
+            for i, previous in enumerate(cached):
+                shared = _common_prefix(previous, prompt)
+                if shared > best:
+                    best_index, best = i, shared
+            # 复用前缀的缓存槽被本次提示词覆盖，否则淘汰最久未用的槽
+            if best_index >= 0:
+                cached.pop(best_index)
+            elif len(cached) >= self.prefix_cache_slots:
+                cached.pop(0)
+            cached.append(prompt)
+        # 与 ollama 一致，完全相同的提示词也至少重新计算最后一个 token
+        return total, max(estimate_tokens(prompt[best:]), 1 if prompt else 0)
+
+    def tokens(self, prompt: str) -> List[str]:
+        """回答按字切分为 token，长度固定为 answer_tokens"""
+        count = self.answer_tokens if prompt else 0
+        text = (FILLER * (count // len(FILLER) + 1))[:count]
+        return list(text)
+
+    def embed(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def running(self) -> List[Dict]:
+        with self._lock:
+            return [{"name": model, "model": model, "size": 0,
+                     "expires_at": "2099-01-01T00:00:00Z"} for model in self._loaded]
+
+
+def _common_prefix(a: str, b: str) -> int:
+    size = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        size += 1
+    return size
+
+
+def _chat_text(messages: List[Dict]) -> str:
+    """按角色拼接消息，模拟对话模板展开后的提示词"""
+    return "".join(f"<|{message.get('role', 'user')}|>{message.get('content', '')}\n" for message in messages)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MockOllamaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    mock: MockOllama = None
+
+    def log_message(self, format, *args):
+        pass  # 压测时不逐条打印请求
+
+    def do_GET(self):
+        if self.path == "/api/ps":
+            self._send_json({"models": self.mock.running()})
+        elif self.path == "/api/tags":
+            self._send_json({"models": self.mock.running()})
+        elif self.path in ("/", "/api/version"):
+            self._send_json({"version": "mock"})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/api/generate":
+            self._generate(body)
+        elif self.path == "/api/chat":
+            self._chat(body)
+        elif self.path == "/api/embeddings":
+            self._embeddings(body)
+        elif self.path == "/api/embed":
+            self._embed(body)
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, body: Dict):
+        with self.mock._lock:
+            self.mock.requests["generate"] += 1
+        self._complete(body, body.get("prompt", ""), lambda text: {"response": text})
+
+    def _chat(self, body: Dict):
+        with self.mock._lock:
+            self.mock.requests["chat"] += 1
+        self._complete(body, _chat_text(body.get("messages", [])),
+                       lambda text: {"message": {"role": "assistant", "content": text}})
+
+    def _complete(self, body: Dict, prompt: str, wrap):
+        """生成回答，wrap 把一段文本包装成 generate 或 chat 接口的字段"""
+        mock = self.mock
+        model = body.get("model", "")
+
+        started = time.time()
+        load_seconds = mock.load(model)
+        total_tokens, prompt_tokens = mock.prefill(model, prompt)
+        time.sleep(mock.delay(mock.latency * prompt_tokens / total_tokens) if total_tokens else 0)
+        prompt_done = time.time()
+        tokens = mock.tokens(prompt)
+        interval = 1 / mock.token_rate if mock.token_rate > 0 else 0
+
+        def final(response: str) -> Dict:
+            finished = time.time()
+            return {
+                "model": model, "created_at": _now(), **wrap(response), "done": True,
+                "done_reason": "stop",
+                "total_duration": int((finished - started) * 1e9),
+                "load_duration": int(load_seconds * 1e9),
+                "prompt_eval_count": prompt_tokens,
+                "prompt_eval_duration": int((prompt_done - started - load_seconds) * 1e9),
+                "eval_count": len(tokens),
+                "eval_duration": int((finished - prompt_done) * 1e9)
+            }
+
+        if not body.get("stream", True):
+            time.sleep(mock.delay(interval * len(tokens)))
+            self._send_json(final("".join(tokens)))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(mock.delay(interval))
+            self._write_chunk({"model": model, "created_at": _now(), **wrap(token), "done": False})
+        self._write_chunk(final(""))
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _embeddings(self, body: Dict):
+        with self.mock._lock:
+            self.mock.requests["embeddings"] += 1
+        self.mock.load(body.get("model", ""))
+        self._send_json({"embedding": self.mock.embed(body.get("prompt", ""))})
+
+    def _embed(self, body: Dict):
+        with self.mock._lock:
+            self.mock.requests["embeddings"] += 1
+        self.mock.load(body.get("model", ""))
+        inputs = body.get("input", "")
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        self._send_json({"model": body.get("model", ""),
+                         "embeddings": [self.mock.embed(text) for text in inputs]})
+
+    def _send_json(self, payload: Dict, status: int = 200):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, payload: Dict):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n"
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+def create_server(mock: MockOllama, host: str = "127.0.0.1", port: int = 11434) -> ThreadingHTTPServer:
+    """创建模拟服务（port 为 0 时随机分配端口），调用方负责 serve_forever / shutdown"""
+    handler = type("BoundMockOllamaHandler", (MockOllamaHandler,), {"mock": mock})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_in_background(mock: MockOllama, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程中启动模拟服务，返回的 server.server_address 为实际监听地址"""
+    server = create_server(mock, host, port)
+    threading.Thread(target=server.serve_forever, name="mock-ollama", daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟 ollama 服务")
+    parser.add_argument("--host", default="127.0.0.1", help="监听地址")
+    parser.add_argument("--port", type=int, default=11434, help="监听端口")
+    parser.add_argument("--token_rate", type=float, default=30.0, help="每秒生成 token 数")
+    parser.add_argument("--latency_ms", type=float, default=200.0, help="首 token 前的延迟（毫秒）")
+    parser.add_argument("--dim", type=int, default=768, help="嵌入向量维度")
+    parser.add_argument("--answer_tokens", type=int, default=128, help="每次生成的 token 数")
+    parser.add_argument("--load_ms", type=float, default=0.0, help="模型首次加载耗时（毫秒）")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机浮动比例，如 0.2 表示 ±20%%")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--prefix_cache_slots", type=int, default=0,
+                        help="模拟 KV 缓存前缀复用时每个模型的缓存槽数（对应 OLLAMA_NUM_PARALLEL），0 为不模拟")
+    args = parser.parse_args()
+
+    server = create_server(MockOllama(args.token_rate, args.latency_ms, args.dim, args.answer_tokens,
+                                      args.load_ms, args.jitter, args.seed, args.prefix_cache_slots),
+                           args.host, args.port)
+    print(f"🧪 模拟 ollama 已启动: http://{args.host}:{server.server_address[1]}"
+          f"（{args.token_rate} token/s，首 token 延迟 {args.latency_ms}ms，嵌入维度 {args.dim}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,182 @@
+"""离线检索评测
+
+对带标注的问题集（每行一个 JSON：question 为问题，sources 为应被检索到的文件名列表）
+在给定的知识库目录上按参数网格运行检索，报告每组配置的：
+- recall：期望文件中被检索结果覆盖的比例（检索结果即服务端会放进提示词的候选）；
+- hit_rate：至少命中一个期望文件的问题占比；
+- mrr：第一个命中结果名次的倒数的平均值；
+- 检索耗时（不含问题嵌入，问题向量每题只算一次，所有配置共用）与检索结果的估算 token 数。
+
+参数网格：
+- --db_dir：可给多个知识库目录，用于比较不同 chunk_size 训练出的知识库；
+- --search_type：similarity（取前 k）、similarity_score_threshold（app1.py 的做法）、mmr（原 Llama3.py 的做法，
+  langchain 的 mmr 不使用 score_threshold）；
+- --k、--threshold：检索数量与相似度阈值；
+- --retrieval：vector 只用向量检索，hybrid 与关键词（BM25）检索结果做倒数排名融合（与服务端一致）。
+加 --route 时先按关键词规则判断类别、只检索该类别，无结果时退回全库检索。
+
+用法：
+    python -m benchmark.retrieval_eval --db_dir ./nwu_knowledge_v2 --k 3 5 8 --threshold 0.3 0.4 0.5 \\
+        --search_type similarity_score_threshold mmr --retrieval vector hybrid --output retrieval_report.json
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+from langchain_community.vectorstores import Chroma
+
+from benchmark.load_test import percentile
+from category_router import CategoryRouter
+from context_budget import estimate_tokens
+from embedding_factory import EMBEDDING_BACKENDS, create_embeddings
+from keyword_index import load_or_build, reciprocal_rank_fusion
+
+DEFAULT_LABELS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "retrieval_labels.jsonl")
+SEARCH_TYPES = ("similarity", "similarity_score_threshold", "mmr")
+
+
+def load_labels(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def source_name(doc) -> str:
+    return os.path.basename(doc.metadata.get("source") or doc.metadata.get("source_path") or "")
+
+
+class RetrievalEvaluator:
+    def __init__(self, db_dir: str, embedding_model: str, embedding_backend: str,
+                 keyword_k: int = 5, rrf_k: int = 60, route: bool = False):
+        self.db_dir = db_dir
+        self.vectorstore = Chroma(persist_directory=db_dir)
+        metadata = self.vectorstore._collection.metadata or {}
+        # 以知识库记录的嵌入模型为准；不缓存嵌入，避免问题向量被其他运行预先算好
+        self.embeddings = create_embeddings(metadata.get("embedding_model", embedding_model),
+                                            metadata.get("embedding_backend", embedding_backend), cache_dir=None)
+        self.relevance = self.vectorstore._select_relevance_score_fn()
+        self.keyword_index = load_or_build(self.vectorstore._collection, db_dir)
+        self.keyword_k = keyword_k
+        self.rrf_k = rrf_k
+        self.router = CategoryRouter() if route else None
+
+    def embed_questions(self, labels: List[Dict]) -> List[Dict]:
+        """计算问题向量，返回带 embedding、category 和嵌入耗时的标注"""
+        prepared = []
+        for label in labels:
+            started = time.perf_counter()
+            embedding = self.embeddings.embed_query(label["question"])
+            category = self.router.route(label["question"])[0] if self.router else None
+            prepared.append({**label, "embedding": embedding, "category": category,
+                             "embed_ms": (time.perf_counter() - started) * 1000})
+        return prepared
+
+    def vector_search(self, embedding, search_type: str, k: int, threshold: float, category: Optional[str]):
+        where = {"category": category} if category else None
+        if search_type == "mmr":
+            docs = self.vectorstore.max_marginal_relevance_search_by_vector(
+                embedding, k=k, fetch_k=max(20, k * 4), filter=where)
+            return [(doc, 0.0) for doc in docs]
+
+        results = self.vectorstore.similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=where)
+        scored = [(doc, self.relevance(distance)) for doc, distance in results]
+        if search_type == "similarity_score_threshold":
+            scored = [(doc, score) for doc, score in scored if score >= threshold]
+        return scored
+
+    def retrieve(self, item: Dict, search_type: str, k: int, threshold: float, retrieval: str):
+        """与服务端相同的检索流程：（按类别）向量检索，无结果时全库检索，可选融合关键词检索"""
+        category = item["category"]
+        docs = self.vector_search(item["embedding"], search_type, k, threshold, category)
+        if not docs and category:
+            docs = self.vector_search(item["embedding"], search_type, k, threshold, None)
+        if retrieval == "hybrid":
+            lexical = self.keyword_index.search(item["question"], self.keyword_k,
+                                                where={"category": category} if category else None)
+            if not lexical and category:
+                lexical = self.keyword_index.search(item["question"], self.keyword_k)
+            if lexical:
+                docs = reciprocal_rank_fusion([docs, lexical], k=self.rrf_k)
+        return docs
+
+    def evaluate(self, items: List[Dict], search_type: str, k: int, threshold: float, retrieval: str) -> Dict:
+        recalls, reciprocal_ranks, hits, search_ms, tokens, counts = [], [], 0, [], [], []
+        for item in items:
+            started = time.perf_counter()
+            docs = self.retrieve(item, search_type, k, threshold, retrieval)
+            search_ms.append((time.perf_counter() - started) * 1000)
+
+            expected = set(item["sources"])
+            names = [source_name(doc) for doc, _ in docs]
+            found = expected & set(names)
+            recalls.append(len(found) / len(expected) if expected else 0.0)
+            rank = next((i for i, name in enumerate(names, start=1) if name in expected), None)
+            reciprocal_ranks.append(1 / rank if rank else 0.0)
+            hits += bool(found)
+            tokens.append(sum(estimate_tokens(doc.page_content) for doc, _ in docs))
+            counts.append(len(docs))
+
+        n = len(items) or 1
+        return {
+            "recall": round(sum(recalls) / n, 4),
+            "hit_rate": round(hits / n, 4),
+            "mrr": round(sum(reciprocal_ranks) / n, 4),
+            "avg_results": round(sum(counts) / n, 2),
+            "avg_context_tokens": round(sum(tokens) / n, 1),
+            "search_ms_p50": round(percentile(search_ms, 50), 2),
+            "search_ms_p95": round(percentile(search_ms, 95), 2)
+        }
+
+
+def grid(search_types, ks, thresholds, retrievals):
+    """参数网格；阈值只对 similarity_score_threshold 有意义，其余检索方式不重复展开"""
+    for search_type, k, retrieval in itertools.product(search_types, ks, retrievals):
+        for threshold in (thresholds if search_type == "similarity_score_threshold" else [None]):
+            yield search_type, k, threshold, retrieval
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="离线检索评测")
+    parser.add_argument("--labels", default=DEFAULT_LABELS, help="标注文件（JSON Lines，含 question 和 sources）")
+    parser.add_argument("--db_dir", nargs="+", default=["./nwu_knowledge_v2"], help="知识库目录，可给多个")
+    parser.add_argument("--embedding_model", default="deepseek-r1:14b", help="知识库未记录嵌入模型时使用的模型")
+    parser.add_argument("--embedding_backend", default="ollama", choices=EMBEDDING_BACKENDS, help="嵌入模型后端")
+    parser.add_argument("--search_type", nargs="+", default=["similarity_score_threshold", "mmr"],
+                        choices=SEARCH_TYPES, help="检索方式")
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5, 8], help="检索数量")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.3, 0.4, 0.5], help="相似度阈值")
+    parser.add_argument("--retrieval", nargs="+", default=["vector", "hybrid"], choices=["vector", "hybrid"],
+                        help="只用向量检索，或融合关键词检索")
+    parser.add_argument("--keyword_k", type=int, default=5, help="关键词检索数量")
+    parser.add_argument("--route", action="store_true", help="按关键词规则路由到类别后检索")
+    parser.add_argument("--output", default="retrieval_report.json", help="报告输出路径")
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    report = {"labels": os.path.basename(args.labels), "questions": len(labels), "route": args.route, "results": []}
+    for db_dir in args.db_dir:
+        evaluator = RetrievalEvaluator(db_dir, args.embedding_model, args.embedding_backend,
+                                       keyword_k=args.keyword_k, route=args.route)
+        items = evaluator.embed_questions(labels)
+        embed_ms = [item["embed_ms"] for item in items]
+        print(f"📚 {db_dir}: {evaluator.vectorstore._collection.count()} 块，"
+              f"问题嵌入 p50 {percentile(embed_ms, 50):.1f}ms")
+
+        for search_type, k, threshold, retrieval in grid(args.search_type, args.k, args.threshold, args.retrieval):
+            result = {"db_dir": db_dir, "search_type": search_type, "k": k, "threshold": threshold,
+                      "retrieval": retrieval, "embed_ms_p50": round(percentile(embed_ms, 50), 2),
+                      **evaluator.evaluate(items, search_type, k, threshold or 0.0, retrieval)}
+            report["results"].append(result)
+            print(f"  {search_type:<27} k={k:<2} threshold={threshold if threshold is not None else '-':<4} "
+                  f"{retrieval:<6} recall {result['recall']:.3f}  mrr {result['mrr']:.3f}  "
+                  f"tokens {result['avg_context_tokens']:>7.1f}  p50 {result['search_ms_p50']}ms")
+
+    best = max(report["results"], key=lambda r: (r["recall"], r["mrr"], -r["avg_context_tokens"]), default=None)
+    if best:
+        print(f"🏆 召回最高且 token 最少: {best['db_dir']} {best['search_type']} k={best['k']} "
+              f"threshold={best['threshold']} {best['retrieval']}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"📄 报告已写入 {args.output}")
@@ -0,0 +1,130 @@
+"""构建高频问题预生成答案库
+
+对问题清单中的每个问题走一遍与 /chat/generate（use_knowledge=true）完全相同的
+知识库问答流程，通过检查的回答连同来源写入知识库目录下的 faq_answers.json，
+服务端按归一化问题匹配后直接返回。
+
+问题清单为 JSON Lines，每行 {"question": "..."}；已人工审定答案的问题可以写成
+{"question": "...", "answer": "...", "sources": ["文件名"]}，直接收录，不再生成。
+生成的回答满足以下条件才收录：成功返回、基于知识库检索（未降级为普通对话）、
+带有来源且不是“服务不可用”的兜底回答。
+
+答案库按知识库保存，用 --model 指定生成答案的模型（默认为知识库问答的默认模型），
+写入该模型所用知识库的目录。
+知识库重新训练后答案库自动失效，不带 --questions 重新运行即沿用上次的问题清单重建：
+    python build_faq.py --questions faq_questions.jsonl
+    python CreateForDeepseek.py --incremental && python build_faq.py --if_stale
+"""
+import argparse
+import json
+import sys
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+from faq_store import knowledge_base_fingerprint, load_answers, save_answers
+
+
+def load_questions(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def rejection_reason(payload: Dict[str, Any], unavailable: str) -> Optional[str]:
+    """检查生成的回答能否收录，可以收录时返回 None"""
+    if payload.get("code") != 100:
+        return f"请求失败: {payload.get('error')}"
+    if not payload.get("is_knowledge_based"):
+        return "知识库无匹配内容，已降级为普通对话"
+    if not payload.get("sources"):
+        return "没有来源"
+    answer = (payload.get("data") or "").strip()
+    if not answer or answer == unavailable:
+        return "模型不可用"
+    return None
+
+
+def wait_until_ready(app1, runtime, timeout: float) -> bool:
+    """等待模型预热完成、所用知识库加载并通过校验"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if app1.model_ready(runtime):
+            return True
+        steps = app1.startup.snapshot()
+        if any(step["state"] == "failed" for step in steps.values()):
+            break
+        time.sleep(1)
+    print(f"❌ 服务初始化未完成: {json.dumps(app1.startup.snapshot(), ensure_ascii=False)}")
+    return False
+
+
+def build(app1, runtime, questions: List[Dict[str, Any]], timeout: float) -> bool:
+    db_dir = runtime.kb.db_dir
+    if not wait_until_ready(app1, runtime, timeout):
+        return False
+
+    # 每个问题都完整走一遍检索和生成，不使用旧答案库和语义缓存
+    app1.Config.FAQ_ENABLED = False
+    runtime.answer_cache.threshold = float("inf")
+    fingerprint = knowledge_base_fingerprint(db_dir)
+    client = app1.app.test_client()
+
+    entries, rejected = [], 0
+    started = time.time()
+    for item in questions:
+        question = item["question"].strip()
+        if item.get("answer"):
+            entries.append({"question": question, "answer": item["answer"],
+                            "sources": item.get("sources", []), "origin": "manual"})
+            print(f"📝 人工答案: {question}")
+            continue
+
+        payload = client.post("/chat/generate", json={
+            "prompt": question,
+            "session_id": f"faq-build-{uuid.uuid4()}",  # 独立会话，回答不受历史影响
+            "use_knowledge": True,
+            "model": runtime.name
+        }).get_json()
+        reason = rejection_reason(payload, app1.SERVICE_UNAVAILABLE)
+        if reason:
+            rejected += 1
+            print(f"⚠️ 未收录: {question}（{reason}）")
+            continue
+        entries.append({"question": question, "answer": payload["data"],
+                        "sources": payload["sources"], "origin": "generated"})
+        print(f"✅ 已生成: {question}")
+
+    save_answers(db_dir, entries, fingerprint, questions)
+    print(f"\n🎉 答案库构建完成！用时 {time.time() - started:.1f}s")
+    print(f"- 收录: {len(entries)} 条，未收录: {rejected} 条")
+    print(f"- 生成模型: {runtime.name}，保存位置: {db_dir}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="构建高频问题预生成答案库")
+    parser.add_argument("--questions", help="问题清单（JSON Lines），不指定时沿用现有答案库的问题清单")
+    parser.add_argument("--model", help="生成答案的模型（名称或别名），默认为知识库问答的默认模型")
+    parser.add_argument("--if_stale", action="store_true", help="答案库与当前知识库一致时跳过")
+    parser.add_argument("--timeout", type=float, default=600, help="等待模型和知识库加载的秒数")
+    args = parser.parse_args()
+
+    # 导入服务模块即开始后台加载模型与知识库
+    import app1
+
+    try:
+        runtime = app1.resolve_runtime(args.model, use_knowledge=True)
+    except app1.UnknownModelError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    db_dir = runtime.kb.db_dir
+    existing = load_answers(db_dir) or {}
+    if args.if_stale and existing and existing.get("fingerprint") == knowledge_base_fingerprint(db_dir):
+        print("✅ 答案库与当前知识库一致，无需重建")
+        sys.exit(0)
+
+    questions = load_questions(args.questions) if args.questions else existing.get("questions", [])
+    if not questions:
+        print("❌ 没有问题清单，请用 --questions 指定")
+        sys.exit(1)
+    sys.exit(0 if build(app1, runtime, questions, args.timeout) else 1)
@@ -0,0 +1,97 @@
+"""问题类别路由
+
+训练脚本为每个文本块写入了 metadata["category"]（数据集的一级目录名）。
+检索前先判断问题属于哪个类别，只在该类别的文本块中检索：
+1. 关键词规则：命中各类别的关键词，按命中词长度加权打分；
+2. 可选的轻量分类器：问题向量与各类别文本块平均向量（类中心）的余弦相似度，
+   复用语义缓存已经算好的问题向量，不增加模型调用；
+两者都没有足够把握时返回 None，由调用方做全库检索。
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# 各类别的关键词，与 数据集/ 下的目录一一对应
+CATEGORY_KEYWORDS: Dict[str, List[str]] = {
+    "培养方案相关": ["培养方案", "学分", "专业", "保研", "推免", "免试", "辅修", "学籍", "毕业论文", "毕业要求",
+                "准入", "分流", "转专业", "导师", "研究生", "学位", "学业指南", "专业目录"],
+    "日常生活相关": ["食堂", "美食", "宿舍", "留宿", "留校", "校园卡", "银行卡", "电话卡", "医保", "学生证", "派出所",
+                "保卫处", "社团", "学费", "收费", "入党", "四六级", "四级", "六级", "开学", "综合素质", "综测",
+                "运动会", "处室", "办公地点", "官网", "校区"],
+    "竞赛相关": ["竞赛", "比赛", "大创", "创新训练", "创新创业", "挑战杯", "数学建模", "获奖", "劳动教育", "项目经费"],
+    "课程、考试资源相关": ["mooc", "慕课", "学堂在线", "网课", "spoc", "教学资源", "考试模板", "封面", "金工实习",
+                   "视频课程", "课程资源"],
+    "选课考试相关": ["选课", "缓考", "补考", "期末考试", "考试安排", "教务办", "重修", "退课", "开课单位"],
+}
+
+
+class CentroidClassifier:
+    """最近类中心分类器：类中心为该类别全部文本块向量的均值"""
+
+    def __init__(self, centroids: Dict[str, np.ndarray]):
+        self.categories = list(centroids)
+        matrix = np.array([centroids[category] for category in self.categories], dtype=np.float32)
+        self.matrix = matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+    def classify(self, embedding) -> Tuple[Optional[str], float]:
+        """返回 (类别, 置信度)，置信度为最相近与次相近类中心的相似度差"""
+        if len(self.categories) < 2:
+            return (self.categories[0], 1.0) if self.categories else (None, 0.0)
+        query = np.asarray(embedding, dtype=np.float32)
+        similarities = self.matrix @ (query / np.linalg.norm(query))
+        second, first = np.argsort(similarities)[-2:]
+        return self.categories[first], float(similarities[first] - similarities[second])
+
+    @classmethod
+    def from_collection(cls, collection, batch_size: int = 256) -> "CentroidClassifier":
+        """分页读取向量库中的向量，按类别求均值"""
+        sums: Dict[str, np.ndarray] = {}
+        counts: Dict[str, int] = {}
+        offset = 0
+        while True:
+            result = collection.get(include=["embeddings", "metadatas"], limit=batch_size, offset=offset)
+            if not result["ids"]:
+                break
+            for vector, metadata in zip(result["embeddings"], result["metadatas"]):
+                category = (metadata or {}).get("category")
+                if category:
+                    sums[category] = sums.get(category, 0) + np.asarray(vector, dtype=np.float32)
+                    counts[category] = counts.get(category, 0) + 1
+            offset += len(result["ids"])
+        return cls({category: sums[category] / counts[category] for category in sums})
+
+
+class CategoryRouter:
+    def __init__(self, keywords: Dict[str, Iterable[str]] = None, min_confidence: float = 0.6,
+                 classifier: Optional[CentroidClassifier] = None, min_margin: float = 0.05):
+        self.keywords = {category: [word.lower() for word in words]
+                         for category, words in (keywords or CATEGORY_KEYWORDS).items()}
+        self.min_confidence = min_confidence
+        self.classifier = classifier
+        self.min_margin = min_margin
+
+    def route(self, question: str) -> Tuple[Optional[str], float]:
+        """关键词规则路由，返回 (类别, 置信度)；没有把握时类别为 None"""
+        text = question.lower()
+        scores = {}
+        for category, words in self.keywords.items():
+            score = sum(len(word) for word in words if word in text)
+            if score:
+                scores[category] = score
+        if not scores:
+            return None, 0.0
+
+        category = max(scores, key=scores.get)
+        confidence = scores[category] / sum(scores.values())
+        if confidence < self.min_confidence:
+            return None, confidence
+        return category, confidence
+
+    def classify(self, embedding) -> Tuple[Optional[str], float]:
+        """用分类器判断类别（未配置分类器或没有问题向量时返回 None）"""
+        if self.classifier is None or embedding is None:
+            return None, 0.0
+        category, margin = self.classifier.classify(embedding)
+        if margin < self.min_margin:
+            return None, margin
+        return category, margin
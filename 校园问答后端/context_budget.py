@@ -0,0 +1,112 @@
+"""知识库提示词的上下文预算
+
+检索到的文本块在放进提示词之前经过三步处理：
+1. 去重：训练时文本分割有 150–400 字的重叠，同一文件相邻的两块首尾重复，
+   去掉与已选内容重复的开头或结尾；被已选块完全包含的块直接丢弃；
+2. 排序：按检索相关度从高到低；
+3. 装箱：按估算的 token 数依次放入，直到用完预算，最后一块放不下时截断。
+提示词越短，14B 模型的预填充（prefill）越快，也不会因超出 num_ctx 被静默截断。
+"""
+import re
+from typing import List, Tuple
+
+from langchain_core.documents import Document
+
+_CJK = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+MIN_OVERLAP_CHARS = 30  # 认定为分割重叠的最短首尾重复长度
+
+
+def estimate_tokens(text: str) -> int:
+    """估算 token 数：中文字符（含全角标点）约 1 个 token，其余字符约 4 个一个 token
+
+    偏保守的估计，实际值可对照 ollama 返回的 prompt_eval_count。
+    """
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _overlap(previous: str, text: str) -> int:
+    """previous 的结尾与 text 的开头重复的长度（不足 MIN_OVERLAP_CHARS 时为 0）"""
+    probe = text[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    pos = previous.find(probe)
+    while pos != -1:
+        tail = previous[pos:]
+        if text.startswith(tail):
+            return len(tail)
+        pos = previous.find(probe, pos + 1)
+    return 0
+
+
+def dedupe_chunks(scored_docs: List[Tuple[Document, float]]) -> List[Tuple[Document, float]]:
+    """按相关度排序并去除重叠内容，返回 (文本块, 相关度)，文本块可能被裁掉重复的首尾"""
+    kept: List[Tuple[Document, float]] = []
+    for doc, score in sorted(scored_docs, key=lambda item: item[1], reverse=True):
+        text = doc.page_content.strip()
+        if not text or any(text in other.page_content for other, _ in kept):
+            continue
+
+        # 完全包含已选块时顶替其位置（保留较高的相关度）
+        contained = [i for i, (other, _) in enumerate(kept) if other.page_content in text]
+        if contained:
+            position, slot_score = contained[0], kept[contained[0]][1]
+            kept = [item for i, item in enumerate(kept) if i not in contained]
+            kept.insert(position, (Document(page_content=text, metadata=doc.metadata), slot_score))
+            continue
+
+        source = doc.metadata.get("source")
+        for other, _ in kept:
+            if other.metadata.get("source") != source:
+                continue
+            # 与同一文件的已选块首尾相接：去掉重复部分
+            head = _overlap(other.page_content, text)
+            if head:
+                text = text[head:].lstrip()
+            tail = _overlap(text, other.page_content)
+            if tail:
+                text = text[:-tail].rstrip()
+        if text:
+            kept.append((Document(page_content=text, metadata=doc.metadata), score))
+    return kept
+
+
+class PackedContext:
+    def __init__(self, docs: List[Document], text: str, tokens: int, dropped: int):
+        self.docs = docs  # 实际放入提示词的文本块
+        self.text = text
+        self.tokens = tokens  # 上下文估算 token 数
+        self.dropped = dropped  # 因重复或超出预算而未放入的文本块数
+
+
+def pack_context(scored_docs: List[Tuple[Document, float]], budget: int,
+                 min_chunk_tokens: int = 64, separator: str = "\n\n") -> PackedContext:
+    """把检索结果装入 budget 个 token 以内"""
+    candidates = dedupe_chunks(scored_docs)
+    separator_tokens = estimate_tokens(separator)
+
+    docs, parts, used = [], [], 0
+    for doc, _ in candidates:
+        cost = estimate_tokens(doc.page_content) + (separator_tokens if parts else 0)
+        remaining = budget - used
+        if cost <= remaining:
+            text = doc.page_content
+        elif remaining >= min_chunk_tokens:
+            # 预算不足以放下整块：截断到剩余预算（按比例估算字符数）
+            keep = int(len(doc.page_content) * remaining / cost)
+            text = doc.page_content[:keep]
+            while text and estimate_tokens(text) + (separator_tokens if parts else 0) > remaining:
+                text = text[:int(len(text) * 0.9)]
+            if not text:
+                break
+            cost = estimate_tokens(text) + (separator_tokens if parts else 0)
+        else:
+            break
+
+        docs.append(Document(page_content=text, metadata=doc.metadata))
+        parts.append(text)
+        used += cost
+        if used >= budget:
+            break
+
+    return PackedContext(docs, separator.join(parts), used, len(scored_docs) - len(docs))
@@ -0,0 +1,98 @@
+"""知识库训练的流式嵌入与写入
+
+文本块按固定大小分批，多个批次并发请求嵌入模型，每批嵌入完成后立即写入 Chroma：
+- 在途批次数有上限，上游（文档解析）会被反压，内存占用与语料规模无关；
+- 每批写入即持久化，写入前先查询哪些 id 已存在，中断后重跑会从已提交的批次之后继续；
+- 实时打印吞吐量（块/秒）。
+"""
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+Chunk = Tuple[str, Document]  # (文本块id, 文本块)
+
+
+class EmbedUpsertPipeline:
+    def __init__(self, vectorstore, embeddings: Embeddings, batch_size: int = 64, concurrency: int = 4):
+        self.collection = vectorstore._collection
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+
+        self.total = 0  # 上游产出的文本块数
+        self.skipped = 0  # 已在库中、跳过的文本块数
+        self.written = 0  # 本次嵌入并写入的文本块数
+        self.embed_seconds = 0.0
+        self._started = 0.0
+
+    def run(self, chunks: Iterable[Chunk]) -> Dict[str, float]:
+        """消费文本块直到结束，返回统计信息"""
+        self._started = time.time()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            for batch in self._batches(chunks):
+                batch = self._skip_committed(batch)
+                if not batch:
+                    continue
+
+                # 在途批次达到上限时先等待部分完成（反压）
+                while len(pending) >= self.concurrency:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._commit(done)
+                pending.add(pool.submit(self._embed, batch))
+
+            done, _ = wait(pending)
+            self._commit(done)
+
+        return self.stats()
+
+    def stats(self) -> Dict[str, float]:
+        elapsed = time.time() - self._started
+        return {
+            "total": self.total,
+            "written": self.written,
+            "skipped": self.skipped,
+            "seconds": elapsed,
+            "chunks_per_second": self.written / elapsed if elapsed else 0.0,
+            "embed_seconds": self.embed_seconds
+        }
+
+    def _batches(self, chunks: Iterable[Chunk]) -> Iterator[List[Chunk]]:
+        batch = []
+        for chunk in chunks:
+            self.total += 1
+            batch.append(chunk)
+            if len(batch) >= self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _skip_committed(self, batch: List[Chunk]) -> List[Chunk]:
+        """过滤掉之前运行中已写入的文本块"""
+        existing = set(self.collection.get(ids=[chunk_id for chunk_id, _ in batch], include=[])["ids"])
+        self.skipped += len(existing)
+        return [chunk for chunk in batch if chunk[0] not in existing]
+
+    def _embed(self, batch: List[Chunk]) -> Tuple[List[Chunk], List[List[float]], float]:
+        started = time.time()
+        vectors = self.embeddings.embed_documents([doc.page_content for _, doc in batch])
+        return batch, vectors, time.time() - started
+
+    def _commit(self, futures):
+        # 写入在主线程串行执行
+        for future in futures:
+            batch, vectors, seconds = future.result()
+            self.collection.upsert(
+                ids=[chunk_id for chunk_id, _ in batch],
+                embeddings=vectors,
+                documents=[doc.page_content for _, doc in batch],
+                metadatas=[doc.metadata for _, doc in batch]
+            )
+            self.written += len(batch)
+            self.embed_seconds += seconds
+            elapsed = time.time() - self._started
+            print(f"💾 已写入 {self.written} 块（跳过 {self.skipped}），{self.written / elapsed:.1f} 块/秒")
@@ -0,0 +1,197 @@
+"""持久化嵌入向量缓存
+
+以“模型名 + 文本类型(query/document) + 文本内容”的哈希为键，把嵌入向量保存在本地：
+- 向量按行追加写入 float32 原始文件（vectors.f32），读取时通过 numpy.memmap 映射；
+- 键到行号的索引保存在同目录的 SQLite 中，写入时用事务串行化，多进程可共享同一缓存。
+  已提交的行数记在 SQLite 中，追加前先把文件截断到该行数：上次写入文件后未能提交
+  （进程崩溃、事务回滚）留下的多余数据会被覆盖，行号始终与索引一致。
+
+CachedEmbeddings 包装任意 LangChain Embeddings 对象，服务端和知识库训练脚本
+均可直接替换使用；已计算过的文本不会再请求模型。
+服务端的问题各不相同，持久化会让文件无限增长，因此 persist_queries=False 时
+问题向量只保存在进程内的 LRU 缓存中（最多 query_cache_size 条），文本块向量照常持久化。
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+class EmbeddingStore:
+    """单个模型的向量存储：vectors.f32 + index.sqlite3"""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.vectors_path = os.path.join(directory, "vectors.f32")
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"),
+            timeout=30,
+            check_same_thread=False,
+            isolation_level=None  # 手动管理事务
+        )
+        self._db.execute("CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self.dim = self._load_dim()
+        self._mmap = None
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量读取，返回已缓存的 {key: vector}"""
+        found = {}
+        if not keys or self.dim is None:
+            return found
+        with self._lock:
+            rows = {}
+            for start in range(0, len(keys), 500):  # SQLite 参数个数有上限
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.update(self._db.execute(
+                    f"SELECT key, row FROM vectors WHERE key IN ({placeholders})", batch
+                ).fetchall())
+            if not rows:
+                return found
+            vectors = self._vectors(max(rows.values()) + 1)
+            for key, row in rows.items():
+                found[key] = vectors[row].tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """批量写入新向量"""
+        if not items:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")  # 跨进程写锁
+            try:
+                if self.dim is None:
+                    self.dim = self._load_dim() or len(next(iter(items.values())))
+                    self._db.execute("INSERT OR IGNORE INTO meta VALUES ('dim', ?)", (str(self.dim),))
+
+                matrix = np.asarray(list(items.values()), dtype=np.float32)
+                if matrix.shape[1] != self.dim:
+                    raise ValueError(f"嵌入维度不一致：缓存为 {self.dim}，新向量为 {matrix.shape[1]}")
+
+                # 新向量从已提交的行数开始写，丢弃文件中未提交的尾部
+                first_row = self._committed_rows()
+                with open(self.vectors_path, "r+b" if os.path.exists(self.vectors_path) else "wb") as f:
+                    f.seek(first_row * self.dim * 4)
+                    f.truncate()
+                    f.write(matrix.tobytes())
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO vectors VALUES (?, ?)",
+                    [(key, first_row + i) for i, key in enumerate(items)]
+                )
+                self._db.execute("INSERT OR REPLACE INTO meta VALUES ('rows', ?)", (str(first_row + len(matrix)),))
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+    def _load_dim(self) -> Optional[int]:
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(row[0]) if row else None
+
+    def _committed_rows(self) -> int:
+        """已提交的行数（在写事务内调用）；没有记录行数的旧缓存取最大行号 + 1"""
+        row = self._db.execute("SELECT value FROM meta WHERE name = 'rows'").fetchone()
+        if row:
+            return int(row[0])
+        return self._db.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM vectors").fetchone()[0]
+
+    def _vectors(self, min_rows: int) -> np.ndarray:
+        # 文件增长（本进程或其他进程追加）后重新映射
+        if self._mmap is None or self._mmap.shape[0] < min_rows:
+            rows = os.path.getsize(self.vectors_path) // (self.dim * 4)
+            self._mmap = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+        return self._mmap
+
+
+class CachedEmbeddings(Embeddings):
+    """带持久化缓存的 Embeddings 包装器"""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_dir: str = "./embedding_cache",
+                 persist_queries: bool = True, query_cache_size: int = 1024):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.store = EmbeddingStore(os.path.join(cache_dir, re.sub(r"[^\w.-]", "_", model_name)))
+        self.persist_queries = persist_queries
+        self.query_cache_size = query_cache_size
+        self._queries = OrderedDict()  # persist_queries=False 时的问题向量 {key: vector}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        if not self.persist_queries:
+            return self._embed_in_memory(text)
+        return self._embed([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "entries": len(self.store),
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0
+        }
+
+    def _embed(self, texts: List[str], kind: str, compute) -> List[List[float]]:
+        keys = [self._key(kind, text) for text in texts]
+        cached = self.store.get_many(list(set(keys)))
+
+        # 只计算未命中的文本，重复文本只算一次
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+        self._count(len(texts) - sum(1 for key in keys if key in missing), len(missing))
+
+        if missing:
+            vectors = compute(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self.store.put_many(computed)
+            cached.update(computed)
+
+        return [list(cached[key]) for key in keys]
+
+    def _embed_in_memory(self, text: str) -> List[float]:
+        """问题向量只在进程内按 LRU 缓存，不写入文件"""
+        key = self._key("query", text)
+        with self._lock:
+            vector = self._queries.get(key)
+            if vector is not None:
+                self._queries.move_to_end(key)
+                self.hits += 1
+                return list(vector)
+            self.misses += 1
+
+        vector = self.embeddings.embed_query(text)
+        with self._lock:
+            self._queries[key] = vector
+            self._queries.move_to_end(key)
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return list(vector)
+
+    def _count(self, hits: int, misses: int):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def _key(self, kind: str, text: str) -> str:
+        raw = f"{self.model_name}\0{kind}\0{text}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
@@ -0,0 +1,111 @@
+"""嵌入模型工厂
+
+嵌入模型与生成模型相互独立配置：既可以用本地 ollama 提供的嵌入模型
+（如 nomic-embed-text、bge-m3），也可以用 sentence-transformers 在进程内计算
+（如 BAAI/bge-small-zh-v1.5）。知识库的集合元数据会记录所用模型与维度，
+服务启动和增量训练时据此校验，换模型时用 migrate_collection.py 迁移。
+"""
+from typing import Dict, Optional
+
+import chromadb
+from langchain_community.embeddings import HuggingFaceEmbeddings, OllamaEmbeddings
+from langchain_community.vectorstores import Chroma
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings
+
+EMBEDDING_BACKENDS = ("ollama", "sentence-transformers")
+DIMENSION_PROBE = "维度测试"
+DEFAULT_COLLECTION = "langchain"  # langchain Chroma 的默认集合名
+
+
+class EmbeddingMismatchError(ValueError):
+    """已有知识库的嵌入模型或维度与当前模型不一致"""
+
+
+def create_embeddings(model: str, backend: str = "ollama",
+                      cache_dir: Optional[str] = "./embedding_cache", persist_queries: bool = True) -> Embeddings:
+    """创建嵌入模型；cache_dir 不为空时包装持久化缓存，persist_queries 为 False 时问题向量不写入缓存文件"""
+    if backend == "ollama":
+        embeddings = OllamaEmbeddings(model=model)
+    elif backend == "sentence-transformers":
+        embeddings = HuggingFaceEmbeddings(
+            model_name=model,
+            encode_kwargs={"normalize_embeddings": True}
+        )
+    else:
+        raise ValueError(f"不支持的嵌入后端: {backend}，可选: {', '.join(EMBEDDING_BACKENDS)}")
+
+    if cache_dir is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, model_name=model, cache_dir=cache_dir, persist_queries=persist_queries)
+
+
+def probe_dimension(embeddings: Embeddings) -> int:
+    """计算一次嵌入得到模型输出维度"""
+    return len(embeddings.embed_query(DIMENSION_PROBE))
+
+
+def embedding_metadata(model: str, backend: str, dim: int) -> Dict[str, object]:
+    """写入集合元数据的嵌入模型信息"""
+    return {
+        "embedding_model": model,
+        "embedding_backend": backend,
+        "embedding_dim": dim
+    }
+
+
+def stored_embedding_model(vectorstore) -> Optional[str]:
+    return (vectorstore._collection.metadata or {}).get("embedding_model")
+
+
+def stored_embedding_dim(vectorstore) -> Optional[int]:
+    """知识库记录的嵌入维度；旧版知识库没有记录时取一条已存向量的长度，空库返回 None"""
+    metadata = vectorstore._collection.metadata or {}
+    if "embedding_dim" in metadata:
+        return int(metadata["embedding_dim"])
+
+    result = vectorstore._collection.get(limit=1, include=["embeddings"])
+    stored = result.get("embeddings")
+    if stored is not None and len(stored):
+        return len(stored[0])
+    return None
+
+
+def open_vectorstore(db_dir: str, embeddings: Embeddings, model: str, backend: str, dim: int,
+                     metadata: Optional[Dict[str, object]] = None,
+                     collection_name: str = DEFAULT_COLLECTION) -> Chroma:
+    """打开（或新建）要写入的向量库，已有知识库的嵌入模型和维度必须与当前模型一致
+
+    chromadb 的 get_or_create_collection 会用传入的元数据覆盖已有集合的元数据，
+    所以已有集合先不带元数据打开，读出原有的模型与维度校验通过后，才补写嵌入模型信息
+    （保留 hnsw:space 等原有键）；新集合直接带全部元数据创建（hnsw:space 只能在创建时指定）。
+    不一致时抛出 EmbeddingMismatchError，知识库保持原样。
+    """
+    client = chromadb.PersistentClient(path=db_dir)
+    new_metadata = {**(metadata or {}), **embedding_metadata(model, backend, dim)}
+    if collection_name not in _collection_names(client):
+        return Chroma(client=client, collection_name=collection_name, embedding_function=embeddings,
+                      persist_directory=db_dir, collection_metadata=new_metadata)
+
+    vectorstore = Chroma(client=client, collection_name=collection_name, embedding_function=embeddings,
+                         persist_directory=db_dir)
+    stored_model = stored_embedding_model(vectorstore)
+    if stored_model and stored_model != model:
+        raise EmbeddingMismatchError(f"知识库由嵌入模型 {stored_model} 构建，当前模型为 {model}")
+    stored_dim = stored_embedding_dim(vectorstore)
+    if stored_dim is not None and stored_dim != dim:
+        raise EmbeddingMismatchError(f"知识库嵌入维度为 {stored_dim}，当前模型 {model} 为 {dim}")
+
+    current = dict(vectorstore._collection.metadata or {})
+    merged = {**current, **embedding_metadata(model, backend, dim)}
+    if merged != current:
+        client.get_or_create_collection(collection_name, metadata=merged)
+        vectorstore = Chroma(client=client, collection_name=collection_name, embedding_function=embeddings,
+                             persist_directory=db_dir)
+    return vectorstore
+
+
+def _collection_names(client) -> set:
+    # chromadb 0.5 的 list_collections 返回集合对象，0.6 起返回名称
+    return {getattr(collection, "name", collection) for collection in client.list_collections()}
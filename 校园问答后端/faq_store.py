@@ -0,0 +1,149 @@
+"""高频问题预生成答案库
+
+开学攻略、学生证办理、医保办电话这类问题占了大部分请求。由 build_faq.py
+离线对问题清单逐个走一遍完整的知识库问答流程，把通过检查的回答连同来源
+保存在知识库目录下的 faq_answers.json；服务端按归一化后的问题精确匹配，
+命中时直接返回，未命中再实时生成。
+
+答案库记录生成时的知识库指纹（训练清单中各文件的内容哈希），
+训练脚本更新知识库后指纹不一致，答案库即视为过期、不再使用，
+重新运行 build_faq.py 即可按原问题清单重建。
+"""
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from ingest_manifest import MANIFEST_FILENAME, IngestManifest
+from semantic_cache import knowledge_base_version
+
+FAQ_FILENAME = "faq_answers.json"
+
+_PUNCTUATION = re.compile(r"[\s\W_]+", re.UNICODE)
+_PREFIXES = ("请问一下", "请问", "想问一下", "想问", "我想知道", "你好", "您好")
+_SUFFIXES = ("是什么", "吗", "呢", "呀", "啊", "吧")
+
+
+def normalize_question(text: str) -> str:
+    """归一化问题：全角转半角、小写、去掉标点空白和常见的客套前缀、语气词"""
+    text = _PUNCTUATION.sub("", unicodedata.normalize("NFKC", text).lower())
+    for prefix in _PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    for suffix in _SUFFIXES:
+        if text.endswith(suffix) and len(text) > len(suffix):
+            text = text[:-len(suffix)]
+            break
+    return text
+
+
+def knowledge_base_fingerprint(db_dir: str) -> Optional[str]:
+    """知识库指纹：有训练清单时取清单的内容指纹，否则取 Chroma 数据文件的修改时间与大小"""
+    if os.path.exists(os.path.join(db_dir, MANIFEST_FILENAME)):
+        return IngestManifest(db_dir, docs_dir="").fingerprint()
+    version = knowledge_base_version(db_dir)
+    return f"{version[0]}-{version[1]}" if version else None
+
+
+def save_answers(db_dir: str, entries: List[Dict[str, Any]], fingerprint: Optional[str],
+                 questions: List[Dict[str, Any]]):
+    """写入答案库（先写临时文件再替换，服务端不会读到写了一半的文件）
+
+    questions 为构建时使用的问题清单，重建时默认沿用。
+    """
+    path = os.path.join(db_dir, FAQ_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "fingerprint": fingerprint,
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "questions": questions,
+            "entries": entries
+        }, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_answers(db_dir: str) -> Optional[Dict[str, Any]]:
+    path = os.path.join(db_dir, FAQ_FILENAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def answers_stale(db_dir: str) -> bool:
+    """答案库存在且与当前知识库不一致"""
+    data = load_answers(db_dir)
+    return bool(data) and data.get("fingerprint") != knowledge_base_fingerprint(db_dir)
+
+
+class FAQStore:
+    """按归一化问题索引的答案库（线程安全），文件或知识库变化时自动重新加载"""
+
+    def __init__(self, db_dir: str, check_interval: float = 5):
+        self.db_dir = db_dir
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = {}
+        self._file_version = None
+        self._fingerprint: Optional[str] = None
+        self._stale = False
+        self._checked_at = float("-inf")
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, question: str) -> Optional[Dict[str, Any]]:
+        """精确或归一化匹配，命中返回 {"question", "answer", "sources"}"""
+        key = normalize_question(question)
+        with self._lock:
+            self._check()
+            entry = None if self._stale else self._index.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return {
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "sources": list(entry["sources"])
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._check()
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._index),
+                "stale": self._stale,
+                "fingerprint": self._fingerprint,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0
+            }
+
+    def _check(self):
+        # 定期检查答案库文件与知识库是否变化
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+
+        try:
+            stat = os.stat(os.path.join(self.db_dir, FAQ_FILENAME))
+            file_version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            file_version = None
+        if file_version != self._file_version:
+            self._file_version = file_version
+            data = load_answers(self.db_dir) if file_version else None
+            self._fingerprint = (data or {}).get("fingerprint")
+            self._index = {normalize_question(entry["question"]): entry
+                           for entry in (data or {}).get("entries", [])}
+
+        self._stale = bool(self._index) and self._fingerprint != knowledge_base_fingerprint(self.db_dir)
@@ -0,0 +1,71 @@
+"""多进程部署配置（gunicorn 预派生工作进程）
+
+用法：
+    gunicorn -c gunicorn.conf.py app1:app                                   # Flask 服务
+    gunicorn -c gunicorn.conf.py -k uvicorn.workers.UvicornWorker app_async:app  # 异步服务
+
+- 不预加载应用：每个工作进程 fork 之后各自导入 app1，独立初始化 ollama 客户端、
+  生成调度器并打开 Chroma 知识库（服务端只读不写），进程之间不共享任何连接或线程；
+- 会话历史改用 SQLite 存储（NWU_SESSION_BACKEND=sqlite），同一会话的请求
+  落到任意工作进程都能读到完整历史；
+- 各知识库的关键词索引由主进程在派生工作进程之前建好，工作进程只加载，不会同时重建；
+- 嵌入向量缓存本身支持多进程共享；语义缓存和 /metrics 指标按进程统计。
+- ollama 的总并发上限平均分给各工作进程，工作进程数默认不超过总并发上限；
+- 模型保活线程通过文件锁选出一个工作进程执行，其余进程只在启动时预热一次。
+环境变量 NWU_WORKERS、NWU_THREADS、NWU_OLLAMA_TOTAL_CONCURRENCY 可覆盖默认值。
+"""
+import multiprocessing
+import os
+import warnings
+
+bind = os.environ.get("NWU_BIND", "0.0.0.0:5000")
+
+# 每个工作进程至少占用 1 路 ollama 并发，进程数超过总并发上限时总并发也随之超出
+_total_concurrency = int(os.environ.get("NWU_OLLAMA_TOTAL_CONCURRENCY", 2))
+workers = int(os.environ.get("NWU_WORKERS", min(multiprocessing.cpu_count(), _total_concurrency)))
+if workers > _total_concurrency:
+    warnings.warn(f"NWU_WORKERS={workers} 大于 NWU_OLLAMA_TOTAL_CONCURRENCY={_total_concurrency}，"
+                  f"每个工作进程仍占 1 路并发，发往 ollama 的并发上限实际为 {workers}")
+
+# 每个工作进程用多线程处理请求，生成调度器才能在进程内合并相同问题
+worker_class = "gthread"
+threads = int(os.environ.get("NWU_THREADS", 8))
+
+# 模型生成可能持续数分钟
+timeout = 600
+graceful_timeout = 30
+preload_app = False
+
+# ollama 的总并发上限平均分给各工作进程（每个进程至少 1）
+raw_env = [
+    "NWU_SESSION_BACKEND=" + os.environ.get("NWU_SESSION_BACKEND", "sqlite"),
+    "NWU_SESSION_DB_PATH=" + os.environ.get("NWU_SESSION_DB_PATH", "./sessions.sqlite3"),
+    f"NWU_OLLAMA_MAX_CONCURRENCY={max(1, _total_concurrency // workers)}",
+    "NWU_MODEL_KEEPER_LOCK=" + os.environ.get("NWU_MODEL_KEEPER_LOCK", "./model_keeper.lock"),
+]
+
+
+def on_starting(server):
+    # 在主进程里先建好会话库，避免多个工作进程同时建表
+    if os.environ.get("NWU_SESSION_BACKEND", "sqlite") == "sqlite":
+        from session_store import SQLiteSessionStore
+        SQLiteSessionStore(os.environ.get("NWU_SESSION_DB_PATH", "./sessions.sqlite3"))
+
+    # 关键词索引缺失或过期时在这里重建一次。放在 spawn 出的子进程中打开 Chroma，
+    # 主进程不持有数据库连接，之后派生的工作进程也就不会继承
+    from concurrent.futures import ProcessPoolExecutor
+    from keyword_index import prebuild
+    from model_profiles import load_registry
+
+    try:
+        registry = load_registry(os.environ.get("NWU_MODEL_PROFILES"))
+        db_dirs = sorted({config.db_dir for config in registry.collections.values()})
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+            for db_dir, size in pool.submit(prebuild, db_dirs).result().items():
+                server.log.info(f"关键词索引就绪: {db_dir}（{size} 块）")
+    except Exception as e:
+        server.log.warning(f"关键词索引预构建失败，由工作进程各自加载或重建: {str(e)}")
+
+
+def post_worker_init(worker):
+    worker.log.info(f"工作进程 {worker.pid} 初始化完成")
@@ -0,0 +1,167 @@
+"""会话历史压缩
+
+按窗口保留最近几轮时，每次请求都要原样重发几轮完整问答（回答常是很长的 markdown），
+提示词随回答长度增长，活跃用户的预填充（prefill）时间越来越长。压缩模式下：
+- 最近 keep_turns 轮原样保留，更早的轮次折叠进一段滚动摘要；
+- 摘要在回答返回之后由后台线程生成（把旧摘要和待折叠的轮次交给模型合并），
+  不占用请求的响应时间；同一会话同时只有一个压缩任务，积压的轮次由下一次压缩一并处理；
+- 放进提示词的历史（摘要 + 尚未折叠的轮次）有 token 上限：摘要最多占一半，
+  最后一轮的回答过长时截短，剩余预算从新到旧放入尚未折叠的较早轮次。
+这样历史部分的长度大致恒定，预填充时间不再随对话轮数和回答长度增长。
+
+压缩前会话存储中的轮数仍受 max_turns 限制，压缩跟不上时最早的轮次会直接丢弃。
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Tuple
+
+from context_budget import estimate_tokens
+from session_store import Turn, format_history
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """请把下面的对话压缩成一段简短的摘要，供后续对话参考。
+要求：保留用户关心的问题、已经给出的关键事实（名称、时间、地点、电话、文件名等）和尚未解决的问题，
+省略寒暄、格式和重复内容，使用中文，不超过 {max_chars} 字，只输出摘要本身。
+
+已有摘要：
+{summary}
+
+新增对话：
+{turns}
+
+摘要："""
+
+SUMMARY_PREFIX = "之前对话的摘要："
+
+
+def truncate_to_tokens(text: str, budget: int) -> str:
+    """把 text 截短到约 budget 个 token 以内（按比例估算字符数）"""
+    if budget <= 0:
+        return ""
+    tokens = estimate_tokens(text)
+    if tokens <= budget:
+        return text
+    text = text[:int(len(text) * budget / tokens)]
+    while text and estimate_tokens(text) > budget:
+        text = text[:int(len(text) * 0.9)]
+    return text
+
+
+class HistoryCompactor:
+    """会话历史的滚动摘要（线程安全）
+
+    store 需提供 history / summary / compact，summarize 接收提示词、返回摘要文本，失败时抛出异常。
+    """
+
+    def __init__(self, store, summarize: Callable[[str], str], keep_turns: int = 1,
+                 max_tokens: int = 800, summary_max_tokens: int = 300, workers: int = 1):
+        self.store = store
+        self.summarize = summarize
+        self.keep_turns = max(keep_turns, 1)
+        self.max_tokens = max_tokens
+        self.summary_max_tokens = summary_max_tokens
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="nwu-compact")
+        self._lock = threading.Lock()
+        self._pending = set()  # 已提交、尚未完成压缩的会话
+
+        # 统计数据
+        self._compactions = 0
+        self._failures = 0
+        self._skipped = 0
+        self._folded_turns = 0
+        self._seconds_total = 0.0
+
+    # ---------------------- 组装历史 ----------------------
+    def history(self, session_id: str) -> Tuple[str, List[Turn]]:
+        """提示词中的历史 (摘要, 尚未折叠的轮次)，总长不超过 max_tokens"""
+        return self.fit(self.store.summary(session_id), self.store.history(session_id))
+
+    def fit(self, summary: str, turns: List[Turn]) -> Tuple[str, List[Turn]]:
+        """把摘要（加上前缀说明）和各轮问答裁剪到 max_tokens 以内"""
+        budget = self.max_tokens
+
+        # 摘要最多占一半预算
+        summary_text = ""
+        if summary:
+            summary_text = SUMMARY_PREFIX + truncate_to_tokens(
+                summary, budget // 2 - estimate_tokens(SUMMARY_PREFIX) - 1
+            )
+            budget -= estimate_tokens(summary_text) + 1
+
+        # 最后一轮总是保留，回答过长时截短
+        last = turns[-1:] if turns else []
+        if last:
+            question, answer = last[0]
+            question = truncate_to_tokens(question, budget // 2)
+            answer = truncate_to_tokens(answer, budget - estimate_tokens(format_history([(question, "")])))
+            last = [(question, answer)]
+            budget -= estimate_tokens(format_history(last))
+
+        # 最后是尚未折叠进摘要的较早轮次，从新到旧放入
+        middle: List[Turn] = []
+        for turn in reversed(turns[:-1]):
+            cost = estimate_tokens(format_history([turn])) + 1
+            if cost > budget:
+                break
+            middle.insert(0, turn)
+            budget -= cost
+
+        return summary_text, middle + last
+
+    # ---------------------- 后台压缩 ----------------------
+    def schedule(self, session_id: str):
+        """回答完成后调用：未折叠的轮次超过 keep_turns 时提交后台压缩"""
+        if len(self.store.history(session_id)) <= self.keep_turns:
+            return
+        with self._lock:
+            if session_id in self._pending:
+                self._skipped += 1
+                return
+            self._pending.add(session_id)
+        self._pool.submit(self._compact, session_id)
+
+    def _compact(self, session_id: str):
+        started = time.perf_counter()
+        try:
+            turns = self.store.history(session_id)
+            folded = turns[:-self.keep_turns]
+            if not folded:
+                return
+            prompt = SUMMARY_PROMPT.format(
+                max_chars=self.summary_max_tokens,
+                summary=self.store.summary(session_id) or "（无）",
+                turns=format_history(folded, human_prefix="用户", ai_prefix="助手")
+            )
+            summary = truncate_to_tokens(self.summarize(prompt).strip(), self.summary_max_tokens)
+            if not summary:
+                raise ValueError("模型返回的摘要为空")
+            self.store.compact(session_id, summary, folded)
+            with self._lock:
+                self._compactions += 1
+                self._folded_turns += len(folded)
+                self._seconds_total += time.perf_counter() - started
+        except Exception as e:
+            logger.warning(f"会话 {session_id} 历史压缩失败: {str(e)}")
+            with self._lock:
+                self._failures += 1
+        finally:
+            with self._lock:
+                self._pending.discard(session_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "keep_turns": self.keep_turns,
+                "max_tokens": self.max_tokens,
+                "compactions": self._compactions,
+                "failures": self._failures,
+                "skipped": self._skipped,
+                "pending": len(self._pending),
+                "folded_turns": self._folded_turns,
+                "mean_compact_ms": round(self._seconds_total / self._compactions * 1000, 1)
+                if self._compactions else 0.0
+            }
@@ -0,0 +1,127 @@
+"""知识库增量构建清单
+
+记录每个已入库文件的路径、大小、修改时间、内容哈希及其文本块 id，
+用于在重新训练时找出新增、修改、删除和未变化的文件。
+清单保存在向量库目录下的 ingest_manifest.json。
+"""
+import hashlib
+import json
+import os
+from typing import Dict, Iterable, List, Tuple
+
+MANIFEST_FILENAME = "ingest_manifest.json"
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容哈希"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_ids_for(splits) -> List[str]:
+    """为文本块生成稳定的 id：同一文件同一内容的第 n 块 id 不变"""
+    ids = []
+    counters: Dict[str, int] = {}
+    for split in splits:
+        raw = f"{split.metadata['source_path']}\0{split.metadata['file_hash']}"
+        file_key = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        n = counters.get(file_key, 0)
+        counters[file_key] = n + 1
+        ids.append(f"{file_key}-{n:05d}")
+    return ids
+
+
+class ManifestDiff:
+    """本次扫描与清单的差异，各列表元素为 (类别, 文件路径)"""
+
+    def __init__(self):
+        self.added: List[Tuple[str, str]] = []
+        self.updated: List[Tuple[str, str]] = []
+        self.unchanged: List[Tuple[str, str]] = []
+        self.deleted: List[str] = []  # 清单中的相对路径
+
+    @property
+    def changed(self) -> List[Tuple[str, str]]:
+        return self.added + self.updated
+
+
+class IngestManifest:
+    def __init__(self, db_dir: str, docs_dir: str):
+        self.path = os.path.join(db_dir, MANIFEST_FILENAME)
+        self.docs_dir = docs_dir
+        self.files: Dict[str, Dict] = {}
+        self.avg_chunk_seconds = 0.0  # 最近一次训练中每个文本块的平均嵌入耗时
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.files = data.get("files", {})
+            self.avg_chunk_seconds = data.get("avg_chunk_seconds", 0.0)
+
+    def key(self, file_path: str) -> str:
+        return os.path.relpath(file_path, self.docs_dir).replace(os.sep, "/")
+
+    def diff(self, files: Iterable[Tuple[str, str]]) -> ManifestDiff:
+        """对比当前文件列表与清单；大小和修改时间一致时不再计算哈希"""
+        result = ManifestDiff()
+        seen = set()
+        for category, file_path in files:
+            key = self.key(file_path)
+            seen.add(key)
+            entry = self.files.get(key)
+            if entry is None:
+                result.added.append((category, file_path))
+                continue
+
+            stat = os.stat(file_path)
+            if entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime and entry["category"] == category:
+                result.unchanged.append((category, file_path))
+            elif entry["sha256"] == file_sha256(file_path) and entry["category"] == category:
+                # 内容未变，仅时间戳变化（如重新拷贝）
+                entry["mtime"] = stat.st_mtime
+                result.unchanged.append((category, file_path))
+            else:
+                result.updated.append((category, file_path))
+
+        result.deleted = [key for key in self.files if key not in seen]
+        return result
+
+    def chunk_ids(self, key: str) -> List[str]:
+        return self.files.get(key, {}).get("chunk_ids", [])
+
+    def record(self, category: str, file_path: str, file_hash: str, chunk_ids: List[str]):
+        stat = os.stat(file_path)
+        self.files[self.key(file_path)] = {
+            "category": category,
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "sha256": file_hash,
+            "chunk_ids": chunk_ids
+        }
+
+    def remove(self, key: str):
+        self.files.pop(key, None)
+
+    def fingerprint(self) -> str:
+        """知识库内容指纹：各文件的类别、内容哈希与文本块数，与修改时间无关"""
+        digest = hashlib.sha256()
+        for key in sorted(self.files):
+            entry = self.files[key]
+            digest.update(f"{key}\0{entry['category']}\0{entry['sha256']}\0{len(entry['chunk_ids'])}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def chunk_count(self, entries: Iterable[Tuple[str, str]]) -> int:
+        return sum(len(self.chunk_ids(self.key(file_path))) for _, file_path in entries)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "docs_dir": self.docs_dir,
+                "avg_chunk_seconds": self.avg_chunk_seconds,
+                "files": self.files
+            }, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
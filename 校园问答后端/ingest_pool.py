@@ -0,0 +1,47 @@
+"""知识库训练的多进程文件处理
+
+PDF/DOCX 解析和文本分割是 CPU 密集型操作，按文件分发到进程池并行执行。
+单个文件失败（包括工作进程崩溃）只影响该文件，错误信息随结果返回。
+"""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+FileTask = Tuple[str, str]  # (类别, 文件路径)
+
+
+def process_files(files: List[FileTask], worker: Callable[[FileTask], Any], workers: int = 1,
+                  initializer: Optional[Callable] = None,
+                  initargs: tuple = ()) -> Iterator[Tuple[int, FileTask, Any, Optional[str]]]:
+    """处理文件列表，按完成顺序产出 (序号, 任务, 结果, 错误信息)
+
+    worker 必须是模块级函数（可被 pickle）；workers <= 1 时在当前进程内顺序执行。
+    同时在途的任务数不超过 workers 的两倍，下游消费变慢时不会无限堆积已解析的结果。
+    """
+    if workers <= 1 or len(files) <= 1:
+        if initializer:
+            initializer(*initargs)
+        for index, task in enumerate(files):
+            try:
+                yield index, task, worker(task), None
+            except Exception as e:
+                yield index, task, None, str(e)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+        tasks = iter(enumerate(files))
+        futures = {}
+        while True:
+            for index, task in tasks:
+                futures[pool.submit(worker, task)] = (index, task)
+                if len(futures) >= workers * 2:
+                    break
+            if not futures:
+                return
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, task = futures.pop(future)
+                try:
+                    yield index, task, future.result(), None
+                except Exception as e:
+                    yield index, task, None, str(e)
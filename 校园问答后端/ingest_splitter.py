@@ -0,0 +1,170 @@
+"""知识库训练脚本共用的文档加载与分割
+
+CreateForDeepseek.py 与 CreateForLlama3.py 的训练器都继承 DocumentSplitter：
+按类别目录找出要入库的文件，按扩展名选择加载器，清洗文本后按类别的分割参数切块。
+多进程加载时每个工作进程由 init_worker 构造一个 DocumentSplitter（不创建嵌入模型）。
+"""
+import os
+import re
+from typing import List, Dict, Iterator, Tuple
+
+from langchain.document_loaders import (
+    PyPDFLoader,
+    Docx2txtLoader,
+    UnstructuredFileLoader,
+    UnstructuredWordDocumentLoader,
+    UnstructuredExcelLoader,
+)
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.docstore.document import Document
+
+from ingest_manifest import file_sha256
+from ingest_pool import process_files
+
+
+class DocumentSplitter:
+    """按类别加载、清洗并分割文档，不涉及嵌入模型（多进程加载时每个工作进程构造一个）"""
+
+    def __init__(self, category_config: Dict[str, Dict]):
+        self.category_config = category_config  # 各目录的文件类型与分割参数
+        self.exclude_files = ['.DS_Store', 'Thumbs.db']  # 排除系统文件
+        self._splitters: Dict[str, RecursiveCharacterTextSplitter] = {}
+
+    def clean_text(self, text: str) -> str:
+        """清理文档文本"""
+        # 去除特殊字符
+        text = re.sub(r'[\x00-\x1f\x7f-\x9f]', ' ', text)
+        # 合并多余空格和换行
+        text = re.sub(r'\s+', ' ', text)
+        # 移除文档头尾的无关信息
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        return ' '.join(lines[:1000])  # 限制最大长度
+
+    def iter_category_files(self, base_dir: str) -> Iterator[Tuple[str, str]]:
+        """遍历各类别目录下需要入库的文件，产出 (类别, 文件路径)"""
+        for category, config in self.category_config.items():
+            category_dir = os.path.join(base_dir, category)
+            if not os.path.exists(category_dir):
+                print(f"⚠️ 目录不存在: {category_dir}")
+                continue
+
+            print(f"\n📂 正在处理类别: {category}")
+
+            for root, _, files in os.walk(category_dir):
+                for file in files:
+                    file_ext = os.path.splitext(file)[1].lower()
+
+                    # 过滤文件
+                    if any(exclude in file for exclude in self.exclude_files):
+                        continue
+                    if file_ext not in config["file_types"]:
+                        continue
+
+                    yield category, os.path.join(root, file)
+
+    def load_file(self, file_path: str, category: str) -> List[Document]:
+        """加载单个文件并清洗，失败时抛出异常"""
+        file_ext = os.path.splitext(file_path)[1].lower()
+
+        # 动态选择加载器
+        if file_ext == '.pdf':
+            docs = PyPDFLoader(file_path).load()
+        elif file_ext == '.docx':
+            docs = Docx2txtLoader(file_path).load()
+        elif file_ext == '.doc':
+            docs = UnstructuredWordDocumentLoader(file_path).load()
+        elif file_ext == '.xlsx':
+            docs = UnstructuredExcelLoader(file_path).load()
+        else:
+            docs = UnstructuredFileLoader(file_path).load()
+
+        # 清洗和增强元数据
+        file_hash = file_sha256(file_path)
+        for doc in docs:
+            doc.metadata.update({
+                "category": category,
+                "source_path": file_path,
+                "file_hash": file_hash
+            })
+            doc.page_content = self.clean_text(doc.page_content)
+        return docs
+
+    def load_category_documents(self, base_dir: str) -> List[Document]:
+        """修复后的文档加载方法"""
+        return self.load_files(list(self.iter_category_files(base_dir)))
+
+    def load_files(self, files: List[Tuple[str, str]]) -> List[Document]:
+        """加载指定的 (类别, 文件路径) 列表，单个文件失败不影响其他文件"""
+        all_documents = []
+
+        for category, file_path in files:
+            file = os.path.basename(file_path)
+            try:
+                docs = self.load_file(file_path, category)
+                all_documents.extend(docs)
+                print(f"✅ 已加载: {file}")
+            except Exception as e:
+                print(f"❌ 加载失败 {file}: {str(e)}")
+
+        return all_documents
+
+    def load_and_split_file(self, file_path: str, category: str) -> Tuple[int, List[Document]]:
+        """加载、清洗并分割单个文件，返回 (文档页数, 文本块)"""
+        docs = self.load_file(file_path, category)
+        return len(docs), self.split_documents(docs)
+
+    def split_files(self, files: List[Tuple[str, str]], workers: int = 1) -> Iterator:
+        """多进程加载、清洗并分割文件，按完成顺序产出 (序号, (类别, 文件路径), (文档页数, 文本块), 错误信息)"""
+        if workers > 1:
+            worker, initializer, initargs = load_and_split_worker, init_worker, (self.category_config,)
+        else:
+            worker, initializer, initargs = self._load_and_split_task, None, ()
+        return process_files(files, worker, workers, initializer=initializer, initargs=initargs)
+
+    def _load_and_split_task(self, task: Tuple[str, str]) -> Tuple[int, List[Document]]:
+        category, file_path = task
+        return self.load_and_split_file(file_path, category)
+
+    def _splitter(self, category: str) -> RecursiveCharacterTextSplitter:
+        """每个类别只构造一次分割器"""
+        if category not in self._splitters:
+            config = self.category_config.get(category, {})
+            self._splitters[category] = RecursiveCharacterTextSplitter(
+                chunk_size=config.get("chunk_size", 1000),
+                chunk_overlap=config.get("chunk_overlap", 200),
+                length_function=len
+            )
+        return self._splitters[category]
+
+    def split_documents(self, documents: List[Document]) -> List[Document]:
+        """根据类别使用不同策略分割文档"""
+        split_docs = []
+
+        for doc in documents:
+            splitter = self._splitter(doc.metadata["category"])
+
+            try:
+                splits = splitter.split_documents([doc])
+                for split in splits:
+                    split.metadata.update(doc.metadata)  # 保留原始元数据
+                split_docs.extend(splits)
+            except Exception as e:
+                print(f"分割文档出错: {str(e)}")
+                continue
+
+        return split_docs
+
+
+# ====================== 进程池任务 ======================
+_worker_splitter = None
+
+
+def init_worker(category_config: Dict[str, Dict]):
+    """工作进程初始化：每个进程按类别配置构造一个分割器（不创建嵌入模型）"""
+    global _worker_splitter
+    _worker_splitter = DocumentSplitter(category_config)
+
+
+def load_and_split_worker(task: Tuple[str, str]) -> Tuple[int, List[Document]]:
+    category, file_path = task
+    return _worker_splitter.load_and_split_file(file_path, category)
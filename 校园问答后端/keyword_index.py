@@ -0,0 +1,213 @@
+"""知识库关键词索引（BM25）
+
+校园问题里有大量需要精确匹配的词：课程代码、处室名称、电话号码等，
+纯向量检索容易漏掉。这里对训练脚本写入 Chroma 的同一批文本块建立
+中文分词（jieba）倒排索引，按 BM25 打分，与向量检索结果用倒数排名融合（RRF）。
+
+索引保存在向量库目录下的 keyword_index.json，训练脚本每次训练后重建；
+服务启动时如发现文本块数量与向量库不一致也会重建。多进程部署时由 gunicorn 主进程
+在派生工作进程之前调用 prebuild 建好，工作进程只需加载。
+"""
+import json
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import jieba
+from langchain_core.documents import Document
+
+KEYWORD_INDEX_FILENAME = "keyword_index.json"
+
+# 需要精确匹配的词：课程代码（字母 + 数字，如 CS101、MATH-2001）、带区号的座机号码、手机号码。
+# 纯数字只认完整的电话号码，年份（2024）、年级（2022级）等不算精确词
+EXACT_TERM = re.compile(
+    r"(?<![A-Za-z\d])[A-Za-z]+[-_]?\d+[A-Za-z\d]*"
+    r"|(?<!\d)0\d{2,3}-?\d{7,8}(?!\d)"
+    r"|(?<!\d)1[3-9]\d{9}(?!\d)"
+)
+_WORD = re.compile(r"\w", re.UNICODE)
+_STOPWORDS = {"的", "了", "是", "在", "和", "与", "及", "或", "吗", "呢", "吧", "啊", "怎么", "什么", "如何",
+              "哪些", "哪里", "多少", "请问", "一下", "我", "你", "我们", "可以", "需要", "有", "要"}
+
+ScoredDocument = Tuple[Document, float]
+
+
+def tokenize(text: str) -> List[str]:
+    """搜索引擎模式分词，去掉标点和常见虚词，英文统一小写"""
+    tokens = []
+    for token in jieba.lcut_for_search(text):
+        token = token.strip().lower()
+        if token and _WORD.search(token) and token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def exact_terms(text: str) -> List[str]:
+    return [term.lower() for term in EXACT_TERM.findall(text)]
+
+
+class KeywordIndex:
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.ids: List[str] = []
+        self.texts: List[str] = []
+        self.metadatas: List[Dict] = []
+        self.term_freqs: List[Dict[str, int]] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._lengths: List[int] = []
+        self._avg_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add(self, chunk_id: str, text: str, metadata: Optional[Dict] = None):
+        self._append(chunk_id, text, metadata or {}, dict(Counter(tokenize(text))))
+
+    def search(self, query: str, k: int = 5, where: Optional[Dict] = None) -> List[ScoredDocument]:
+        """BM25 检索，where 为元数据等值过滤条件"""
+        scores: Dict[int, float] = {}
+        total = len(self.ids)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc in postings:
+                tf = self.term_freqs[doc][term]
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc] / self._avg_length)
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+
+        if where:
+            scores = {doc: score for doc, score in scores.items()
+                      if all(self.metadatas[doc].get(key) == value for key, value in where.items())}
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(Document(page_content=self.texts[doc], metadata=self.metadatas[doc]), score)
+                for doc, score in ranked]
+
+    def save(self, db_dir: str):
+        path = os.path.join(db_dir, KEYWORD_INDEX_FILENAME)
+        # 每次写入使用独立的临时文件，多个进程同时重建时互不覆盖，最后一次替换生效
+        fd, tmp_path = tempfile.mkstemp(prefix=KEYWORD_INDEX_FILENAME + ".", suffix=".tmp", dir=db_dir)
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({
+                    "k1": self.k1,
+                    "b": self.b,
+                    "ids": self.ids,
+                    "texts": self.texts,
+                    "metadatas": self.metadatas,
+                    "term_freqs": self.term_freqs
+                }, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, db_dir: str) -> Optional["KeywordIndex"]:
+        path = os.path.join(db_dir, KEYWORD_INDEX_FILENAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(data["k1"], data["b"])
+        for chunk_id, text, metadata, term_freqs in zip(data["ids"], data["texts"],
+                                                         data["metadatas"], data["term_freqs"]):
+            index._append(chunk_id, text, metadata, term_freqs)
+        return index
+
+    @classmethod
+    def build(cls, chunks: Iterator[Tuple[str, str, Dict]]) -> "KeywordIndex":
+        """由 (文本块id, 文本, 元数据) 构建索引"""
+        index = cls()
+        for chunk_id, text, metadata in chunks:
+            index.add(chunk_id, text, metadata)
+        return index
+
+    def _append(self, chunk_id: str, text: str, metadata: Dict, term_freqs: Dict[str, int]):
+        doc = len(self.ids)
+        self.ids.append(chunk_id)
+        self.texts.append(text)
+        self.metadatas.append(metadata)
+        self.term_freqs.append(term_freqs)
+        for term in term_freqs:
+            self._postings.setdefault(term, []).append(doc)
+        length = sum(term_freqs.values())
+        self._lengths.append(length)
+        self._avg_length += (length - self._avg_length) / len(self.ids)
+
+
+def iter_collection_chunks(collection, batch_size: int = 256) -> Iterator[Tuple[str, str, Dict]]:
+    """分页读出 Chroma 集合中的全部文本块"""
+    offset = 0
+    while True:
+        result = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not result["ids"]:
+            return
+        for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+            yield chunk_id, text, metadata or {}
+        offset += len(result["ids"])
+
+
+def build_from_collection(collection, db_dir: str) -> KeywordIndex:
+    """由向量库重建关键词索引并保存"""
+    index = KeywordIndex.build(iter_collection_chunks(collection))
+    index.save(db_dir)
+    return index
+
+
+def load_or_build(collection, db_dir: str) -> KeywordIndex:
+    """加载关键词索引；不存在或文本块数与向量库不一致时重建"""
+    index = KeywordIndex.load(db_dir)
+    if index is None or len(index) != collection.count():
+        index = build_from_collection(collection, db_dir)
+    return index
+
+
+def prebuild(db_dirs: Sequence[str]) -> Dict[str, int]:
+    """依次打开各向量库目录并加载或重建关键词索引，返回各目录的文本块数（目录不存在时跳过）"""
+    from langchain_community.vectorstores import Chroma
+
+    sizes = {}
+    for db_dir in db_dirs:
+        if os.path.isdir(db_dir):
+            sizes[db_dir] = len(load_or_build(Chroma(persist_directory=db_dir)._collection, db_dir))
+    return sizes
+
+
+def reciprocal_rank_fusion(result_lists: Sequence[List[ScoredDocument]], k: int = 60,
+                           limit: Optional[int] = None) -> List[ScoredDocument]:
+    """倒数排名融合：同一文本块（按来源与内容识别）在各路结果中的 1/(k+名次) 求和"""
+    fused: Dict[Tuple, List] = {}
+    for results in result_lists:
+        for rank, (doc, _) in enumerate(results, start=1):
+            key = (doc.metadata.get("source"), doc.page_content)
+            entry = fused.setdefault(key, [doc, 0.0])
+            entry[1] += 1 / (k + rank)
+    ranked = sorted(((doc, score) for doc, score in fused.values()), key=lambda item: item[1], reverse=True)
+    return ranked[:limit] if limit else ranked
+
+
+def term_coverage(query: str, text: str) -> float:
+    """问题的关键词中出现在 text 里的比例"""
+    terms = set(tokenize(query))
+    if not terms:
+        return 0.0
+    return len(terms & set(tokenize(text))) / len(terms)
+
+
+def exact_term_hits(query: str, results: List[ScoredDocument], min_coverage: float = 0.4) -> List[ScoredDocument]:
+    """问题中含精确词（课程代码、电话号码）时，返回原文包含全部精确词、
+    且覆盖问题中至少 min_coverage 比例关键词的关键词检索结果"""
+    terms = exact_terms(query)
+    if not terms:
+        return []
+    return [(doc, score) for doc, score in results
+            if all(term in doc.page_content.lower() for term in terms)
+            and term_coverage(query, doc.page_content) >= min_coverage]
@@ -0,0 +1,218 @@
+"""ollama生成请求调度器
+
+位于问答链与 ollama.chat（或 ollama.generate）之间：
+1. 准入窗口：请求入队后等待几毫秒再派发，让同一波到达的请求有机会合并、排序；
+2. 请求合并：模型、提示词、参数完全相同的请求共享一次生成，结果分发给所有等待者；
+3. 有界队列：队列满时直接拒绝，短提示词优先派发；
+4. 统计：队列深度、排队等待时间、合并命中率，供调优窗口大小。
+
+流式请求（stream）与普通请求共用同一队列和工作线程：工作线程在整个流式生成期间
+占用一个并发名额，逐段把输出交给调用方，因此并发上限和队列统计覆盖所有生成请求。
+流式请求不参与合并。
+"""
+import hashlib
+import heapq
+import itertools
+import json
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional
+
+_STREAM_END = object()  # 流式输出结束标记
+
+
+class SchedulerFullError(RuntimeError):
+    """调度队列已满"""
+
+
+class _Job:
+    """一次实际的生成任务，可被多个请求共享"""
+
+    def __init__(self, key: str, kwargs: Dict[str, Any], stream: bool = False):
+        self.key = key
+        self.kwargs = kwargs
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 1
+        self.stream = stream
+        self.chunks: "queue.Queue" = queue.Queue()  # 流式请求的输出片段
+        self.cancelled = threading.Event()  # 调用方已不再读取流式输出
+
+
+class GenerateScheduler:
+    """带准入窗口、请求合并和优先级的生成调度器"""
+
+    def __init__(self, generate_fn: Callable[..., Dict[str, Any]],
+                 window_ms: float = 5, max_queue: int = 64, workers: int = 2):
+        self.generate_fn = generate_fn
+        self.window = window_ms / 1000
+        self.max_queue = max_queue
+        self.workers = workers
+
+        self._cond = threading.Condition()
+        self._heap = []  # (提示词长度, 序号, 任务)
+        self._seq = itertools.count()
+        self._inflight: Dict[str, _Job] = {}  # 排队中或生成中的任务
+        self._threads = []
+
+        # 统计数据
+        self._submitted = 0
+        self._streams = 0
+        self._coalesced = 0
+        self._rejected = 0
+        self._dispatched = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._depth_max = 0
+
+    def submit(self, **kwargs) -> Dict[str, Any]:
+        """提交一次生成请求（阻塞直到结果返回），参数与 generate_fn（ollama.chat / ollama.generate）相同"""
+        key = self._make_key(kwargs)
+
+        with self._cond:
+            self._ensure_workers()
+            self._submitted += 1
+
+            job = self._inflight.get(key)
+            if job is not None:
+                # 相同请求已在排队或生成中，直接等待其结果
+                job.waiters += 1
+                self._coalesced += 1
+            else:
+                if len(self._heap) >= self.max_queue:
+                    self._rejected += 1
+                    raise SchedulerFullError(f"调度队列已满（{self.max_queue}）")
+                job = _Job(key, kwargs)
+                self._inflight[key] = job
+                heapq.heappush(self._heap, (self._prompt_length(kwargs), next(self._seq), job))
+                self._depth_max = max(self._depth_max, len(self._heap))
+                self._cond.notify()
+
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result
+
+    def stream(self, **kwargs) -> Iterator[Dict[str, Any]]:
+        """提交一次流式生成请求，逐段返回 generate_fn(stream=True, ...) 的输出
+
+        排队、优先级和并发上限与 submit 相同；调用方提前停止读取时生成随之中止。
+        """
+        with self._cond:
+            self._ensure_workers()
+            self._submitted += 1
+            self._streams += 1
+            if len(self._heap) >= self.max_queue:
+                self._rejected += 1
+                raise SchedulerFullError(f"调度队列已满（{self.max_queue}）")
+            job = _Job(f"stream-{next(self._seq)}", kwargs, stream=True)
+            self._inflight[job.key] = job
+            heapq.heappush(self._heap, (self._prompt_length(kwargs), next(self._seq), job))
+            self._depth_max = max(self._depth_max, len(self._heap))
+            self._cond.notify()
+
+        try:
+            while True:
+                item = job.chunks.get()
+                if item is _STREAM_END:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            job.cancelled.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """调度统计"""
+        with self._cond:
+            return {
+                "queue_depth": len(self._heap),
+                "queue_depth_max": self._depth_max,
+                "inflight": len(self._inflight),
+                "submitted": self._submitted,
+                "streams": self._streams,
+                "coalesced": self._coalesced,
+                "coalesce_hit_rate": self._coalesced / self._submitted if self._submitted else 0.0,
+                "rejected": self._rejected,
+                "dispatched": self._dispatched,
+                "avg_wait_ms": self._wait_total / self._dispatched * 1000 if self._dispatched else 0.0,
+                "max_wait_ms": self._wait_max * 1000,
+                "window_ms": self.window * 1000,
+            }
+
+    def _ensure_workers(self):
+        # 首次提交时才启动工作线程，避免在导入阶段（如多进程fork前）创建线程
+        if self._threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"generate-scheduler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                wait = time.monotonic() - job.enqueued_at
+                self._dispatched += 1
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+
+            try:
+                if job.stream:
+                    self._run_stream(job)
+                else:
+                    job.result = self.generate_fn(**job.kwargs)
+            except BaseException as e:
+                job.error = e
+            finally:
+                with self._cond:
+                    self._inflight.pop(job.key, None)
+                job.done.set()
+
+    def _run_stream(self, job: _Job):
+        """在工作线程中执行流式生成，输出片段、异常和结束标记依次放入 job.chunks"""
+        try:
+            if job.cancelled.is_set():
+                return
+            parts = self.generate_fn(stream=True, **job.kwargs)
+            try:
+                for part in parts:
+                    job.chunks.put(part)
+                    if job.cancelled.is_set():
+                        break
+            finally:
+                close = getattr(parts, "close", None)
+                if close is not None:
+                    close()
+        except BaseException as e:
+            job.chunks.put(e)
+        finally:
+            job.chunks.put(_STREAM_END)
+
+    def _next_job(self) -> _Job:
+        """在持有锁的情况下取出下一个任务：等待准入窗口结束后取最短的提示词"""
+        while True:
+            while not self._heap:
+                self._cond.wait()
+
+            oldest = min(job.enqueued_at for _, _, job in self._heap)
+            remaining = oldest + self.window - time.monotonic()
+            if remaining <= 0:
+                return heapq.heappop(self._heap)[2]
+            self._cond.wait(remaining)
+
+    @staticmethod
+    def _prompt_length(kwargs: Dict[str, Any]) -> int:
+        """提示词长度（字符数），chat 请求为各消息内容长度之和"""
+        if "messages" in kwargs:
+            return sum(len(message.get("content", "")) for message in kwargs["messages"])
+        return len(kwargs.get("prompt", ""))
+
+    @staticmethod
+    def _make_key(kwargs: Dict[str, Any]) -> str:
+        raw = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
@@ -0,0 +1,312 @@
+"""请求耗时与模型生成指标
+
+- 各处理阶段（嵌入、检索、提示词组装、生成）耗时，按 Prometheus 直方图汇总；
+- 生成阶段记录 ollama 返回的 prompt_eval_count / prompt_eval_duration / eval_count / eval_duration，
+  得到预填充的 token 数与耗时（命中 KV 缓存的前缀不计入）、生成速度（tokens/s），
+  以及模型加载耗时（load_duration）；
+- 知识库提示词的上下文 token 数（估算），与 prompt_eval_count 对照；
+- 知识库查询降级到普通对话的次数；
+- render() 输出 Prometheus 文本格式，供 /metrics 接口使用。
+
+每个请求开始时调用 start_request()，之后同一线程（或协程）里的 span()、
+record_generation() 会同时记到该请求的 RequestTimings 上，调试模式下随响应返回。
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+_REGISTRY: List["_Metric"] = []
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _REGISTRY.append(self)
+
+    def _label_key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{self._format_labels(key)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    """取值时回调的瞬时指标"""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float]):
+        super().__init__(name, help_text)
+        self.fn = fn
+
+    def render(self) -> List[str]:
+        return super().render() + [f"{self.name} {float(self.fn())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # 各桶计数 + [总和, 总数]
+
+    def observe(self, value: float, **labels):
+        key = self._label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            for key, series in self._series.items():
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', repr(bound)))} {count}")
+                lines.append(f"{self.name}_bucket{self._format_labels(key, ('le', '+Inf'))} {series[-1]}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {series[-2]}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {series[-1]}")
+        return lines
+
+
+def render() -> str:
+    """所有指标的 Prometheus 文本格式"""
+    lines = []
+    for metric in _REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# ====================== 预定义指标 ======================
+_SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+_TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192)
+
+REQUEST_SECONDS = Histogram("nwu_request_seconds", "请求总耗时（秒）", _SECONDS_BUCKETS, ("mode",))
+STAGE_SECONDS = Histogram("nwu_stage_seconds", "各处理阶段耗时（秒）", _SECONDS_BUCKETS, ("mode", "stage"))
+PROMPT_TOKENS = Histogram("nwu_prompt_tokens", "预填充的提示词 token 数（ollama prompt_eval_count，不含复用的缓存前缀）", _TOKEN_BUCKETS)
+PROMPT_EVAL_SECONDS = Histogram("nwu_prompt_eval_seconds", "提示词预填充耗时（秒，prompt_eval_duration）", _SECONDS_BUCKETS)
+COMPLETION_TOKENS = Histogram("nwu_completion_tokens", "生成 token 数（ollama eval_count）", _TOKEN_BUCKETS)
+GENERATION_TPS = Histogram("nwu_generation_tokens_per_second", "生成速度（tokens/s）",
+                           (1, 2, 5, 10, 15, 20, 30, 40, 60, 80, 120))
+MODEL_LOAD_SECONDS = Histogram("nwu_model_load_seconds", "请求中ollama加载模型的耗时（秒，load_duration）",
+                               (0.01, 0.1, 0.5, 1, 5, 10, 30, 60, 120))
+REASONING_TOKENS = Histogram("nwu_reasoning_tokens", "推理模型输出的推理过程 token 数（估算，截断后）", _TOKEN_BUCKETS)
+HISTORY_TOKENS = Histogram("nwu_history_tokens", "放入提示词的会话历史 token 数（估算）", _TOKEN_BUCKETS)
+CONTEXT_TOKENS = Histogram("nwu_context_tokens", "放入知识库提示词的上下文 token 数（估算）", _TOKEN_BUCKETS)
+ROUTES = Counter("nwu_route_total", "检索类别路由结果（global 为全库检索）", ("category", "method"))
+LEXICAL_SHORTCUTS = Counter("nwu_lexical_shortcut_total", "精确词命中关键词索引、跳过向量检索的次数")
+FALLBACKS = Counter("nwu_knowledge_fallback_total", "知识库查询降级到普通对话的次数", ("reason",))
+FAQ_ANSWERS = Counter("nwu_faq_answer_total", "直接使用预生成答案库回答的次数")
+MODEL_REQUESTS = Counter("nwu_model_requests_total", "各模型处理的请求数", ("model", "mode"))
+CASCADE = Counter("nwu_cascade_total", "级联模式下各级模型回答的次数（reason 为交给大模型的原因：检索预判或小模型回答未通过检查，小模型回答为 none）", ("tier", "reason"))
+
+
+# ====================== 请求计时 ======================
+class RequestTimings:
+    def __init__(self, mode: str, debug: bool = False, include_reasoning: bool = False):
+        self.mode = mode
+        self.debug = debug
+        self.include_reasoning = include_reasoning  # 响应是否附带推理过程
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.details: Dict[str, float] = {}  # token 数、生成速度等
+        self.fallback: Optional[str] = None
+
+    def add_stage(self, stage: str, seconds: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def as_dict(self) -> Dict:
+        result = {f"{stage}_ms": round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+        result.update(self.details)
+        result["total_ms"] = round((time.perf_counter() - self.started) * 1000, 1)
+        if self.fallback:
+            result["fallback"] = self.fallback
+        return result
+
+
+_current = contextvars.ContextVar("nwu_request_timings", default=None)
+
+
+def start_request(mode: str, debug: bool = False, include_reasoning: bool = False) -> RequestTimings:
+    timings = RequestTimings(mode, debug, include_reasoning)
+    _current.set(timings)
+    return timings
+
+
+def finish_request(timings: RequestTimings):
+    REQUEST_SECONDS.observe(time.perf_counter() - timings.started, mode=timings.mode)
+    _current.set(None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+@contextmanager
+def span(stage: str):
+    """统计一个处理阶段的耗时"""
+    timings = _current.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, mode=timings.mode if timings else "", stage=stage)
+        if timings:
+            timings.add_stage(stage, elapsed)
+
+
+def mark_first_token():
+    """记录首个 token 相对请求开始的耗时（流式接口）"""
+    timings = _current.get()
+    if timings:
+        elapsed = time.perf_counter() - timings.started
+        STAGE_SECONDS.observe(elapsed, mode=timings.mode, stage="first_token")
+        timings.add_stage("first_token", elapsed)
+
+
+def record_route(category: Optional[str], method: str):
+    ROUTES.inc(category=category or "global", method=method)
+    timings = _current.get()
+    if timings:
+        timings.details["category"] = category or "global"
+
+
+def record_lexical_shortcut():
+    LEXICAL_SHORTCUTS.inc()
+    timings = _current.get()
+    if timings:
+        timings.details["lexical_shortcut"] = True
+
+
+def record_model(model: str):
+    """记录请求选用的模型"""
+    timings = _current.get()
+    MODEL_REQUESTS.inc(model=model, mode=timings.mode if timings else "")
+    if timings:
+        timings.details["model"] = model
+
+
+def record_cascade(tier: str, model: str, reason: Optional[str] = None):
+    """记录级联模式下实际回答的一级与模型"""
+    CASCADE.inc(tier=tier, reason=reason or "none")
+    timings = _current.get()
+    if timings:
+        timings.details.update({"model": model, "cascade_tier": tier})
+        if reason:
+            timings.details["escalation"] = reason
+
+
+def record_reasoning(tokens: int, truncated: bool):
+    """记录推理过程长度（估算 token 数）"""
+    REASONING_TOKENS.observe(tokens)
+    timings = _current.get()
+    if timings:
+        timings.details["reasoning_tokens_estimated"] = timings.details.get("reasoning_tokens_estimated", 0) + tokens
+        if truncated:
+            timings.details["reasoning_truncated"] = True
+
+
+def record_faq_answer():
+    FAQ_ANSWERS.inc()
+    timings = _current.get()
+    if timings:
+        timings.details["faq"] = True
+
+
+def record_fallback(reason: str):
+    """记录一次知识库查询降级"""
+    FALLBACKS.inc(reason=reason)
+    timings = _current.get()
+    if timings:
+        timings.fallback = reason
+
+
+def record_history(tokens: int):
+    """记录提示词中会话历史的长度（估算 token 数）"""
+    HISTORY_TOKENS.observe(tokens)
+    timings = _current.get()
+    if timings:
+        timings.details["history_tokens_estimated"] = tokens
+
+
+def record_context(context_tokens: int, prompt_tokens: int, chunks: int, dropped: int):
+    """记录上下文装箱结果（估算 token 数）"""
+    CONTEXT_TOKENS.observe(context_tokens)
+    timings = _current.get()
+    if timings:
+        timings.details.update({
+            "context_tokens": context_tokens,
+            "prompt_tokens_estimated": prompt_tokens,
+            "context_chunks": chunks,
+            "context_dropped": dropped
+        })
+
+
+def record_generation(response: Dict):
+    """根据 ollama 返回的计数字段记录 token 数与生成速度"""
+    prompt_tokens = response.get("prompt_eval_count")
+    completion_tokens = response.get("eval_count")
+    prompt_eval_duration = response.get("prompt_eval_duration")  # 纳秒
+    eval_duration = response.get("eval_duration")  # 纳秒
+    load_duration = response.get("load_duration")  # 纳秒，模型冷启动时明显变大
+
+    stats = {}
+    if load_duration is not None:
+        MODEL_LOAD_SECONDS.observe(load_duration / 1e9)
+        stats["load_ms"] = round(load_duration / 1e6, 1)
+    if prompt_tokens is not None:
+        PROMPT_TOKENS.observe(prompt_tokens)
+        stats["prompt_tokens"] = prompt_tokens
+    if prompt_eval_duration is not None:
+        PROMPT_EVAL_SECONDS.observe(prompt_eval_duration / 1e9)
+        stats["prompt_eval_ms"] = round(prompt_eval_duration / 1e6, 1)
+    if completion_tokens is not None:
+        COMPLETION_TOKENS.observe(completion_tokens)
+        stats["completion_tokens"] = completion_tokens
+        if eval_duration:
+            tokens_per_second = completion_tokens / (eval_duration / 1e9)
+            GENERATION_TPS.observe(tokens_per_second)
+            stats["tokens_per_second"] = round(tokens_per_second, 2)
+
+    timings = _current.get()
+    if timings:
+        timings.details.update(stats)
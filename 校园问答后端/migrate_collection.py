@@ -0,0 +1,103 @@
+"""知识库嵌入模型迁移
+
+把已有知识库的全部文本块用新的嵌入模型重新计算，写入新的向量库目录，
+文本块 id、内容和元数据保持不变，新集合的元数据记录新模型名称与维度。
+增量训练清单、关键词索引和预生成答案库会一并复制，迁移后可以继续对新目录做增量训练。
+
+用法：
+    python migrate_collection.py --src_dir ./nwu_knowledge_v1 --dst_dir ./nwu_knowledge_v3 \
+        --embedding_model nomic-embed-text --embedding_backend ollama
+"""
+import argparse
+import os
+import shutil
+from typing import Iterator, Tuple
+
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from embed_pipeline import EmbedUpsertPipeline
+from embedding_factory import (
+    EMBEDDING_BACKENDS,
+    EmbeddingMismatchError,
+    create_embeddings,
+    open_vectorstore,
+    probe_dimension,
+    stored_embedding_dim,
+    stored_embedding_model,
+)
+from faq_store import FAQ_FILENAME
+from ingest_manifest import MANIFEST_FILENAME
+from keyword_index import KEYWORD_INDEX_FILENAME
+
+
+def iter_collection(collection, batch_size: int) -> Iterator[Tuple[str, Document]]:
+    """分页读出集合中的全部文本块"""
+    offset = 0
+    while True:
+        result = collection.get(include=["documents", "metadatas"], limit=batch_size, offset=offset)
+        if not result["ids"]:
+            return
+        for chunk_id, text, metadata in zip(result["ids"], result["documents"], result["metadatas"]):
+            yield chunk_id, Document(page_content=text, metadata=metadata or {})
+        offset += len(result["ids"])
+
+
+def migrate(src_dir: str, dst_dir: str, model: str, backend: str, cache_dir: str,
+            batch_size: int = 64, embed_concurrency: int = 4) -> bool:
+    if not os.path.exists(src_dir):
+        print(f"❌ 源知识库不存在: {src_dir}")
+        return False
+
+    embeddings = create_embeddings(model, backend, cache_dir)
+    dim = probe_dimension(embeddings)
+
+    source = Chroma(persist_directory=src_dir)
+    source_metadata = dict(source._collection.metadata or {})
+    print(f"📦 源知识库: {src_dir}（{source._collection.count()} 块，"
+          f"模型 {stored_embedding_model(source) or '未记录'}，维度 {stored_embedding_dim(source)}）")
+    print(f"🎯 目标知识库: {dst_dir}（模型 {model}，后端 {backend}，维度 {dim}）")
+
+    # 已有目标集合（上次迁移中断）先校验再补写元数据，不会被源集合的元数据覆盖
+    try:
+        target = open_vectorstore(dst_dir, embeddings, model, backend, dim, metadata=source_metadata)
+    except EmbeddingMismatchError as e:
+        print(f"❌ 目标目录已有知识库（{e}），请换一个目录")
+        return False
+
+    try:
+        pipeline = EmbedUpsertPipeline(target, embeddings, batch_size, embed_concurrency)
+        stats = pipeline.run(iter_collection(source._collection, batch_size))
+    except Exception as e:
+        print(f"❌ 迁移失败: {str(e)}")
+        print("已写入的批次会保留，重新运行将从中断处继续")
+        return False
+
+    # 文本块不变，增量训练清单、关键词索引和预生成答案库直接复制
+    for filename in (MANIFEST_FILENAME, KEYWORD_INDEX_FILENAME, FAQ_FILENAME):
+        path = os.path.join(src_dir, filename)
+        if os.path.exists(path):
+            shutil.copy2(path, os.path.join(dst_dir, filename))
+
+    print(f"\n🎉 迁移完成！用时 {stats['seconds']:.1f}s")
+    print(f"- 文本块: {stats['total']}（本次写入 {stats['written']}，已存在跳过 {stats['skipped']}）")
+    print(f"- 吞吐量: {stats['chunks_per_second']:.1f} 块/秒")
+    print(f"- 请将服务端模型注册表（model_profiles.py 或 NWU_MODEL_PROFILES）中知识库的 db_dir 改为 {dst_dir}，"
+          f"embedding_model 改为 {model}，embedding_backend 改为 {backend}")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="西北大学知识库嵌入模型迁移")
+    parser.add_argument("--src_dir", required=True, help="源向量数据库路径")
+    parser.add_argument("--dst_dir", required=True, help="目标向量数据库路径")
+    parser.add_argument("--embedding_model", required=True, help="新的嵌入模型名称")
+    parser.add_argument("--embedding_backend", default="ollama", choices=EMBEDDING_BACKENDS, help="嵌入模型后端")
+    parser.add_argument("--embedding_cache_dir", default="./embedding_cache", help="嵌入向量缓存目录")
+    parser.add_argument("--batch_size", type=int, default=64, help="每批嵌入并写入的文本块数")
+    parser.add_argument("--embed_concurrency", type=int, default=4, help="同时进行的嵌入请求批数")
+
+    args = parser.parse_args()
+    success = migrate(args.src_dir, args.dst_dir, args.embedding_model, args.embedding_backend,
+                      args.embedding_cache_dir, args.batch_size, args.embed_concurrency)
+    exit(0 if success else 1)
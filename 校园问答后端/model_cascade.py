@@ -0,0 +1,116 @@
+"""知识库问答的模型级联
+
+电话号码、办公地点这类检索结果明确的问题，小模型（llama3:8b）就能答好，
+不必每次都交给 14B 模型。级联模式下知识库问答按以下顺序选择模型：
+1. 检索置信度（向量检索最高相关度，精确词命中视为 1）不低于 min_score，
+   且检索到的上下文（去重后）不超过 max_context_tokens 时，先用小模型生成；
+2. 小模型的回答未通过检查（为空、拒答如“无法回答”、没有提及任何来源文件）时，
+   丢弃该回答，升级到大模型重新生成；
+3. 否则直接使用大模型。
+
+统计每一级实际回答的次数与平均生成耗时，并估算节省的生成时间：
+小模型回答的请求按“大模型平均耗时 - 小模型平均耗时”计节省，
+升级的请求中小模型白白花掉的时间计为大模型一级的额外开销。
+第 1 步预判直接交给大模型的请求记为 routed（小模型没有生成），
+只有第 2 步小模型回答后未通过检查的请求记为 escalations，升级率 = 升级次数 / 小模型生成次数。
+"""
+import os
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+from context_budget import dedupe_chunks, estimate_tokens
+
+REFUSAL_PHRASES = ("无法回答", "不知道", "没有相关信息", "未找到相关", "没有找到相关")
+PRECHECK_REASONS = ("low_confidence", "long_context")  # precheck 直接交给大模型的原因
+
+
+class CascadePolicy:
+    """级联决策与统计（线程安全）"""
+
+    def __init__(self, small_model: str, large_model: str, min_score: float = 0.6,
+                 max_context_tokens: int = 1500, require_source: bool = True):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.min_score = min_score
+        self.max_context_tokens = max_context_tokens
+        self.require_source = require_source
+
+        self._lock = threading.Lock()
+        self._served = {"small": 0, "large": 0}
+        self._generate_seconds = {"small": 0.0, "large": 0.0}
+        self._reasons: Dict[str, int] = {}  # 小模型回答后升级的原因
+        self._routed: Dict[str, int] = {}  # 预判直接交给大模型的原因
+        self._wasted_seconds = 0.0
+
+    def precheck(self, confidence: float, scored_docs: List[Tuple[Document, float]]) -> Optional[str]:
+        """检索结果是否适合交给小模型，适合时返回 None，否则返回直接使用大模型的原因"""
+        if confidence < self.min_score:
+            return "low_confidence"
+        context_tokens = sum(estimate_tokens(doc.page_content) for doc, _ in dedupe_chunks(scored_docs))
+        if context_tokens > self.max_context_tokens:
+            return "long_context"
+        return None
+
+    def check_answer(self, answer: str, sources: List[str], unavailable: str) -> Optional[str]:
+        """检查小模型的回答，通过时返回 None，否则返回升级原因"""
+        text = answer.strip()
+        if not text or text == unavailable:
+            return "empty"
+        if any(phrase in text for phrase in REFUSAL_PHRASES):
+            return "refusal"
+        if self.require_source and sources and "来源" not in text and \
+                not any(os.path.splitext(source)[0] in text for source in sources):
+            return "missing_source"
+        return None
+
+    def record(self, tier: str, generate_seconds: float, reason: Optional[str] = None,
+               wasted_seconds: float = 0.0):
+        """记录一次知识库回答：tier 为实际回答的一级，reason 为交给大模型的原因（precheck 或 check_answer 给出，
+        小模型回答时为 None）"""
+        with self._lock:
+            self._served[tier] += 1
+            self._generate_seconds[tier] += generate_seconds
+            self._wasted_seconds += wasted_seconds
+            if reason:
+                counts = self._routed if reason in PRECHECK_REASONS else self._reasons
+                counts[reason] = counts.get(reason, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            served = dict(self._served)
+            mean = {tier: self._generate_seconds[tier] / served[tier] * 1000 if served[tier] else 0.0
+                    for tier in served}
+            escalations = sum(self._reasons.values())
+            wasted_ms = self._wasted_seconds * 1000
+            reasons = dict(self._reasons)
+            routed = dict(self._routed)
+
+        total = served["small"] + served["large"]
+        small_attempts = served["small"] + escalations
+        # 两级都有样本时才能估算节省
+        saved_per_answer = mean["large"] - mean["small"] if served["small"] and served["large"] else 0.0
+        return {
+            "requests": total,
+            "routed": sum(routed.values()),
+            "routed_reasons": routed,
+            "escalations": escalations,
+            "escalation_rate": escalations / small_attempts if small_attempts else 0.0,
+            "reasons": reasons,
+            "tiers": {
+                "small": {
+                    "model": self.small_model,
+                    "served": served["small"],
+                    "mean_generate_ms": round(mean["small"], 1),
+                    "saved_ms": round(saved_per_answer * served["small"], 1)
+                },
+                "large": {
+                    "model": self.large_model,
+                    "served": served["large"],
+                    "mean_generate_ms": round(mean["large"], 1),
+                    "saved_ms": round(-wasted_ms, 1)  # 升级前小模型白白花掉的时间
+                }
+            },
+            "saved_ms": round(saved_per_answer * served["small"] - wasted_ms, 1)
+        }
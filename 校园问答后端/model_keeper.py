@@ -0,0 +1,140 @@
+"""ollama 模型常驻管理
+
+ollama 默认在模型空闲 5 分钟后将其卸载，之后的第一个请求要重新加载
+deepseek-r1:14b，耗时数十秒。这里对配置的生成模型和嵌入模型：
+- 用显式 keep_alive 发起预热请求，把模型固定在内存中；
+- 后台定期检查 ollama 已加载的模型（ollama.ps），被卸载的立即重新加载，
+  仍在内存中的发一次空请求刷新 keep_alive；
+- 记录每个模型最近一次的加载耗时、加载/卸载时间与次数，供 /models/stats 查看。
+多进程部署时设置 lock_path：各进程的保活线程争用同一个文件锁，只有持锁的进程定期检查，
+持锁进程退出后由其他进程接手。
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Set, Union
+
+import ollama
+
+try:
+    import fcntl
+except ImportError:  # Windows 下只有单进程部署，不需要文件锁
+    fcntl = None
+
+KeepAlive = Union[int, float, str]  # 秒数或 "30m" 这样的时长，负数表示常驻
+
+
+class ModelKeeper:
+    def __init__(self, generate_models, embedding_models=(), keep_alive: KeepAlive = -1,
+                 interval: float = 240, client=ollama, lock_path: Optional[str] = None):
+        # 同一个模型既用于生成又用于嵌入时只管理一次
+        self.models: Dict[str, str] = {model: "embedding" for model in embedding_models}
+        self.models.update({model: "generate" for model in generate_models})
+        self.keep_alive = keep_alive
+        self.interval = interval
+        self.client = client
+        self.lock_path = lock_path
+        self._lock_file = None  # 持有保活文件锁时为打开的锁文件
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._state: Dict[str, Dict[str, Any]] = {
+            model: {"kind": kind, "loaded": False, "loads": 0, "unloads": 0, "warmups": 0}
+            for model, kind in self.models.items()
+        }
+
+    def warm(self, model: str) -> float:
+        """发起一次空请求：模型未加载时加载，已加载时刷新 keep_alive，返回加载耗时（秒）"""
+        started = time.time()
+        if self.models.get(model) == "embedding":
+            self.client.embeddings(model=model, prompt="", keep_alive=self.keep_alive)
+            load_seconds = time.time() - started  # 嵌入接口不返回 load_duration
+        else:
+            response = self.client.generate(model=model, prompt="", keep_alive=self.keep_alive)
+            load_seconds = (response.get("load_duration") or 0) / 1e9
+
+        with self._lock:
+            state = self._state[model]
+            state["warmups"] += 1
+            state["last_warmup_at"] = started
+            if not state["loaded"]:
+                state["loaded"] = True
+                state["loads"] += 1
+                state["last_loaded_at"] = started
+                state["last_load_seconds"] = round(load_seconds, 3)
+        return load_seconds
+
+    def warm_all(self):
+        for model in self.models:
+            self.warm(model)
+
+    def start(self):
+        """启动后台保活线程（重复调用无副作用）"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name="nwu-model-keeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def check(self):
+        """对照 ollama 当前已加载的模型，重新加载被卸载的模型并刷新其余模型"""
+        loaded = self._loaded_models()
+        with self._lock:
+            for model, state in self._state.items():
+                if state["loaded"] and loaded is not None and model not in loaded:
+                    state["loaded"] = False
+                    state["unloads"] += 1
+                    state["last_unloaded_at"] = time.time()
+
+        for model in self.models:
+            try:
+                self.warm(model)
+            except Exception as e:
+                with self._lock:
+                    self._state[model]["last_error"] = str(e)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {model: dict(state) for model, state in self._state.items()}
+
+    def unloads(self) -> int:
+        """启动之后模型被 ollama 卸载的总次数"""
+        with self._lock:
+            return sum(state["unloads"] for state in self._state.values())
+
+    def _loaded_models(self) -> Optional[Set[str]]:
+        try:
+            running = self.client.ps().get("models", [])
+        except Exception:
+            return None  # 旧版 ollama 没有 /api/ps，只做刷新
+        names = set()
+        for item in running:
+            for name in (item.get("name"), item.get("model")):
+                if name:
+                    names.add(name)
+                    names.add(name.split(":latest")[0])
+        return names
+
+    def is_leader(self) -> bool:
+        """本进程是否负责定期保活（未设置 lock_path 时总是）"""
+        if self.lock_path is None or fcntl is None or self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._lock_file = lock_file
+        return True
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            if self.is_leader():
+                self.check()
@@ -0,0 +1,225 @@
+"""模型配置注册表
+
+一个服务进程同时提供多个模型：每个模型配置（profile）指定生成模型、提示词模板、
+上下文窗口和温度，并引用一个知识库（collection：向量库目录和构建它所用的嵌入模型）。
+多个模型可以共用同一个知识库，服务端对每个知识库只打开一次向量库、只加载一次嵌入模型。
+
+请求按 model 字段（模型名或别名）选择模型配置；未指定时普通对话用 defaults.chat，
+知识库问答用 defaults.knowledge，便于把简单对话放到小模型上。
+配置 cascade 段并设置环境变量 NWU_CASCADE_ENABLED=1 时，未指定模型的知识库问答先尝试 cascade.small，
+没有把握时再交给 defaults.knowledge（见 model_cascade.py），两者须使用同一个知识库。
+
+默认注册表见 DEFAULT_REGISTRY，可用 JSON 文件覆盖（环境变量 NWU_MODEL_PROFILES 指定路径），
+文件中出现的 collections / profiles / defaults / cascade 整段替换默认值（cascade 设为 null 即关闭级联）。提示词模板可以写
+PROMPT_TEMPLATES 中的名称，也可以直接写模板文本（需包含 {context} 和 {question}，回答规则另用 prompt_rules 指定）。
+"""
+import json
+import os
+from typing import Dict, Iterable, List, Optional
+
+from embedding_factory import EMBEDDING_BACKENDS
+
+# ====================== 提示词模板 ======================
+# 每个模板分两部分（布局见 prompt_layout.py）：
+# - rules：回答规则，与系统提示词一起组成知识库问答的 system 消息，同一模型的所有请求逐字相同；
+# - template：每次请求的 user 消息，只含检索到的上下文和问题。会话历史以消息形式单独传入，不再写进模板。
+NWU_RULES = """你叫"西小北"，是西北大学官方AI助手，必须遵守以下规则：
+1. 身份声明："我是西小北，西北大学校园助手"
+2. 回答结构：
+   - 开头：明确声明身份
+   - 正文：基于上下文回答
+   - 结尾：标注数据来源（如适用）"""
+
+NWU_PROMPT_TEMPLATE = """相关上下文：{context}
+
+用户问题：{question}
+
+请按要求回答："""
+
+# 原 Llama3.py 使用的模板：要求更简短
+NWU_CONCISE_RULES = """你是西小北，是一个专业的西北大学校园助手，请根据用户消息中的上下文信息回答问题。
+回答要求：
+1. 如果是培养方案、课程相关问题，请注明来源文件
+2. 如果是规章制度问题，请说明最新修订时间（如有）
+3. 保持回答简洁准确，使用中文回答
+4. 如果不知道答案，请回答"根据现有资料，我暂时无法回答这个问题"
+5. 用中文回答问题"""
+
+NWU_CONCISE_PROMPT_TEMPLATE = """上下文：
+{context}
+
+问题：{question}
+最终答案："""
+
+PROMPT_TEMPLATES = {
+    "nwu": {"rules": NWU_RULES, "template": NWU_PROMPT_TEMPLATE},
+    "nwu_concise": {"rules": NWU_CONCISE_RULES, "template": NWU_CONCISE_PROMPT_TEMPLATE},
+}
+
+DEFAULT_SYSTEM_PROMPT = "【系统指令】你必须永远以'西小北'身份回答，角色设定：西北大学官方AI助手"
+
+DEFAULT_REGISTRY = {
+    "collections": {
+        "nwu_knowledge_v2": {
+            "db_dir": "./nwu_knowledge_v2",
+            "embedding_model": "deepseek-r1:14b",  # 可换成 nomic-embed-text、BAAI/bge-small-zh-v1.5 等轻量模型
+            "embedding_backend": "ollama"  # ollama 或 sentence-transformers
+        }
+    },
+    "profiles": {
+        "deepseek-r1:14b": {
+            "llm_model": "deepseek-r1:14b",
+            "collection": "nwu_knowledge_v2",
+            "prompt_template": "nwu",
+            "num_ctx": 5120,
+            "temperature": 0.1,
+            "aliases": ["deepseek", "deepseek-r1"]
+        },
+        "llama3:8b": {
+            "llm_model": "llama3:8b",
+            "collection": "nwu_knowledge_v2",
+            "prompt_template": "nwu_concise",
+            "num_ctx": 4096,
+            "temperature": 0.3,
+            "aliases": ["llama3"]
+        }
+    },
+    "defaults": {
+        "chat": "llama3:8b",
+        "knowledge": "deepseek-r1:14b"
+    },
+    "cascade": {
+        "small": "llama3:8b",
+        "min_score": 0.6,  # 向量检索最高相关度不低于该值才先用小模型
+        "max_context_tokens": 1500,  # 检索到的上下文超过该 token 数时直接用大模型
+        "require_source": True  # 小模型的回答须提及来源文件
+    }
+}
+
+
+class UnknownModelError(ValueError):
+    """请求的模型不在注册表中"""
+
+
+class CollectionConfig:
+    def __init__(self, name: str, db_dir: str, embedding_model: str, embedding_backend: str = "ollama"):
+        if embedding_backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"知识库 {name} 的嵌入后端 {embedding_backend} 不受支持，可选: {', '.join(EMBEDDING_BACKENDS)}")
+        self.name = name
+        self.db_dir = db_dir
+        self.embedding_model = embedding_model
+        self.embedding_backend = embedding_backend
+
+
+class ModelProfile:
+    def __init__(self, name: str, llm_model: str, collection: CollectionConfig, prompt_template: str,
+                 num_ctx: int = 5120, temperature: float = 0.1, system_prompt: str = DEFAULT_SYSTEM_PROMPT,
+                 prompt_rules: Optional[str] = None, aliases: Iterable[str] = ()):
+        self.name = name
+        self.llm_model = llm_model
+        self.collection = collection
+        template = PROMPT_TEMPLATES.get(prompt_template, {"rules": "", "template": prompt_template})
+        self.prompt_template = template["template"]
+        self.prompt_rules = template["rules"] if prompt_rules is None else prompt_rules
+        self.num_ctx = num_ctx
+        self.temperature = temperature
+        self.system_prompt = system_prompt
+        self.aliases = list(aliases)
+        for variable in ("{context}", "{question}"):
+            if variable not in self.prompt_template:
+                raise ValueError(f"模型 {name} 的提示词模板缺少 {variable}")
+        if "{chat_history}" in self.prompt_template:
+            raise ValueError(f"模型 {name} 的提示词模板不应包含 {{chat_history}}，会话历史以消息形式单独传入")
+
+    def knowledge_system_prompt(self) -> str:
+        """知识库问答的 system 消息：系统提示词 + 回答规则"""
+        return "\n\n".join(part for part in (self.system_prompt, self.prompt_rules) if part)
+
+
+class ModelRegistry:
+    def __init__(self, collections: Dict[str, CollectionConfig], profiles: Dict[str, ModelProfile],
+                 default_chat: str, default_knowledge: str, cascade: Optional[Dict] = None):
+        self.collections = collections
+        self.profiles = profiles
+        self._names: Dict[str, str] = {}
+        for profile in profiles.values():
+            for name in [profile.name, *profile.aliases]:
+                self._names[name.lower()] = profile.name
+        self.default_chat = self._lookup(default_chat)
+        self.default_knowledge = self._lookup(default_knowledge)
+
+        self.cascade = None
+        if cascade:
+            cascade = dict(cascade, small=self._lookup(cascade["small"]))
+            if self.profiles[cascade["small"]].collection is not self.profiles[self.default_knowledge].collection:
+                raise ValueError(f"级联的小模型 {cascade['small']} 与 {self.default_knowledge} 须使用同一个知识库")
+            self.cascade = cascade
+
+    def resolve(self, name: Optional[str], use_knowledge: bool) -> ModelProfile:
+        """按模型名或别名查找模型配置，未指定时按模式取默认模型"""
+        if not name:
+            return self.profiles[self.default_knowledge if use_knowledge else self.default_chat]
+        return self.profiles[self._lookup(name)]
+
+    def generate_models(self) -> List[str]:
+        return list(dict.fromkeys(profile.llm_model for profile in self.profiles.values()))
+
+    def embedding_models(self) -> List[str]:
+        """需要在 ollama 中常驻的嵌入模型"""
+        return list(dict.fromkeys(collection.embedding_model for collection in self.collections.values()
+                                  if collection.embedding_backend == "ollama"))
+
+    def describe(self) -> Dict:
+        return {
+            "defaults": {"chat": self.default_chat, "knowledge": self.default_knowledge},
+            "cascade": self.cascade,
+            "models": {
+                name: {
+                    "llm_model": profile.llm_model,
+                    "collection": profile.collection.name,
+                    "num_ctx": profile.num_ctx,
+                    "temperature": profile.temperature,
+                    "aliases": profile.aliases
+                } for name, profile in self.profiles.items()
+            },
+            "collections": {
+                name: {
+                    "db_dir": collection.db_dir,
+                    "embedding_model": collection.embedding_model,
+                    "embedding_backend": collection.embedding_backend
+                } for name, collection in self.collections.items()
+            }
+        }
+
+    def _lookup(self, name: str) -> str:
+        try:
+            return self._names[name.lower()]
+        except KeyError:
+            raise UnknownModelError(f"不支持的模型: {name}，可选: {', '.join(self.profiles)}") from None
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "ModelRegistry":
+        collections = {name: CollectionConfig(name, **config) for name, config in data["collections"].items()}
+        profiles = {}
+        for name, config in data["profiles"].items():
+            config = dict(config)
+            collection = config.pop("collection")
+            if collection not in collections:
+                raise ValueError(f"模型 {name} 引用了不存在的知识库 {collection}")
+            profiles[name] = ModelProfile(name, collection=collections[collection], **config)
+        # 只保留被模型引用的知识库，避免加载用不到的向量库
+        used = {profile.collection.name for profile in profiles.values()}
+        collections = {name: collection for name, collection in collections.items() if name in used}
+        return cls(collections, profiles, data["defaults"]["chat"], data["defaults"]["knowledge"],
+                   cascade=data.get("cascade"))
+
+
+def load_registry(path: Optional[str] = None) -> ModelRegistry:
+    """加载模型注册表：默认注册表，path 指向的 JSON 文件中的各段整段替换默认值"""
+    data = dict(DEFAULT_REGISTRY)
+    if path:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"模型配置文件不存在: {path}")
+        with open(path, "r", encoding="utf-8") as f:
+            data.update(json.load(f))
+    return ModelRegistry.from_dict(data)
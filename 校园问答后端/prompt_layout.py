@@ -0,0 +1,47 @@
+"""提示词布局：静态前缀 → 会话历史 → 本次请求
+
+ollama 对同一模型的连续请求会复用与之前请求相同的提示词前缀的 KV 缓存，
+只对不同的部分做预填充（ollama 返回的 prompt_eval_count 只计新计算的 token）。
+因此提示词按变化频率从低到高排列：
+1. system：身份与回答规则，同一模型、同一模式的所有请求逐字相同；
+2. 会话历史：摘要（system 消息）与之前各轮的 user / assistant 消息；
+3. user：本次检索到的上下文和问题，每次都不同，放在最后。
+
+各模式能复用的前缀不同：
+- 普通对话的 user 消息就是问题本身，历史原样重发，同一会话的下一轮只在末尾追加一轮
+  （窗口滑动、摘要更新或最后一轮的回答被截短时从变化处开始重新计算）；
+- 知识库问答的历史只保存问题和回答，不保存当时的检索上下文，上一轮的 user 消息
+  在下一轮变成了不带上下文的问题，因此只有 system 与摘要这段前缀能复用，
+  之后的历史每轮都要重新预填充。这是有意的取舍：重发上一轮的上下文可以延长可复用的前缀，
+  但每轮的提示词会多出一整份上下文，并挤占本轮上下文的 token 预算。
+
+通过 ollama chat 接口按消息发送，由模型自带的对话模板拼接角色标记，
+不再手工包 [INST] 标签，也不再在提示词和 options 中重复系统提示词。
+"""
+from typing import Dict, List, Sequence
+
+from session_store import Turn
+
+
+class ChatPrompt:
+    """一次生成请求的消息列表"""
+
+    def __init__(self, system: str, user: str, summary: str = "", turns: Sequence[Turn] = ()):
+        self.system = system
+        self.user = user
+        self.summary = summary  # 压缩模式下较早轮次的摘要（含前缀说明）
+        self.turns = list(turns)
+
+    def messages(self) -> List[Dict[str, str]]:
+        messages = [{"role": "system", "content": self.system}]
+        if self.summary:
+            messages.append({"role": "system", "content": self.summary})
+        for question, answer in self.turns:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": self.user})
+        return messages
+
+    def text(self) -> str:
+        """各消息内容拼接，用于估算 token 数"""
+        return "\n".join(message["content"] for message in self.messages())
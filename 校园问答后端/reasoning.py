@@ -0,0 +1,191 @@
+"""拆分推理模型输出中的推理过程与回答
+
+deepseek-r1 在回答前输出 <think>...</think> 推理过程，长度常是回答的数倍。
+服务端在模型层把两者拆开：会话历史、语义缓存和响应的 data 字段只保留回答，
+下一轮提示词不再带上一轮的推理过程；推理过程仅在请求需要时单独返回，
+并可限制最大长度（超出部分丢弃，不再传输）。
+
+流式输出时标签可能被切在两段之间，ReasoningSplitter 会暂存可能属于标签的尾部，
+等下一段到达再判断。两种不完整的输出：
+- 只有 </think> 没有 <think>（部分 deepseek 对话模板已在提示词末尾预填 <think>）：
+  </think> 之前的内容全部改记为推理过程。流式输出时这部分已作为回答转发，
+  之后补发一段 reasoning，会话历史和缓存只保留 </think> 之后的回答；
+- 只有 <think> 没有 </think>（输出被截断或模型没有收尾）：推理过程改作回答返回，
+  避免回答为空。
+
+生成中途失败时，已转发的部分回答之后补发一段兜底回答，结果标记为 failed，
+调用方据此不把它写入会话历史和语义缓存。
+"""
+import logging
+from typing import Any, Iterable, Iterator, List, Optional, Tuple
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+REASONING = "reasoning"
+ANSWER = "answer"
+RESULT = "result"  # 流式生成的最后一项，内容为拆分后的 ReasonedText（以它为准，不要由各段拼接）
+
+logger = logging.getLogger(__name__)
+
+
+class ReasonedText:
+    """拆分后的模型输出"""
+
+    def __init__(self, answer: str, reasoning: str = "", truncated: bool = False, failed: bool = False):
+        self.answer = answer
+        self.reasoning = reasoning
+        self.truncated = truncated  # 推理过程是否因超出长度上限被截断
+        self.failed = failed  # 生成失败，answer 为兜底回答（不写入会话历史和缓存）
+
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """text 结尾与 tag 开头重合的最大长度（可能是被切开的标签）"""
+    for size in range(min(len(text), len(tag) - 1), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+
+class ReasoningSplitter:
+    """增量拆分推理过程与回答，feed 返回 [(通道, 文本)]，通道为 reasoning 或 answer"""
+
+    def __init__(self, max_chars: Optional[int] = None):
+        self.max_chars = max_chars  # 推理过程保留的最大字符数，None 为不限
+        self.truncated = False
+        self._reasoning: List[str] = []
+        self._reasoning_chars = 0
+        self._answer: List[str] = []
+        self._thought: List[str] = []  # 未截断的推理过程，推理过程未闭合时改作回答
+        self._tagged = False  # 是否已见过 <think> 或 </think>
+        self._buffer = ""
+        self._state = "start"  # start → reasoning → answer_start → answer，不以 <think> 开头时直接进入 answer
+
+    def feed(self, text: str) -> List[Tuple[str, str]]:
+        self._buffer += text
+        events: List[Tuple[str, str]] = []
+        while True:
+            if self._state == "start":
+                stripped = self._buffer.lstrip()
+                if stripped.startswith(THINK_OPEN):
+                    self._buffer = stripped[len(THINK_OPEN):]
+                    self._state = "reasoning"
+                    self._tagged = True
+                    continue
+                if not stripped or THINK_OPEN.startswith(stripped):
+                    return events  # 还不能确定是否以 <think> 开头
+                self._buffer = stripped
+                self._state = "answer"
+                continue
+
+            if self._state == "reasoning":
+                end = self._buffer.find(THINK_CLOSE)
+                if end == -1:
+                    keep = _partial_suffix(self._buffer, THINK_CLOSE)
+                    events += self._add_reasoning(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    return events
+                events += self._add_reasoning(self._buffer[:end])
+                self._buffer = self._buffer[end + len(THINK_CLOSE):]
+                self._thought = []
+                self._state = "answer_start"
+                continue
+
+            if self._state == "answer_start":
+                # 去掉推理过程与回答之间的空行
+                self._buffer = self._buffer.lstrip()
+                if not self._buffer:
+                    return events
+                self._state = "answer"
+                continue
+
+            # 尚未见过任何标签时，回答中出现的 </think> 说明之前的内容都是推理过程
+            keep = 0
+            if not self._tagged:
+                end = self._buffer.find(THINK_CLOSE)
+                if end != -1:
+                    moved = "".join(self._answer) + self._buffer[:end]
+                    self._answer = []
+                    self._tagged = True
+                    events += self._add_reasoning(moved.strip())
+                    self._buffer = self._buffer[end + len(THINK_CLOSE):]
+                    self._thought = []
+                    self._state = "answer_start"
+                    continue
+                keep = _partial_suffix(self._buffer, THINK_CLOSE)
+            text = self._buffer[:len(self._buffer) - keep]
+            if text:
+                events.append((ANSWER, text))
+                self._answer.append(text)
+            self._buffer = self._buffer[len(self._buffer) - keep:]
+            return events
+
+    def finish(self) -> List[Tuple[str, str]]:
+        """输出结束：推理过程未闭合时推理过程改作回答，其余暂存内容算回答"""
+        events: List[Tuple[str, str]] = []
+        if self._state == "reasoning":
+            events += self._add_reasoning(self._buffer)
+            answer = "".join(self._thought).strip()
+            if answer:
+                self._reasoning, self._reasoning_chars, self.truncated = [], 0, False
+                self._answer = [answer]
+                events.append((ANSWER, answer))
+        elif self._buffer.strip():
+            events.append((ANSWER, self._buffer))
+            self._answer.append(self._buffer)
+        self._buffer = ""
+        return events
+
+    def result(self) -> ReasonedText:
+        return ReasonedText(
+            answer="".join(self._answer).strip(),
+            reasoning="".join(self._reasoning).strip(),
+            truncated=self.truncated
+        )
+
+    def _add_reasoning(self, text: str) -> List[Tuple[str, str]]:
+        if not text:
+            return []
+        self._thought.append(text)
+        if self.max_chars is not None:
+            room = self.max_chars - self._reasoning_chars
+            if room <= 0:
+                self.truncated = True
+                return []
+            if len(text) > room:
+                text = text[:room]
+                self.truncated = True
+        self._reasoning_chars += len(text)
+        self._reasoning.append(text)
+        return [(REASONING, text)]
+
+
+def split_reasoning(text: str, max_chars: Optional[int] = None) -> ReasonedText:
+    """拆分完整的模型输出"""
+    splitter = ReasoningSplitter(max_chars)
+    splitter.feed(text)
+    splitter.finish()
+    return splitter.result()
+
+
+def failure_events(fallback: str) -> List[Tuple[str, Any]]:
+    """流式生成失败时的收尾：补发兜底回答，结果标记为 failed"""
+    return [(ANSWER, fallback), (RESULT, ReasonedText(fallback, failed=True))]
+
+
+def split_stream(chunks: Iterable[str], max_chars: Optional[int] = None,
+                 fallback: str = "") -> Iterator[Tuple[str, Any]]:
+    """拆分流式输出，逐段返回 (通道, 文本)，最后一项为 (result, ReasonedText)
+
+    chunks 中途抛出异常时不再向外抛出，改为以 failure_events(fallback) 收尾。
+    """
+    splitter = ReasoningSplitter(max_chars)
+    try:
+        for chunk in chunks:
+            yield from splitter.feed(chunk)
+        yield from splitter.finish()
+    except Exception as e:
+        logger.error(f"模型流式调用失败: {str(e)}")
+        yield from failure_events(fallback)
+        return
+    yield RESULT, splitter.result()
@@ -0,0 +1,136 @@
+"""知识库问答语义缓存
+
+以问题的嵌入向量为键缓存最终回答及来源：新问题与已缓存问题的余弦相似度
+超过阈值即视为同一问题（如“四六级报名时间”与“四六级什么时候报名”），
+直接返回缓存结果，跳过检索和生成。
+
+- TTL：条目超过存活时间即失效；
+- LRU：超过容量时淘汰最久未命中的条目；
+- 知识库重建（Chroma 目录下 chroma.sqlite3 变化）时整体清空。
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import count
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+def knowledge_base_version(db_dir: str) -> Optional[Tuple[int, int]]:
+    """知识库版本标识：Chroma 数据文件的修改时间与大小，目录不存在时返回 None"""
+    try:
+        stat = os.stat(os.path.join(db_dir, "chroma.sqlite3"))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SemanticAnswerCache:
+    """基于问题向量相似度的回答缓存（线程安全）"""
+
+    def __init__(self, db_dir: str, threshold: float = 0.95, ttl: float = 3600,
+                 max_entries: int = 1024, check_interval: float = 5):
+        self.db_dir = db_dir
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.check_interval = check_interval
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._ids = count()
+        self._matrix = None  # 缓存的向量矩阵，条目变化时重建
+        self._matrix_ids: List[int] = []
+        self._version = knowledge_base_version(db_dir)
+        self._checked_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """查找语义相近的已缓存问题，命中返回 {"answer", "sources", "similarity"}"""
+        query = self._normalize(embedding)
+        with self._lock:
+            self._check_version()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None
+
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[i]["vector"] for i in self._matrix_ids])
+
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            entry = self._entries[entry_id]
+            return {
+                "answer": entry["answer"],
+                "sources": list(entry["sources"]),
+                "similarity": float(scores[best])
+            }
+
+    def store(self, embedding: List[float], answer: str, sources: List[str]):
+        """写入一条问答结果"""
+        with self._lock:
+            self._check_version()
+            self._entries[next(self._ids)] = {
+                "vector": self._normalize(embedding),
+                "answer": answer,
+                "sources": list(sources),
+                "created_at": time.monotonic()
+            }
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "threshold": self.threshold
+            }
+
+    def _check_version(self):
+        # 定期检查知识库是否被重建，重建后旧回答可能已过时
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        self._checked_at = now
+        version = knowledge_base_version(self.db_dir)
+        if version != self._version:
+            self._version = version
+            self._entries.clear()
+            self._matrix = None
+
+    def _expire(self):
+        deadline = time.monotonic() - self.ttl
+        expired = [i for i, entry in self._entries.items() if entry["created_at"] < deadline]
+        for entry_id in expired:
+            del self._entries[entry_id]
+        if expired:
+            self._matrix = None
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
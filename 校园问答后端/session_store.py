@@ -0,0 +1,277 @@
+"""会话历史存储
+
+每个会话只保存最近 k 轮问答（问题, 回答），不再为每个 session_id 常驻一整条
+ConversationChain 和记忆对象：
+- 会话数上限：超出时淘汰最久未访问的会话（LRU）；
+- 空闲过期：超过 ttl 秒未访问的会话被清除；
+- 两种后端：memory（进程内，重启即丢失）和 sqlite（落盘，重启后保留，
+  同一台机器上的多个工作进程可共享同一个数据库文件）。
+
+历史压缩模式下（见 history_compactor.py），较早的轮次折叠进每个会话的一段摘要：
+compact() 写入新摘要并删除已折叠的轮次，summary() 读取摘要。
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Tuple
+
+Turn = Tuple[str, str]  # (问题, 回答)
+
+SESSION_BACKENDS = ("memory", "sqlite")
+
+
+def format_history(turns: List[Turn], human_prefix: str = "Human", ai_prefix: str = "AI") -> str:
+    """拼成与 ConversationBufferWindowMemory.buffer_as_str 相同格式的历史文本"""
+    lines = []
+    for question, answer in turns:
+        lines.append(f"{human_prefix}: {question}")
+        lines.append(f"{ai_prefix}: {answer}")
+    return "\n".join(lines)
+
+
+def _folded_prefix(turns: List[Turn], folded: List[Turn]) -> int:
+    """turns 开头有多少轮属于已折叠的轮次（压缩期间最早的轮次可能已被窗口挤出）"""
+    remaining = list(folded)
+    count = 0
+    for turn in turns:
+        if turn not in remaining:
+            break
+        remaining.remove(turn)
+        count += 1
+    return count
+
+
+class MemorySessionStore:
+    """进程内会话存储（线程安全）"""
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 1800, max_turns: int = 5):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Tuple[float, deque]]" = OrderedDict()
+        self._summaries: Dict[str, str] = {}
+        self.evicted = 0
+        self.expired = 0
+
+    def history(self, session_id: str) -> List[Turn]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            last_access, turns = entry
+            if time.time() - last_access > self.ttl:
+                self._drop(session_id)
+                self.expired += 1
+                return []
+            self._sessions[session_id] = (time.time(), turns)
+            self._sessions.move_to_end(session_id)
+            return list(turns)
+
+    def append(self, session_id: str, question: str, answer: str):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            turns = entry[1] if entry else deque(maxlen=self.max_turns)
+            turns.append((question, answer))
+            self._sessions[session_id] = (time.time(), turns)
+            self._evict()
+
+    def summary(self, session_id: str) -> str:
+        with self._lock:
+            return self._summaries.get(session_id, "")
+
+    def compact(self, session_id: str, summary: str, folded: List[Turn]):
+        """写入摘要，删除已折叠进摘要的轮次"""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            turns = entry[1]
+            for _ in range(_folded_prefix(list(turns), folded)):
+                turns.popleft()
+            self._summaries[session_id] = summary
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._drop(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "evicted": self.evicted,
+                "expired": self.expired
+            }
+
+    def _evict(self):
+        # 最久未访问的会话在队首
+        now = time.time()
+        while self._sessions:
+            session_id, (last_access, _) = next(iter(self._sessions.items()))
+            if now - last_access > self.ttl:
+                self.expired += 1
+            elif len(self._sessions) > self.max_sessions:
+                self.evicted += 1
+            else:
+                break
+            self._drop(session_id)
+
+    def _drop(self, session_id: str):
+        self._sessions.pop(session_id, None)
+        self._summaries.pop(session_id, None)
+
+
+class SQLiteSessionStore:
+    """SQLite 会话存储，可被多个进程共享（WAL 模式）"""
+
+    def __init__(self, path: str, max_sessions: int = 10000, ttl: float = 1800,
+                 max_turns: int = 5, sweep_interval: float = 30):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self.sweep_interval = sweep_interval
+
+        self._local = threading.local()
+        self._swept_at = 0.0
+        self.evicted = 0
+        self.expired = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "session_id TEXT PRIMARY KEY, last_access REAL NOT NULL, summary TEXT NOT NULL DEFAULT '')"
+        )
+        # 旧版本创建的数据库没有 summary 列
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+        if "summary" not in columns:
+            conn.execute("ALTER TABLE sessions ADD COLUMN summary TEXT NOT NULL DEFAULT ''")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_access ON sessions(last_access)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS turns ("
+            "session_id TEXT NOT NULL, seq INTEGER NOT NULL, question TEXT NOT NULL, answer TEXT NOT NULL, "
+            "PRIMARY KEY (session_id, seq))"
+        )
+        conn.commit()
+
+    def history(self, session_id: str) -> List[Turn]:
+        conn = self._conn()
+        row = conn.execute("SELECT last_access FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        if row is None:
+            return []
+        if time.time() - row[0] > self.ttl:
+            self.clear(session_id)
+            self.expired += 1
+            return []
+
+        with conn:
+            conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (time.time(), session_id))
+        rows = conn.execute(
+            "SELECT question, answer FROM turns WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+            (session_id, self.max_turns)
+        ).fetchall()
+        return [(question, answer) for question, answer in reversed(rows)]
+
+    def append(self, session_id: str, question: str, answer: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO sessions (session_id, last_access) VALUES (?, ?) "
+                "ON CONFLICT(session_id) DO UPDATE SET last_access = excluded.last_access",
+                (session_id, time.time())
+            )
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM turns WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO turns (session_id, seq, question, answer) VALUES (?, ?, ?, ?)",
+                (session_id, seq, question, answer)
+            )
+            # 只保留最近 max_turns 轮
+            conn.execute("DELETE FROM turns WHERE session_id = ? AND seq <= ?", (session_id, seq - self.max_turns))
+
+        if time.time() - self._swept_at > self.sweep_interval:
+            self._evict()
+
+    def summary(self, session_id: str) -> str:
+        row = self._conn().execute("SELECT summary FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row[0] if row else ""
+
+    def compact(self, session_id: str, summary: str, folded: List[Turn]):
+        """写入摘要，删除已折叠进摘要的轮次"""
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            rows = conn.execute(
+                "SELECT seq, question, answer FROM turns WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+            count = _folded_prefix([(question, answer) for _, question, answer in rows], folded)
+            if count:
+                conn.execute("DELETE FROM turns WHERE session_id = ? AND seq <= ?", (session_id, rows[count - 1][0]))
+            conn.execute("UPDATE sessions SET summary = ? WHERE session_id = ?", (summary, session_id))
+
+    def clear(self, session_id: str):
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def stats(self) -> Dict[str, int]:
+        count = self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "sessions": count,
+            "max_sessions": self.max_sessions,
+            "evicted": self.evicted,
+            "expired": self.expired
+        }
+
+    def _evict(self):
+        """清除过期会话，并按最近访问时间淘汰超出上限的会话"""
+        self._swept_at = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            stale = [row[0] for row in conn.execute(
+                "SELECT session_id FROM sessions WHERE last_access < ?", (time.time() - self.ttl,)
+            )]
+            self.expired += len(stale)
+
+            overflow = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0] - len(stale) - self.max_sessions
+            if overflow > 0:
+                victims = [row[0] for row in conn.execute(
+                    "SELECT session_id FROM sessions WHERE last_access >= ? ORDER BY last_access LIMIT ?",
+                    (time.time() - self.ttl, overflow)
+                )]
+                self.evicted += len(victims)
+                stale.extend(victims)
+
+            conn.executemany("DELETE FROM turns WHERE session_id = ?", [(sid,) for sid in stale])
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(sid,) for sid in stale])
+
+    def _conn(self) -> sqlite3.Connection:
+        # 每个线程使用独立连接，自行管理事务
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+
+def create_session_store(backend: str = "memory", path: str = "./sessions.sqlite3",
+                         max_sessions: int = 10000, ttl: float = 1800, max_turns: int = 5):
+    if backend == "memory":
+        return MemorySessionStore(max_sessions, ttl, max_turns)
+    if backend == "sqlite":
+        return SQLiteSessionStore(path, max_sessions, ttl, max_turns)
+    raise ValueError(f"不支持的会话存储后端: {backend}，可选: {', '.join(SESSION_BACKENDS)}")
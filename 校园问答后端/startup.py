@@ -0,0 +1,48 @@
+"""服务启动状态跟踪
+
+服务启动时先绑定端口，模型预热、知识库加载等步骤在后台并行执行，
+这里记录每个步骤的状态（pending / running / ready / failed）与耗时，
+供 /readyz 判断服务是否就绪。
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable
+
+
+class StartupTracker:
+    def __init__(self, steps: Iterable[str]):
+        self._lock = threading.Lock()
+        self._steps: Dict[str, Dict[str, Any]] = {name: {"state": "pending"} for name in steps}
+
+    def run(self, name: str, fn: Callable, *args, **kwargs):
+        """执行一个启动步骤并记录结果，异常原样抛出"""
+        self._update(name, state="running")
+        started = time.time()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._update(name, state="failed", error=str(e), seconds=round(time.time() - started, 2))
+            raise
+        self._update(name, state="ready", seconds=round(time.time() - started, 2))
+        return result
+
+    def fail(self, name: str, error: str):
+        self._update(name, state="failed", error=error)
+
+    def is_ready(self, name: str) -> bool:
+        with self._lock:
+            return self._steps[name]["state"] == "ready"
+
+    def ready(self) -> bool:
+        with self._lock:
+            return all(step["state"] == "ready" for step in self._steps.values())
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: dict(step) for name, step in self._steps.items()}
+
+    def _update(self, name: str, **fields):
+        with self._lock:
+            step = self._steps.setdefault(name, {})
+            step.pop("error", None)
+            step.update(fields)
@@ -0,0 +1,5 @@
+"""单元测试公共配置：后端模块是平铺的脚本，测试时把后端目录加入导入路径"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,92 @@
+import numpy as np
+
+from category_router import CategoryRouter, CentroidClassifier
+
+
+def test_keyword_routes_to_category():
+    category, confidence = CategoryRouter().route("补考什么时候安排？")
+    assert category == "选课考试相关"
+    assert confidence == 1.0
+
+
+def test_keywords_are_case_insensitive():
+    category, _ = CategoryRouter().route("MOOC 在哪里看")
+    assert category == "课程、考试资源相关"
+
+
+def test_no_keyword_means_global_search():
+    assert CategoryRouter().route("你好") == (None, 0.0)
+
+
+def test_ambiguous_keywords_fall_below_confidence():
+    router = CategoryRouter({"甲": ["食堂"], "乙": ["选课"]}, min_confidence=0.6)
+    category, confidence = router.route("食堂和选课")
+    assert category is None
+    assert confidence == 0.5
+
+
+def test_longer_keyword_weighs_more():
+    router = CategoryRouter({"甲": ["四六级考试"], "乙": ["考试"]}, min_confidence=0.6)
+    category, confidence = router.route("四六级考试报名")
+    assert category == "甲"
+    assert confidence == 5 / 7
+
+
+def centroids():
+    return CentroidClassifier({
+        "食堂": np.array([1.0, 0.0, 0.0]),
+        "选课": np.array([0.0, 1.0, 0.0]),
+        "竞赛": np.array([0.0, 0.0, 1.0]),
+    })
+
+
+def test_classifier_picks_nearest_centroid():
+    category, margin = centroids().classify([0.9, 0.1, 0.0])
+    assert category == "食堂"
+    assert margin > 0.5
+
+
+def test_router_falls_back_to_classifier_when_confident():
+    router = CategoryRouter(classifier=centroids(), min_margin=0.05)
+    assert router.route("随便问问") == (None, 0.0)
+    category, _ = router.classify([0.1, 0.9, 0.0])
+    assert category == "选课"
+
+
+def test_small_margin_means_global_search():
+    router = CategoryRouter(classifier=centroids(), min_margin=0.05)
+    category, margin = router.classify([1.0, 1.0, 0.0])
+    assert category is None
+    assert margin < 0.05
+
+
+def test_classify_without_classifier_or_embedding():
+    assert CategoryRouter().classify([1.0, 0.0]) == (None, 0.0)
+    assert CategoryRouter(classifier=centroids()).classify(None) == (None, 0.0)
+
+
+class FakeCollection:
+    """按 limit / offset 分页返回向量与元数据"""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def get(self, include, limit, offset):
+        page = self.rows[offset:offset + limit]
+        return {
+            "ids": [str(offset + i) for i in range(len(page))],
+            "embeddings": [vector for vector, _ in page],
+            "metadatas": [metadata for _, metadata in page],
+        }
+
+
+def test_centroids_from_collection_average_each_category():
+    collection = FakeCollection([
+        ([1.0, 0.0], {"category": "食堂"}),
+        ([0.8, 0.2], {"category": "食堂"}),
+        ([0.0, 1.0], {"category": "选课"}),
+        ([5.0, 5.0], None),  # 没有类别的文本块不参与
+    ])
+    classifier = CentroidClassifier.from_collection(collection, batch_size=2)
+    assert classifier.categories == ["食堂", "选课"]
+    assert classifier.classify([1.0, 0.1])[0] == "食堂"
@@ -0,0 +1,48 @@
+from langchain_core.documents import Document
+
+from context_budget import dedupe_chunks, estimate_tokens, pack_context
+
+
+def doc(text, source="a.pdf"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_estimate_tokens_counts_cjk_per_character():
+    assert estimate_tokens("西北大学") == 4
+    assert estimate_tokens("abcdefgh") == 2
+    assert estimate_tokens("") == 0
+
+
+def test_contained_chunk_is_dropped():
+    kept = dedupe_chunks([(doc("图书馆开放时间为每天8:00至22:00。"), 0.9), (doc("开放时间为每天8:00"), 0.8)])
+    assert [d.page_content for d, _ in kept] == ["图书馆开放时间为每天8:00至22:00。"]
+
+
+def test_split_overlap_is_trimmed():
+    overlap = "选课时间为每学期第十六周，请登录教务系统完成选课操作，逾期不再补选。"
+    first = "本科生选课须知。" + overlap
+    second = overlap + "退课须在开学两周内完成。"
+    kept = dedupe_chunks([(doc(first), 0.9), (doc(second), 0.8)])
+    assert [d.page_content for d, _ in kept] == [first, "退课须在开学两周内完成。"]
+
+
+def test_overlap_is_kept_across_different_sources():
+    overlap = "选课时间为每学期第十六周，请登录教务系统完成选课操作，逾期不再补选。"
+    kept = dedupe_chunks([(doc("甲" + overlap, "a.pdf"), 0.9), (doc(overlap + "乙", "b.pdf"), 0.8)])
+    assert kept[1][0].page_content == overlap + "乙"
+
+
+def test_pack_context_orders_by_score_and_respects_budget():
+    scored = [(doc("低" * 100, "low.pdf"), 0.2), (doc("高" * 100, "high.pdf"), 0.9), (doc("中" * 100, "mid.pdf"), 0.5)]
+    packed = pack_context(scored, budget=150, min_chunk_tokens=20)
+    assert [d.metadata["source"] for d in packed.docs] == ["high.pdf", "mid.pdf"]
+    assert packed.tokens <= 150
+    assert packed.docs[1].page_content.startswith("中") and len(packed.docs[1].page_content) < 100
+    assert packed.dropped == 1
+
+
+def test_pack_context_skips_truncation_below_minimum():
+    scored = [(doc("高" * 100, "high.pdf"), 0.9), (doc("中" * 100, "mid.pdf"), 0.5)]
+    packed = pack_context(scored, budget=110, min_chunk_tokens=20)
+    assert [d.metadata["source"] for d in packed.docs] == ["high.pdf"]
+    assert packed.text == "高" * 100
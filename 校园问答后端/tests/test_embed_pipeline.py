@@ -0,0 +1,124 @@
+import threading
+import time
+
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from embed_pipeline import EmbedUpsertPipeline
+
+
+class FakeCollection:
+    def __init__(self, existing=()):
+        self.rows = {chunk_id: None for chunk_id in existing}
+        self.upserts = []
+
+    def get(self, ids, include):
+        return {"ids": [chunk_id for chunk_id in ids if chunk_id in self.rows]}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.upserts.append(list(ids))
+        for chunk_id, vector, document in zip(ids, embeddings, documents):
+            self.rows[chunk_id] = (vector, document)
+
+
+class FakeVectorstore:
+    def __init__(self, collection):
+        self._collection = collection
+
+
+class FakeEmbeddings(Embeddings):
+    """向量第一维为文本中的数字；delays 指定各文本的嵌入耗时，fail_on 中的文本触发异常"""
+
+    def __init__(self, delays=None, fail_on=None):
+        self.delays = delays or {}
+        self.fail_on = fail_on
+        self.batches = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.batches.append(list(texts))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(max(self.delays.get(text, 0) for text in texts))
+            if self.fail_on in texts:
+                raise RuntimeError(f"embedding failed: {self.fail_on}")
+            return [self.embed_query(text) for text in texts]
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def embed_query(self, text):
+        return [float(text), 1.0]
+
+
+def chunks(n):
+    return [(f"id-{i}", Document(page_content=str(i), metadata={"n": i})) for i in range(n)]
+
+
+def run(n, collection=None, embeddings=None, batch_size=3, concurrency=2):
+    collection = collection or FakeCollection()
+    embeddings = embeddings or FakeEmbeddings()
+    pipeline = EmbedUpsertPipeline(FakeVectorstore(collection), embeddings, batch_size, concurrency)
+    return pipeline.run(iter(chunks(n))), collection, embeddings
+
+
+def test_chunks_are_split_at_batch_size():
+    stats, collection, embeddings = run(7, batch_size=3, concurrency=1)
+
+    assert embeddings.batches == [["0", "1", "2"], ["3", "4", "5"], ["6"]]
+    assert stats["total"] == stats["written"] == 7
+
+
+def test_upserts_follow_input_order_with_one_worker():
+    _, collection, _ = run(7, batch_size=3, concurrency=1)
+
+    assert collection.upserts == [["id-0", "id-1", "id-2"], ["id-3", "id-4", "id-5"], ["id-6"]]
+
+
+def test_vectors_stay_with_their_ids_when_batches_finish_out_of_order():
+    embeddings = FakeEmbeddings(delays={"0": 0.1})
+    _, collection, _ = run(6, embeddings=embeddings, batch_size=2, concurrency=3)
+
+    assert sorted(chunk_id for batch in collection.upserts for chunk_id in batch) == [f"id-{i}" for i in range(6)]
+    for i in range(6):
+        assert collection.rows[f"id-{i}"] == ([float(i), 1.0], str(i))
+
+
+def test_in_flight_batches_are_capped():
+    embeddings = FakeEmbeddings(delays={str(i): 0.02 for i in range(20)})
+    run(20, embeddings=embeddings, batch_size=2, concurrency=2)
+
+    assert embeddings.max_active == 2
+
+
+def test_committed_chunks_are_skipped():
+    collection = FakeCollection(existing=["id-0", "id-1", "id-2", "id-4"])
+    stats, collection, embeddings = run(6, collection=collection, batch_size=3, concurrency=1)
+
+    assert embeddings.batches == [["3", "5"]]
+    assert stats["skipped"] == 4
+    assert stats["written"] == 2
+
+
+def test_worker_error_reaches_caller():
+    embeddings = FakeEmbeddings(fail_on="4")
+
+    with pytest.raises(RuntimeError, match="embedding failed: 4"):
+        run(9, embeddings=embeddings, batch_size=3, concurrency=1)
+
+
+def test_batches_before_a_failure_stay_committed():
+    collection = FakeCollection()
+    embeddings = FakeEmbeddings(fail_on="4")
+
+    with pytest.raises(RuntimeError):
+        run(9, collection=collection, embeddings=embeddings, batch_size=3, concurrency=1)
+
+    # 重跑时已写入的第一批会被跳过
+    assert collection.upserts[0] == ["id-0", "id-1", "id-2"]
+    assert "id-4" not in collection.rows
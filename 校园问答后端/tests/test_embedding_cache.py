@@ -0,0 +1,94 @@
+import os
+import threading
+
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings, EmbeddingStore
+
+
+class FakeEmbeddings(Embeddings):
+    """按文本长度生成向量，并记录实际计算的次数"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += len(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return [float(len(text)), 0.0]
+
+
+def test_vectors_persist_across_instances(tmp_path):
+    EmbeddingStore(str(tmp_path)).put_many({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+    store = EmbeddingStore(str(tmp_path))
+    assert store.get_many(["a", "b", "c"]) == {"a": [1.0, 2.0], "b": [3.0, 4.0]}
+    assert len(store) == 2
+
+
+def test_uncommitted_tail_is_overwritten(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many({"a": [1.0, 2.0]})
+    # 模拟写入文件后未能提交索引：文件比已提交的行数多出一行半
+    with open(store.vectors_path, "ab") as f:
+        f.write(b"\x00" * 12)
+
+    store.put_many({"b": [3.0, 4.0]})
+    assert os.path.getsize(store.vectors_path) == 2 * 2 * 4
+    assert EmbeddingStore(str(tmp_path)).get_many(["a", "b"]) == {"a": [1.0, 2.0], "b": [3.0, 4.0]}
+
+
+def test_cache_without_row_count_uses_max_row(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.put_many({"a": [1.0, 2.0], "b": [3.0, 4.0]})
+    store._db.execute("DELETE FROM meta WHERE name = 'rows'")  # 旧版缓存没有记录行数
+    with open(store.vectors_path, "ab") as f:
+        f.write(b"\x00" * 8)
+
+    store.put_many({"c": [5.0, 6.0]})
+    assert store.get_many(["a", "b", "c"]) == {"a": [1.0, 2.0], "b": [3.0, 4.0], "c": [5.0, 6.0]}
+
+
+def test_documents_are_computed_once(tmp_path):
+    fake = FakeEmbeddings()
+    embeddings = CachedEmbeddings(fake, "fake", cache_dir=str(tmp_path))
+    assert embeddings.embed_documents(["甲", "乙乙", "甲"]) == [[1.0, 1.0], [2.0, 1.0], [1.0, 1.0]]
+    assert embeddings.embed_documents(["乙乙"]) == [[2.0, 1.0]]
+    assert fake.calls == 2
+    assert embeddings.stats()["hits"] == 1
+    assert embeddings.stats()["misses"] == 2
+
+
+def test_queries_can_stay_in_memory(tmp_path):
+    fake = FakeEmbeddings()
+    embeddings = CachedEmbeddings(fake, "fake", cache_dir=str(tmp_path), persist_queries=False, query_cache_size=2)
+    embeddings.embed_query("一")
+    embeddings.embed_query("一")
+    assert fake.calls == 1
+    assert len(embeddings.store) == 0
+
+    embeddings.embed_query("二二")
+    embeddings.embed_query("三三三")  # 超出上限，最久未用的“一”被淘汰
+    embeddings.embed_query("一")
+    assert fake.calls == 4
+    assert embeddings.stats()["hits"] == 1
+
+
+def test_counters_are_consistent_under_threads(tmp_path):
+    embeddings = CachedEmbeddings(FakeEmbeddings(), "fake", cache_dir=str(tmp_path), persist_queries=False)
+    texts = [f"问题{i % 10}" for i in range(50)]
+
+    def worker():
+        for text in texts:
+            embeddings.embed_query(text)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = embeddings.stats()
+    assert stats["hits"] + stats["misses"] == 4 * len(texts)
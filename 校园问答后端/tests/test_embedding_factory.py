@@ -0,0 +1,45 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_community")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from embedding_factory import EmbeddingMismatchError, open_vectorstore, stored_embedding_dim  # noqa: E402
+
+
+class FixedEmbeddings(Embeddings):
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [1.0] + [0.0] * (self.dim - 1)
+
+
+def test_new_collection_gets_full_metadata(tmp_path):
+    store = open_vectorstore(str(tmp_path), FixedEmbeddings(4), "m4", "ollama", 4, metadata={"hnsw:space": "cosine"})
+    metadata = store._collection.metadata
+    assert metadata["hnsw:space"] == "cosine"
+    assert metadata["embedding_dim"] == 4
+    assert metadata["embedding_model"] == "m4"
+
+
+def test_dimension_mismatch_is_rejected_and_metadata_kept(tmp_path):
+    store = open_vectorstore(str(tmp_path), FixedEmbeddings(4), "m4", "ollama", 4, metadata={"hnsw:space": "cosine"})
+    store.add_texts(["甲"], ids=["a"])
+
+    with pytest.raises(EmbeddingMismatchError):
+        open_vectorstore(str(tmp_path), FixedEmbeddings(8), "m4", "ollama", 8, metadata={"hnsw:space": "cosine"})
+
+    reopened = open_vectorstore(str(tmp_path), FixedEmbeddings(4), "m4", "ollama", 4)
+    assert stored_embedding_dim(reopened) == 4
+    assert reopened._collection.metadata["hnsw:space"] == "cosine"
+
+
+def test_model_mismatch_is_rejected(tmp_path):
+    open_vectorstore(str(tmp_path), FixedEmbeddings(4), "m4", "ollama", 4)
+    with pytest.raises(EmbeddingMismatchError):
+        open_vectorstore(str(tmp_path), FixedEmbeddings(4), "other", "ollama", 4)
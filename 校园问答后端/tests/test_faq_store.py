@@ -0,0 +1,73 @@
+from faq_store import FAQStore, answers_stale, knowledge_base_fingerprint, normalize_question, save_answers
+from ingest_manifest import IngestManifest
+
+
+def test_normalize_strips_punctuation_prefix_and_particles():
+    assert normalize_question("请问，学生证怎么办理？") == "学生证怎么办理"
+    assert normalize_question("学生证 怎么 办理吗") == "学生证怎么办理"
+    assert normalize_question("ＭＯＯＣ在哪看") == "mooc在哪看"
+
+
+def test_normalize_keeps_bare_particle():
+    assert normalize_question("吗") == "吗"
+
+
+def build_kb(tmp_path, sha="aaa"):
+    """在 tmp_path 下写一个只含一个文件的训练清单，返回 (知识库目录, 清单)"""
+    docs_dir = tmp_path / "docs"
+    docs_dir.mkdir(exist_ok=True)
+    source = docs_dir / "学生证.txt"
+    source.write_text("学生证在学院办公室办理", encoding="utf-8")
+    db_dir = tmp_path / "db"
+    manifest = IngestManifest(str(db_dir), str(docs_dir))
+    manifest.record("日常生活相关", str(source), sha, ["id-0"])
+    manifest.save()
+    return str(db_dir), manifest
+
+
+def save_faq(db_dir, answer="到学院办公室办理"):
+    entry = {"question": "学生证怎么办理", "answer": answer, "sources": ["学生证.txt"]}
+    save_answers(db_dir, [entry], knowledge_base_fingerprint(db_dir), [{"question": entry["question"]}])
+
+
+def test_exact_and_near_duplicate_questions_hit(tmp_path):
+    db_dir, _ = build_kb(tmp_path)
+    save_faq(db_dir)
+    store = FAQStore(db_dir, check_interval=0)
+
+    assert store.lookup("学生证怎么办理")["answer"] == "到学院办公室办理"
+    hit = store.lookup("请问学生证怎么办理？")
+    assert hit["sources"] == ["学生证.txt"]
+    assert store.lookup("校园卡怎么办理") is None
+
+    stats = store.stats()
+    assert (stats["hits"], stats["misses"]) == (2, 1)
+    assert not stats["stale"]
+
+
+def test_changed_manifest_fingerprint_invalidates_entries(tmp_path):
+    db_dir, manifest = build_kb(tmp_path)
+    save_faq(db_dir)
+    store = FAQStore(db_dir, check_interval=0)
+    assert store.lookup("学生证怎么办理") is not None
+
+    # 重新训练后文件内容哈希变化，清单指纹随之变化
+    key = next(iter(manifest.files))
+    manifest.files[key]["sha256"] = "bbb"
+    manifest.save()
+
+    assert answers_stale(db_dir)
+    assert store.lookup("学生证怎么办理") is None
+    assert store.stats()["stale"]
+
+    # 重建答案库后恢复命中
+    save_faq(db_dir, answer="到所在学院办公室办理")
+    assert not answers_stale(db_dir)
+    assert store.lookup("学生证怎么办理")["answer"] == "到所在学院办公室办理"
+
+
+def test_missing_answer_file_misses(tmp_path):
+    db_dir, _ = build_kb(tmp_path)
+    store = FAQStore(db_dir, check_interval=0)
+    assert store.lookup("学生证怎么办理") is None
+    assert not answers_stale(db_dir)
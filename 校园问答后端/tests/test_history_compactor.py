@@ -0,0 +1,107 @@
+import threading
+import time
+
+import pytest
+
+from context_budget import estimate_tokens
+from history_compactor import SUMMARY_PREFIX, HistoryCompactor, truncate_to_tokens
+from session_store import MemorySessionStore, SQLiteSessionStore, format_history
+
+
+def wait_idle(compactor, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while compactor.stats()["pending"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_truncate_to_tokens():
+    assert truncate_to_tokens("短文本", 10) == "短文本"
+    assert estimate_tokens(truncate_to_tokens("长" * 100, 10)) <= 10
+    assert truncate_to_tokens("任何内容", 0) == ""
+
+
+def test_fit_keeps_summary_and_last_turn_within_budget():
+    compactor = HistoryCompactor(MemorySessionStore(), summarize=str, max_tokens=200)
+    turns = [("早先的问题", "早先的回答"), ("最后的问题", "很长的回答" * 100)]
+    summary, kept = compactor.fit("摘" * 300, turns)
+
+    assert summary.startswith(SUMMARY_PREFIX)
+    assert estimate_tokens(summary) <= 100
+    assert kept[-1][0] == "最后的问题"
+    assert kept[-1][1].startswith("很长的回答")
+    assert estimate_tokens(summary) + estimate_tokens(format_history(kept)) <= 200
+
+
+def test_fit_adds_earlier_turns_newest_first():
+    compactor = HistoryCompactor(MemorySessionStore(), summarize=str, max_tokens=60)
+    turns = [("问一", "答" * 40), ("问二", "答二"), ("问三", "答三")]
+    _, kept = compactor.fit("", turns)
+    assert [question for question, _ in kept] == ["问二", "问三"]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_schedule_folds_old_turns_into_summary(backend, tmp_path):
+    if backend == "memory":
+        store = MemorySessionStore()
+    else:
+        store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"))
+    prompts = []
+    compactor = HistoryCompactor(store, summarize=lambda prompt: prompts.append(prompt) or "用户在问宿舍", keep_turns=1)
+    store.append("s", "宿舍几点关门", "23:00")
+    store.append("s", "可以晚归吗", "需要登记")
+
+    compactor.schedule("s")
+    wait_idle(compactor)
+
+    assert store.summary("s") == "用户在问宿舍"
+    assert store.history("s") == [("可以晚归吗", "需要登记")]
+    assert "宿舍几点关门" in prompts[0]
+    assert compactor.stats()["folded_turns"] == 1
+
+
+def test_no_compaction_within_keep_turns():
+    store = MemorySessionStore()
+    compactor = HistoryCompactor(store, summarize=lambda prompt: pytest.fail("不应压缩"), keep_turns=1)
+    store.append("s", "问", "答")
+    compactor.schedule("s")
+    assert compactor.stats()["compactions"] == 0
+
+
+def test_turns_added_during_compaction_are_kept():
+    store = MemorySessionStore()
+    started, release = threading.Event(), threading.Event()
+
+    def summarize(prompt):
+        started.set()
+        release.wait(2)
+        return "摘要"
+
+    compactor = HistoryCompactor(store, summarize=summarize, keep_turns=1)
+    store.append("s", "问1", "答1")
+    store.append("s", "问2", "答2")
+    compactor.schedule("s")
+    started.wait(2)
+    store.append("s", "问3", "答3")
+    compactor.schedule("s")  # 同一会话已有压缩任务，跳过
+    release.set()
+    wait_idle(compactor)
+
+    assert store.history("s") == [("问2", "答2"), ("问3", "答3")]
+    assert compactor.stats()["skipped"] == 1
+
+
+def test_failed_summary_keeps_history():
+    store = MemorySessionStore()
+
+    def summarize(prompt):
+        raise ConnectionError("ollama 不可用")
+
+    compactor = HistoryCompactor(store, summarize=summarize, keep_turns=1)
+    store.append("s", "问1", "答1")
+    store.append("s", "问2", "答2")
+    compactor.schedule("s")
+    wait_idle(compactor)
+
+    assert store.history("s") == [("问1", "答1"), ("问2", "答2")]
+    assert store.summary("s") == ""
+    assert compactor.stats()["failures"] == 1
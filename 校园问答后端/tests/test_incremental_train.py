@@ -0,0 +1,78 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_community")
+
+from langchain_core.documents import Document  # noqa: E402
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from CreateForDeepseek import NWUKnowledgeTrainer  # noqa: E402
+from embedding_factory import DEFAULT_COLLECTION  # noqa: E402
+from ingest_manifest import IngestManifest, file_sha256  # noqa: E402
+
+
+class FakeEmbeddings(Embeddings):
+    """按文本长度生成固定维度向量，不请求模型"""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 1.0, 0.0, 0.5]
+
+
+def make_trainer(tmp_path):
+    trainer = NWUKnowledgeTrainer(embedding_cache_dir=str(tmp_path / "cache"))
+    trainer.embeddings = FakeEmbeddings()
+    trainer.category_config = {"学校概况": {"chunk_size": 200, "chunk_overlap": 0, "file_types": [".txt"]}}
+
+    def load_file(file_path, category):
+        with open(file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+        return [Document(page_content=text, metadata={
+            "category": category, "source_path": file_path, "file_hash": file_sha256(file_path)})]
+
+    trainer.load_file = load_file
+    return trainer
+
+
+def stored_chunks(db_dir):
+    import chromadb
+
+    collection = chromadb.PersistentClient(path=db_dir).get_collection(DEFAULT_COLLECTION)
+    data = collection.get(include=["metadatas", "documents"])
+    return {chunk_id: (meta["source_path"], text)
+            for chunk_id, meta, text in zip(data["ids"], data["metadatas"], data["documents"])}
+
+
+def test_incremental_train_replaces_changed_and_removes_deleted_files(tmp_path):
+    docs, db_dir = tmp_path / "docs", str(tmp_path / "db")
+    (docs / "学校概况").mkdir(parents=True)
+    changed = docs / "学校概况" / "changed.txt"
+    removed = docs / "学校概况" / "removed.txt"
+    kept = docs / "学校概况" / "kept.txt"
+    changed.write_text("旧的校历安排", encoding="utf-8")
+    removed.write_text("将被删除的通知", encoding="utf-8")
+    kept.write_text("保持不变的校园简介", encoding="utf-8")
+
+    trainer = make_trainer(tmp_path)
+    assert trainer.train_incremental(str(docs), db_dir)
+    before = IngestManifest(db_dir, str(docs))
+    old_ids = set(before.chunk_ids("学校概况/changed.txt"))
+    removed_ids = set(before.chunk_ids("学校概况/removed.txt"))
+    kept_ids = set(before.chunk_ids("学校概况/kept.txt"))
+    assert old_ids and removed_ids and kept_ids
+
+    changed.write_text("新的校历安排（已修订）", encoding="utf-8")
+    removed.unlink()
+    assert trainer.train_incremental(str(docs), db_dir)
+
+    chunks = stored_chunks(db_dir)
+    after = IngestManifest(db_dir, str(docs))
+    new_ids = set(after.chunk_ids("学校概况/changed.txt"))
+    assert not old_ids & set(chunks)
+    assert not removed_ids & set(chunks)
+    assert set(chunks) == new_ids | kept_ids
+    assert {text for _, text in chunks.values()} == {"新的校历安排（已修订）", "保持不变的校园简介"}
+    assert "学校概况/removed.txt" not in after.files
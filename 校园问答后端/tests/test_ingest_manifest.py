@@ -0,0 +1,94 @@
+import os
+
+from langchain_core.documents import Document
+
+from ingest_manifest import IngestManifest, chunk_ids_for, file_sha256
+
+
+def write(path, text, mtime=None):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def record_all(manifest, files):
+    for category, file_path in files:
+        manifest.record(category, file_path, file_sha256(file_path), [f"{manifest.key(file_path)}-0"])
+
+
+def test_diff_reports_added_updated_deleted_and_unchanged(tmp_path):
+    docs = tmp_path / "docs"
+    kept = write(docs / "日常生活相关" / "kept.txt", "不变", mtime=1000)
+    changed = write(docs / "日常生活相关" / "changed.txt", "旧内容", mtime=1000)
+    removed = write(docs / "竞赛相关" / "removed.txt", "将被删除", mtime=1000)
+    manifest = IngestManifest(str(tmp_path / "db"), str(docs))
+    record_all(manifest, [("日常生活相关", kept), ("日常生活相关", changed), ("竞赛相关", removed)])
+
+    write(docs / "日常生活相关" / "changed.txt", "新内容不一样", mtime=2000)
+    added = write(docs / "竞赛相关" / "added.txt", "新文件")
+    os.remove(removed)
+
+    diff = manifest.diff([("日常生活相关", kept), ("日常生活相关", changed), ("竞赛相关", added)])
+
+    assert diff.added == [("竞赛相关", added)]
+    assert diff.updated == [("日常生活相关", changed)]
+    assert diff.unchanged == [("日常生活相关", kept)]
+    assert diff.deleted == ["竞赛相关/removed.txt"]
+    assert diff.changed == [("竞赛相关", added), ("日常生活相关", changed)]
+
+
+def test_touched_file_with_same_content_is_unchanged(tmp_path):
+    docs = tmp_path / "docs"
+    path = write(docs / "学校概况" / "a.txt", "内容", mtime=1000)
+    manifest = IngestManifest(str(tmp_path / "db"), str(docs))
+    record_all(manifest, [("学校概况", path)])
+
+    os.utime(path, (3000, 3000))
+    diff = manifest.diff([("学校概况", path)])
+
+    assert diff.unchanged == [("学校概况", path)]
+    assert manifest.files["学校概况/a.txt"]["mtime"] == 3000
+
+
+def test_category_change_counts_as_update(tmp_path):
+    docs = tmp_path / "docs"
+    path = write(docs / "a.txt", "内容", mtime=1000)
+    manifest = IngestManifest(str(tmp_path / "db"), str(docs))
+    record_all(manifest, [("竞赛相关", path)])
+
+    diff = manifest.diff([("学校概况", path)])
+
+    assert diff.updated == [("学校概况", path)]
+
+
+def test_manifest_round_trips_through_save(tmp_path):
+    docs = tmp_path / "docs"
+    path = write(docs / "a.txt", "内容")
+    manifest = IngestManifest(str(tmp_path / "db"), str(docs))
+    manifest.record("学校概况", path, file_sha256(path), ["x-00000", "x-00001"])
+    manifest.avg_chunk_seconds = 0.25
+    manifest.save()
+
+    loaded = IngestManifest(str(tmp_path / "db"), str(docs))
+
+    assert loaded.chunk_ids("a.txt") == ["x-00000", "x-00001"]
+    assert loaded.avg_chunk_seconds == 0.25
+    assert loaded.fingerprint() == manifest.fingerprint()
+    assert loaded.diff([("学校概况", path)]).unchanged == [("学校概况", path)]
+
+
+def test_chunk_ids_are_stable_per_file_and_content():
+    def splits(path, file_hash, n):
+        return [Document(page_content=str(i), metadata={"source_path": path, "file_hash": file_hash})
+                for i in range(n)]
+
+    first = chunk_ids_for(splits("a.txt", "h1", 2) + splits("b.txt", "h1", 1))
+    again = chunk_ids_for(splits("a.txt", "h1", 2))
+    edited = chunk_ids_for(splits("a.txt", "h2", 2))
+
+    assert first[:2] == again
+    assert first[0].endswith("-00000") and first[1].endswith("-00001") and first[2].endswith("-00000")
+    assert len(set(first)) == 3
+    assert not set(edited) & set(again)
@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.documents import Document
+
+from keyword_index import KeywordIndex, exact_term_hits, exact_terms, reciprocal_rank_fusion
+
+CHUNKS = [
+    ("a", "2024年全国大学英语四六级考试报名通知，报名时间为9月。", {"source": "四六级.txt"}),
+    ("b", "2024版本科生学业指南：选课、考试与学籍管理。", {"source": "学业指南.txt"}),
+    ("c", "学生证补办：携带一寸照片到学院办公室申请补办学生证。", {"source": "学生证.txt"}),
+    ("d", "CS101 程序设计基础，上课地点为长安校区教学楼A201。", {"source": "课程.txt"}),
+    ("e", "教务处电话：029-88302114，办公地点为行政楼。", {"source": "电话.txt"}),
+]
+
+
+def build_index():
+    return KeywordIndex.build(iter(CHUNKS))
+
+
+def test_years_and_grades_are_not_exact_terms():
+    assert exact_terms("2024年学生证怎么补办") == []
+    assert exact_terms("2022级培养方案") == []
+
+
+def test_phone_numbers_keep_area_code():
+    assert exact_terms("教务处电话029-88302114是多少") == ["029-88302114"]
+    assert exact_terms("手机13912345678") == ["13912345678"]
+
+
+def test_year_question_does_not_short_circuit():
+    index = build_index()
+    question = "2024年学生证怎么补办"
+    results = index.search(question, k=5)
+    assert results
+    assert exact_term_hits(question, results) == []
+
+
+def test_course_code_and_phone_short_circuit():
+    index = build_index()
+    question = "CS101 在哪里上课"
+    hits = exact_term_hits(question, index.search(question, k=5))
+    assert [doc.metadata["source"] for doc, _ in hits] == ["课程.txt"]
+
+    question = "029-88302114 是哪个部门的电话"
+    hits = exact_term_hits(question, index.search(question, k=5))
+    assert [doc.metadata["source"] for doc, _ in hits] == ["电话.txt"]
+
+
+def test_low_coverage_hit_does_not_short_circuit():
+    results = [(Document(page_content="CS101", metadata={"source": "x"}), 1.0)]
+    assert exact_term_hits("CS101 期末考试 成绩 复查 申请 流程", results) == []
+
+
+def test_search_filters_by_metadata():
+    index = build_index()
+    results = index.search("补办学生证", k=5, where={"source": "学生证.txt"})
+    assert [doc.metadata["source"] for doc, _ in results] == ["学生证.txt"]
+
+
+def test_save_and_load_round_trip(tmp_path):
+    index = build_index()
+    index.save(str(tmp_path))
+    loaded = KeywordIndex.load(str(tmp_path))
+    assert len(loaded) == len(index)
+    assert [doc.page_content for doc, _ in loaded.search("学生证", k=2)] == \
+        [doc.page_content for doc, _ in index.search("学生证", k=2)]
+
+
+def test_concurrent_saves_do_not_share_a_temp_file(tmp_path):
+    index = build_index()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(lambda _: index.save(str(tmp_path)), range(8)))
+    assert sorted(os.listdir(tmp_path)) == ["keyword_index.json"]
+    assert len(KeywordIndex.load(str(tmp_path))) == len(index)
+
+
+def test_reciprocal_rank_fusion_merges_same_chunk():
+    a = Document(page_content="甲", metadata={"source": "1"})
+    b = Document(page_content="乙", metadata={"source": "2"})
+    fused = reciprocal_rank_fusion([[(a, 0.9), (b, 0.5)], [(b, 3.0)]], k=60)
+    assert [doc.page_content for doc, _ in fused] == ["乙", "甲"]
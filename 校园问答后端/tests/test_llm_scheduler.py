@@ -0,0 +1,188 @@
+import threading
+import time
+
+import pytest
+
+from llm_scheduler import GenerateScheduler, SchedulerFullError
+
+
+def test_identical_requests_share_one_generation():
+    calls = []
+    release = threading.Event()
+
+    def generate(**kwargs):
+        calls.append(kwargs)
+        release.wait(2)
+        return {"response": kwargs["prompt"]}
+
+    scheduler = GenerateScheduler(generate, window_ms=20, workers=1)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(scheduler.submit(model="m", prompt="你好")))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert len(calls) == 1
+    assert results == [{"response": "你好"}] * 3
+    assert scheduler.stats()["coalesced"] == 2
+
+
+def test_same_prompt_on_different_models_is_not_merged():
+    calls = []
+    release = threading.Event()
+
+    def generate(**kwargs):
+        calls.append(kwargs["model"])
+        release.wait(2)
+        return {"response": kwargs["model"]}
+
+    scheduler = GenerateScheduler(generate, window_ms=20, workers=2)
+    results = {}
+    threads = [threading.Thread(target=lambda m=model: results.update({m: scheduler.submit(model=m, prompt="你好")}))
+               for model in ("deepseek-r1:14b", "llama3:8b")]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join(2)
+
+    assert sorted(calls) == ["deepseek-r1:14b", "llama3:8b"]
+    assert results == {"deepseek-r1:14b": {"response": "deepseek-r1:14b"}, "llama3:8b": {"response": "llama3:8b"}}
+    assert scheduler.stats()["coalesced"] == 0
+
+
+def test_shorter_prompts_dispatch_first():
+    order = []
+    scheduler = GenerateScheduler(lambda **kwargs: order.append(kwargs["prompt"]) or {}, window_ms=50, workers=1)
+    threads = [threading.Thread(target=scheduler.submit, kwargs={"model": "m", "prompt": prompt})
+               for prompt in ("很长很长的问题", "短", "中等问题")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(2)
+    assert order == ["短", "中等问题", "很长很长的问题"]
+
+
+def test_chat_prompt_length_sums_messages():
+    kwargs = {"messages": [{"role": "system", "content": "abc"}, {"role": "user", "content": "de"}]}
+    assert GenerateScheduler._prompt_length(kwargs) == 5
+
+
+def test_full_queue_rejects():
+    release = threading.Event()
+    scheduler = GenerateScheduler(lambda **kwargs: release.wait(2) and {}, window_ms=0, max_queue=1, workers=1)
+    threading.Thread(target=scheduler.submit, kwargs={"model": "m", "prompt": "a"}, daemon=True).start()
+    time.sleep(0.05)  # 第一个请求已在生成中
+    threading.Thread(target=scheduler.submit, kwargs={"model": "m", "prompt": "b"}, daemon=True).start()
+    time.sleep(0.05)  # 第二个请求占满队列
+    with pytest.raises(SchedulerFullError):
+        scheduler.submit(model="m", prompt="c")
+    release.set()
+    assert scheduler.stats()["rejected"] == 1
+
+
+def test_errors_reach_every_waiter():
+    def generate(**kwargs):
+        raise ConnectionError("ollama 不可用")
+
+    scheduler = GenerateScheduler(generate, window_ms=0, workers=1)
+    with pytest.raises(ConnectionError):
+        scheduler.submit(model="m", prompt="a")
+    assert scheduler.stats()["inflight"] == 0
+
+
+def test_concurrent_streams_never_exceed_workers():
+    lock = threading.Lock()
+    active, peak = [0], [0]
+
+    def generate(stream=False, **kwargs):
+        assert stream
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        try:
+            for i in range(3):
+                time.sleep(0.01)
+                yield {"message": {"content": f"{kwargs['prompt']}-{i}"}}
+        finally:
+            with lock:
+                active[0] -= 1
+
+    scheduler = GenerateScheduler(generate, window_ms=0, workers=2)
+    outputs = {}
+
+    def consume(prompt):
+        outputs[prompt] = [part["message"]["content"] for part in scheduler.stream(model="m", prompt=prompt)]
+
+    threads = [threading.Thread(target=consume, args=(f"q{i}",)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    assert peak[0] == 2
+    assert outputs["q3"] == ["q3-0", "q3-1", "q3-2"]
+    stats = scheduler.stats()
+    assert stats["streams"] == 6 and stats["dispatched"] == 6
+
+
+def test_stream_and_submit_share_the_cap():
+    release = threading.Event()
+
+    def generate(stream=False, **kwargs):
+        if stream:
+            def parts():
+                release.wait(2)
+                yield {"message": {"content": "完"}}
+            return parts()
+        return {"message": {"content": "普通"}}
+
+    scheduler = GenerateScheduler(generate, window_ms=0, workers=1)
+    stream = scheduler.stream(model="m", prompt="流式")
+    reader = threading.Thread(target=lambda: list(stream))
+    reader.start()
+    time.sleep(0.05)
+    result = []
+    blocked = threading.Thread(target=lambda: result.append(scheduler.submit(model="m", prompt="b")))
+    blocked.start()
+    time.sleep(0.05)
+    assert result == []  # 唯一的名额被流式生成占用
+    release.set()
+    blocked.join(2)
+    reader.join(2)
+    assert result == [{"message": {"content": "普通"}}]
+
+
+def test_stream_error_reaches_reader():
+    def generate(stream=False, **kwargs):
+        yield {"message": {"content": "部分"}}
+        raise ConnectionError("ollama 断开")
+
+    scheduler = GenerateScheduler(generate, window_ms=0, workers=1)
+    received = []
+    with pytest.raises(ConnectionError):
+        for part in scheduler.stream(model="m", prompt="a"):
+            received.append(part)
+    assert received == [{"message": {"content": "部分"}}]
+
+
+def test_abandoned_stream_frees_its_slot():
+    def generate(stream=False, **kwargs):
+        if not stream:
+            return {"ok": True}
+        def parts():
+            for i in range(1000):
+                time.sleep(0.005)
+                yield {"i": i}
+        return parts()
+
+    scheduler = GenerateScheduler(generate, window_ms=0, workers=1)
+    stream = scheduler.stream(model="m", prompt="a")
+    next(stream)
+    stream.close()
+    assert scheduler.submit(model="m", prompt="b") == {"ok": True}
@@ -0,0 +1,84 @@
+import time
+
+import metrics
+
+
+def test_histogram_renders_cumulative_buckets(monkeypatch):
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+    histogram = metrics.Histogram("t_seconds", "测试耗时", (0.1, 1), ("mode",))
+    for value in (0.05, 0.5, 3):
+        histogram.observe(value, mode="knowledge")
+
+    assert metrics.render().splitlines() == [
+        "# HELP t_seconds 测试耗时",
+        "# TYPE t_seconds histogram",
+        't_seconds_bucket{mode="knowledge",le="0.1"} 1.0',
+        't_seconds_bucket{mode="knowledge",le="1"} 2.0',
+        't_seconds_bucket{mode="knowledge",le="+Inf"} 3.0',
+        't_seconds_sum{mode="knowledge"} 3.55',
+        't_seconds_count{mode="knowledge"} 3.0',
+    ]
+
+
+def test_counter_and_gauge_render(monkeypatch):
+    monkeypatch.setattr(metrics, "_REGISTRY", [])
+    counter = metrics.Counter("t_total", "测试次数", ("reason",))
+    metrics.Gauge("t_depth", "测试深度", lambda: 3)
+    counter.inc(reason="empty")
+    counter.inc(2, reason="empty")
+    counter.inc(reason="error")
+
+    text = metrics.render()
+
+    assert text.endswith("\n")
+    assert "# TYPE t_total counter\n" in text
+    assert 't_total{reason="empty"} 3\n' in text
+    assert 't_total{reason="error"} 1\n' in text
+    assert "# TYPE t_depth gauge\nt_depth 3.0\n" in text
+
+
+def test_spans_accumulate_per_stage():
+    timings = metrics.start_request("test_stages", debug=True)
+    with metrics.span("retrieval"):
+        time.sleep(0.01)
+    with metrics.span("retrieval"):
+        time.sleep(0.01)
+    with metrics.span("generation"):
+        pass
+    metrics.finish_request(timings)
+
+    result = timings.as_dict()
+    assert set(timings.stages) == {"retrieval", "generation"}
+    assert result["retrieval_ms"] >= 20
+    assert result["total_ms"] >= result["retrieval_ms"]
+    assert metrics.current_timings() is None
+    assert 'nwu_stage_seconds_count{mode="test_stages",stage="retrieval"} 2' in metrics.render()
+    assert 'nwu_request_seconds_count{mode="test_stages"} 1' in metrics.render()
+
+
+def test_generation_counts_reach_timings():
+    timings = metrics.start_request("test_generation")
+    metrics.record_generation({
+        "prompt_eval_count": 100, "prompt_eval_duration": 50_000_000,
+        "eval_count": 40, "eval_duration": 2_000_000_000, "load_duration": 0
+    })
+    metrics.record_fallback("test_reason")
+    metrics.finish_request(timings)
+
+    result = timings.as_dict()
+    assert result["prompt_tokens"] == 100
+    assert result["prompt_eval_ms"] == 50.0
+    assert result["tokens_per_second"] == 20.0
+    assert result["fallback"] == "test_reason"
+    assert 'nwu_knowledge_fallback_total{reason="test_reason"} 1' in metrics.render()
+
+
+def test_records_outside_a_request_only_update_metrics():
+    assert metrics.current_timings() is None
+    with metrics.span("test_orphan"):
+        pass
+    metrics.record_model("test-model")
+
+    text = metrics.render()
+    assert 'nwu_stage_seconds_count{mode="",stage="test_orphan"} 1' in text
+    assert 'nwu_model_requests_total{model="test-model",mode=""} 1' in text
@@ -0,0 +1,75 @@
+from langchain_core.documents import Document
+
+from model_cascade import CascadePolicy
+
+UNAVAILABLE = "当前服务不可用，请稍后再试"
+
+
+def policy(**kwargs):
+    return CascadePolicy("llama3:8b", "deepseek-r1:14b", **kwargs)
+
+
+def scored(text, score=0.9, source="电话.txt"):
+    return [(Document(page_content=text, metadata={"source": source}), score)]
+
+
+def test_precheck_sends_confident_short_context_to_small_model():
+    assert policy(min_score=0.6).precheck(0.8, scored("教务处电话029-88302114")) is None
+
+
+def test_precheck_escalates_low_confidence_and_long_context():
+    assert policy(min_score=0.6).precheck(0.5, scored("短")) == "low_confidence"
+    assert policy(max_context_tokens=10).precheck(0.9, scored("长" * 50)) == "long_context"
+
+
+def test_check_answer_reasons():
+    check = policy().check_answer
+    assert check("", ["电话.txt"], UNAVAILABLE) == "empty"
+    assert check(UNAVAILABLE, ["电话.txt"], UNAVAILABLE) == "empty"
+    assert check("抱歉，我无法回答这个问题", ["电话.txt"], UNAVAILABLE) == "refusal"
+    assert check("电话是029-88302114", ["通讯录.txt"], UNAVAILABLE) == "missing_source"
+    assert check("根据《通讯录》，电话是029-88302114", ["通讯录.txt"], UNAVAILABLE) is None
+    assert check("电话是029-88302114（来源：教务处）", ["通讯录.txt"], UNAVAILABLE) is None
+
+
+def test_source_check_can_be_disabled():
+    assert policy(require_source=False).check_answer("电话是029-88302114", ["通讯录.txt"], UNAVAILABLE) is None
+
+
+def test_stats_estimate_saved_time():
+    cascade = policy()
+    cascade.record("small", 1.0)
+    cascade.record("small", 1.0)
+    cascade.record("large", 5.0, reason="refusal", wasted_seconds=1.0)
+    stats = cascade.stats()
+
+    assert stats["requests"] == 3
+    assert stats["escalations"] == 1
+    assert stats["escalation_rate"] == 1 / 3
+    assert stats["reasons"] == {"refusal": 1}
+    assert stats["tiers"]["small"]["saved_ms"] == 8000.0
+    assert stats["tiers"]["large"]["saved_ms"] == -1000.0
+    assert stats["saved_ms"] == 7000.0
+
+
+def test_precheck_routing_is_not_an_escalation():
+    cascade = policy()
+    cascade.record("small", 1.0)
+    cascade.record("large", 5.0, reason="low_confidence")
+    cascade.record("large", 5.0, reason="long_context")
+    cascade.record("large", 5.0, reason="missing_source", wasted_seconds=1.0)
+    stats = cascade.stats()
+
+    assert stats["requests"] == 4
+    assert stats["routed"] == 2
+    assert stats["routed_reasons"] == {"low_confidence": 1, "long_context": 1}
+    assert stats["escalations"] == 1
+    assert stats["reasons"] == {"missing_source": 1}
+    # 小模型生成了两次，其中一次升级
+    assert stats["escalation_rate"] == 0.5
+
+
+def test_routing_only_has_no_escalation_rate():
+    cascade = policy()
+    cascade.record("large", 5.0, reason="low_confidence")
+    assert cascade.stats()["escalation_rate"] == 0.0
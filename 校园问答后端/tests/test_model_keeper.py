@@ -0,0 +1,31 @@
+import pytest
+
+pytest.importorskip("fcntl")
+pytest.importorskip("ollama")
+
+from model_keeper import ModelKeeper  # noqa: E402
+
+
+class FakeClient:
+    def __init__(self):
+        self.calls = []
+
+    def generate(self, model, prompt, keep_alive):
+        self.calls.append(model)
+        return {"load_duration": 0}
+
+    def ps(self):
+        return {"models": []}
+
+
+def test_only_one_keeper_holds_the_lock(tmp_path):
+    lock_path = str(tmp_path / "model_keeper.lock")
+    first = ModelKeeper(["m"], client=FakeClient(), lock_path=lock_path)
+    second = ModelKeeper(["m"], client=FakeClient(), lock_path=lock_path)
+    assert first.is_leader()
+    assert first.is_leader()
+    assert not second.is_leader()
+
+
+def test_keeper_without_lock_path_is_always_leader():
+    assert ModelKeeper(["m"], client=FakeClient()).is_leader()
@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("langchain_community")
+
+from model_profiles import DEFAULT_REGISTRY, ModelRegistry, UnknownModelError, load_registry  # noqa: E402
+
+
+def test_default_registry_loads_profiles_and_defaults():
+    registry = load_registry()
+
+    assert set(registry.profiles) == {"deepseek-r1:14b", "llama3:8b"}
+    assert registry.default_chat == "llama3:8b"
+    assert registry.default_knowledge == "deepseek-r1:14b"
+    assert registry.cascade["small"] == "llama3:8b"
+    assert registry.generate_models() == ["deepseek-r1:14b", "llama3:8b"]
+
+
+def test_resolve_by_alias_is_case_insensitive():
+    registry = load_registry()
+
+    assert registry.resolve("DeepSeek", use_knowledge=False).name == "deepseek-r1:14b"
+    assert registry.resolve("deepseek-r1", use_knowledge=False).name == "deepseek-r1:14b"
+    assert registry.resolve("LLAMA3", use_knowledge=True).name == "llama3:8b"
+
+
+def test_resolve_without_name_uses_mode_default():
+    registry = load_registry()
+
+    assert registry.resolve(None, use_knowledge=False).name == "llama3:8b"
+    assert registry.resolve("", use_knowledge=True).name == "deepseek-r1:14b"
+
+
+def test_unknown_model_is_rejected():
+    registry = load_registry()
+
+    # /chat/generate 捕获 UnknownModelError 返回 400
+    with pytest.raises(UnknownModelError, match="qwen"):
+        registry.resolve("qwen:7b", use_knowledge=True)
+    assert issubclass(UnknownModelError, ValueError)
+
+
+def test_each_profile_has_its_own_generate_model():
+    registry = load_registry()
+
+    # 服务端按 profile 名各建一个运行时（语义缓存各自独立），调度器的合并键包含 model 字段
+    names = [registry.resolve(name, use_knowledge=True).name for name in ("deepseek", "llama3")]
+    models = [registry.profiles[name].llm_model for name in names]
+    assert len(set(names)) == 2
+    assert len(set(models)) == 2
+
+
+def test_profiles_share_one_collection_object():
+    registry = load_registry()
+
+    collections = {id(profile.collection) for profile in registry.profiles.values()}
+    assert len(collections) == 1
+    assert registry.embedding_models() == ["deepseek-r1:14b"]
+
+
+def test_registry_file_replaces_whole_sections(tmp_path):
+    path = tmp_path / "profiles.json"
+    path.write_text(json.dumps({
+        "profiles": {
+            "qwen:7b": {"llm_model": "qwen:7b", "collection": "nwu_knowledge_v2",
+                        "prompt_template": "nwu", "aliases": ["qwen"]}
+        },
+        "defaults": {"chat": "qwen", "knowledge": "qwen"},
+        "cascade": None
+    }), encoding="utf-8")
+
+    registry = load_registry(str(path))
+
+    assert list(registry.profiles) == ["qwen:7b"]
+    assert registry.default_chat == "qwen:7b"
+    assert registry.cascade is None
+    with pytest.raises(UnknownModelError):
+        registry.resolve("deepseek", use_knowledge=True)
+
+
+def test_missing_registry_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        load_registry(str(tmp_path / "missing.json"))
+
+
+def test_unknown_collection_is_rejected():
+    data = dict(DEFAULT_REGISTRY, profiles={
+        "llama3:8b": {"llm_model": "llama3:8b", "collection": "missing", "prompt_template": "nwu"}
+    })
+
+    with pytest.raises(ValueError, match="missing"):
+        ModelRegistry.from_dict(data)
+
+
+def test_template_must_contain_context_and_question():
+    data = dict(DEFAULT_REGISTRY, profiles={
+        "llama3:8b": {"llm_model": "llama3:8b", "collection": "nwu_knowledge_v2",
+                      "prompt_template": "问题：{question}"}
+    }, defaults={"chat": "llama3:8b", "knowledge": "llama3:8b"}, cascade=None)
+
+    with pytest.raises(ValueError, match="context"):
+        ModelRegistry.from_dict(data)
+
+
+def test_cascade_requires_shared_collection():
+    data = dict(DEFAULT_REGISTRY, collections={
+        "a": {"db_dir": "./a", "embedding_model": "m"},
+        "b": {"db_dir": "./b", "embedding_model": "m"}
+    }, profiles={
+        "deepseek-r1:14b": {"llm_model": "deepseek-r1:14b", "collection": "a", "prompt_template": "nwu"},
+        "llama3:8b": {"llm_model": "llama3:8b", "collection": "b", "prompt_template": "nwu"}
+    })
+
+    with pytest.raises(ValueError, match="同一个知识库"):
+        ModelRegistry.from_dict(data)
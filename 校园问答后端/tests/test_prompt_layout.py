@@ -0,0 +1,47 @@
+from prompt_layout import ChatPrompt
+
+SYSTEM = "你是西小北"
+
+
+def test_messages_ordered_system_summary_history_request():
+    prompt = ChatPrompt(SYSTEM, "上下文：…\n问题：q3", summary="摘要：之前聊了选课",
+                        turns=[("q1", "a1"), ("q2", "a2")])
+
+    assert prompt.messages() == [
+        {"role": "system", "content": SYSTEM},
+        {"role": "system", "content": "摘要：之前聊了选课"},
+        {"role": "user", "content": "q1"},
+        {"role": "assistant", "content": "a1"},
+        {"role": "user", "content": "q2"},
+        {"role": "assistant", "content": "a2"},
+        {"role": "user", "content": "上下文：…\n问题：q3"},
+    ]
+
+
+def test_empty_summary_adds_no_message():
+    prompt = ChatPrompt(SYSTEM, "q1")
+
+    assert prompt.messages() == [{"role": "system", "content": SYSTEM}, {"role": "user", "content": "q1"}]
+
+
+def test_different_requests_share_the_static_prefix():
+    first = ChatPrompt(SYSTEM, "上下文A\n问题：四六级报名").messages()
+    second = ChatPrompt(SYSTEM, "上下文B\n问题：图书馆开放时间").messages()
+
+    assert first[0] == second[0]
+    assert first[-1] != second[-1]
+
+
+def test_next_turn_only_appends_to_previous_prompt():
+    # 普通对话：上一轮的消息原样成为下一轮的前缀，只在末尾追加回答和新问题
+    previous = ChatPrompt(SYSTEM, "q2", turns=[("q1", "a1")]).messages()
+    following = ChatPrompt(SYSTEM, "q3", turns=[("q1", "a1"), ("q2", "a2")]).messages()
+
+    assert following[:len(previous)] == previous
+    assert following[len(previous):] == [{"role": "assistant", "content": "a2"}, {"role": "user", "content": "q3"}]
+
+
+def test_text_joins_message_contents():
+    prompt = ChatPrompt(SYSTEM, "q2", summary="摘要", turns=[("q1", "a1")])
+
+    assert prompt.text() == "\n".join([SYSTEM, "摘要", "q1", "a1", "q2"])
@@ -0,0 +1,108 @@
+from llm_scheduler import GenerateScheduler
+from reasoning import ANSWER, REASONING, RESULT, ReasoningSplitter, split_reasoning, split_stream
+
+
+def feed_all(chunks, max_chars=None):
+    splitter = ReasoningSplitter(max_chars)
+    events = []
+    for chunk in chunks:
+        events += splitter.feed(chunk)
+    events += splitter.finish()
+    return events, splitter.result()
+
+
+def test_think_block_is_split_from_answer():
+    result = split_reasoning("<think>先查校历</think>\n\n开学时间是9月1日。")
+    assert result.reasoning == "先查校历"
+    assert result.answer == "开学时间是9月1日。"
+
+
+def test_tags_split_across_chunks():
+    events, result = feed_all(["<thi", "nk>想一想</th", "ink>答案"])
+    assert result.reasoning == "想一想"
+    assert result.answer == "答案"
+    assert (ANSWER, "答案") in events
+
+
+def test_plain_answer_streams_without_waiting():
+    splitter = ReasoningSplitter()
+    assert splitter.feed("你好，") == [(ANSWER, "你好，")]
+    assert splitter.feed("同学") == [(ANSWER, "同学")]
+    splitter.finish()
+    assert splitter.result().answer == "你好，同学"
+
+
+def test_bare_close_tag_moves_preceding_text_into_reasoning():
+    # 对话模板已预填 <think>，模型输出只有 </think>
+    result = split_reasoning("用户问的是图书馆开放时间。</think>\n图书馆每天8:00开放。")
+    assert result.reasoning == "用户问的是图书馆开放时间。"
+    assert result.answer == "图书馆每天8:00开放。"
+
+
+def test_bare_close_tag_split_across_chunks():
+    events, result = feed_all(["先想", "一下</", "think>", "回答"])
+    assert result.reasoning == "先想一下"
+    assert result.answer == "回答"
+    assert (REASONING, "先想一下") in events
+
+
+def test_close_tag_inside_answer_after_think_block_is_kept():
+    result = split_reasoning("<think>推理</think>代码里写 </think> 即可")
+    assert result.reasoning == "推理"
+    assert result.answer == "代码里写 </think> 即可"
+
+
+def test_unterminated_think_falls_back_to_reasoning_as_answer():
+    events, result = feed_all(["<think>食堂", "营业到21:00"])
+    assert result.answer == "食堂营业到21:00"
+    assert result.reasoning == ""
+    assert events[-1] == (ANSWER, "食堂营业到21:00")
+
+
+def test_unterminated_fallback_ignores_reasoning_limit():
+    result = split_reasoning("<think>" + "长" * 50, max_chars=10)
+    assert result.answer == "长" * 50
+    assert not result.truncated
+
+
+def test_reasoning_is_truncated_to_max_chars():
+    result = split_reasoning("<think>" + "想" * 50 + "</think>好的", max_chars=10)
+    assert result.reasoning == "想" * 10
+    assert result.truncated
+    assert result.answer == "好的"
+
+
+def failing_chunks():
+    yield "<think>查一下</think>图书馆"
+    yield "周末开放"
+    raise ConnectionError("ollama 断开")
+
+
+def test_mid_stream_failure_is_flagged():
+    events = list(split_stream(failing_chunks(), fallback="当前服务不可用"))
+    channel, result = events[-1]
+    assert channel == RESULT
+    assert result.failed
+    assert result.answer == "当前服务不可用"
+    # 已转发的部分回答之后补发兜底回答
+    assert [text for channel, text in events if channel == ANSWER] == ["图书馆", "周末开放", "当前服务不可用"]
+
+
+def test_completed_stream_is_not_flagged():
+    events = list(split_stream(["<think>想</think>", "好的"]))
+    channel, result = events[-1]
+    assert channel == RESULT
+    assert not result.failed
+    assert result.answer == "好的"
+
+
+def test_failure_through_scheduler_stream_is_flagged():
+    def generate(stream=False, **kwargs):
+        yield {"message": {"content": "部分回答"}}
+        raise ConnectionError("ollama 断开")
+
+    scheduler = GenerateScheduler(generate, window_ms=0, workers=1)
+    chunks = (part["message"]["content"] for part in scheduler.stream(model="m", prompt="a"))
+    events = list(split_stream(chunks, fallback="当前服务不可用"))
+    assert events[0] == (ANSWER, "部分回答")
+    assert events[-1][1].failed
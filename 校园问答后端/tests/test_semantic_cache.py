@@ -0,0 +1,46 @@
+import os
+
+from semantic_cache import SemanticAnswerCache
+
+
+def test_similar_question_hits(tmp_path):
+    cache = SemanticAnswerCache(str(tmp_path), threshold=0.95)
+    cache.store([1.0, 0.0, 0.0], "9月报名", ["四六级.txt"])
+    hit = cache.lookup([0.99, 0.05, 0.0])
+    assert hit["answer"] == "9月报名"
+    assert hit["sources"] == ["四六级.txt"]
+    assert hit["similarity"] > 0.95
+
+
+def test_dissimilar_question_misses(tmp_path):
+    cache = SemanticAnswerCache(str(tmp_path), threshold=0.95)
+    cache.store([1.0, 0.0], "答案", [])
+    assert cache.lookup([0.0, 1.0]) is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_expired_entries_are_dropped(tmp_path):
+    cache = SemanticAnswerCache(str(tmp_path), ttl=0)
+    cache.store([1.0, 0.0], "答案", [])
+    assert cache.lookup([1.0, 0.0]) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_hit_entry_is_evicted(tmp_path):
+    cache = SemanticAnswerCache(str(tmp_path), max_entries=2)
+    cache.store([1.0, 0.0, 0.0], "甲", [])
+    cache.store([0.0, 1.0, 0.0], "乙", [])
+    assert cache.lookup([1.0, 0.0, 0.0])["answer"] == "甲"
+    cache.store([0.0, 0.0, 1.0], "丙", [])
+    assert cache.lookup([0.0, 1.0, 0.0]) is None
+    assert cache.lookup([1.0, 0.0, 0.0])["answer"] == "甲"
+
+
+def test_rebuilt_knowledge_base_clears_cache(tmp_path):
+    db_file = tmp_path / "chroma.sqlite3"
+    db_file.write_bytes(b"v1")
+    cache = SemanticAnswerCache(str(tmp_path), check_interval=0)
+    cache.store([1.0, 0.0], "旧答案", [])
+    db_file.write_bytes(b"v2-rebuilt")
+    os.utime(db_file, ns=(0, 1))
+    assert cache.lookup([1.0, 0.0]) is None
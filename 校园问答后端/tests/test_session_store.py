@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from session_store import MemorySessionStore, SQLiteSessionStore, create_session_store, format_history
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def make(**kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(**kwargs)
+        return SQLiteSessionStore(str(tmp_path / "sessions.sqlite3"), sweep_interval=0, **kwargs)
+    return make
+
+
+def test_keeps_only_recent_turns(make_store):
+    store = make_store(max_turns=2)
+    for i in range(3):
+        store.append("s", f"问{i}", f"答{i}")
+    assert store.history("s") == [("问1", "答1"), ("问2", "答2")]
+    assert store.history("other") == []
+
+
+def test_idle_sessions_expire(make_store):
+    store = make_store(ttl=0.05)
+    store.append("s", "问", "答")
+    time.sleep(0.1)
+    assert store.history("s") == []
+    assert store.stats()["expired"] == 1
+
+
+def test_least_recently_used_session_is_evicted(make_store):
+    store = make_store(max_sessions=2)
+    store.append("a", "问", "答")
+    time.sleep(0.01)
+    store.append("b", "问", "答")
+    time.sleep(0.01)
+    store.history("a")
+    time.sleep(0.01)
+    store.append("c", "问", "答")
+    assert store.history("b") == []
+    assert store.history("a") == [("问", "答")]
+    assert store.stats()["evicted"] == 1
+
+
+def test_clear_removes_session(make_store):
+    store = make_store()
+    store.append("s", "问", "答")
+    store.clear("s")
+    assert store.history("s") == []
+
+
+def test_sqlite_history_survives_reopen(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    SQLiteSessionStore(path).append("s", "问", "答")
+    assert SQLiteSessionStore(path).history("s") == [("问", "答")]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        create_session_store("redis")
+
+
+def test_format_history():
+    assert format_history([("你好", "你好！")]) == "Human: 你好\nAI: 你好！"
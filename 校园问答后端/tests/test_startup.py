@@ -0,0 +1,68 @@
+import threading
+
+import pytest
+
+from startup import StartupTracker
+
+
+def test_not_ready_until_every_step_finishes():
+    tracker = StartupTracker(["llm:m", "kb:vectorstore"])
+    release = threading.Event()
+    worker = threading.Thread(target=tracker.run, args=("kb:vectorstore", release.wait, 2))
+    worker.start()
+
+    tracker.run("llm:m", lambda: None)
+    assert tracker.is_ready("llm:m")
+    assert not tracker.ready()
+    assert tracker.snapshot()["kb:vectorstore"]["state"] in ("pending", "running")
+
+    release.set()
+    worker.join(2)
+    assert tracker.ready()
+    assert tracker.snapshot()["kb:vectorstore"]["state"] == "ready"
+
+
+def test_failed_step_records_error_and_reraises():
+    tracker = StartupTracker(["kb:embeddings"])
+
+    def broken():
+        raise RuntimeError("维度不一致")
+
+    with pytest.raises(RuntimeError):
+        tracker.run("kb:embeddings", broken)
+
+    step = tracker.snapshot()["kb:embeddings"]
+    assert step["state"] == "failed"
+    assert step["error"] == "维度不一致"
+    assert not tracker.ready()
+
+
+def test_retry_clears_previous_error():
+    tracker = StartupTracker(["kb:router"])
+    tracker.fail("kb:router", "依赖的启动步骤失败")
+
+    assert tracker.run("kb:router", lambda: 42) == 42
+    assert tracker.snapshot()["kb:router"] == {"state": "ready", "seconds": 0.0}
+
+
+def test_healthz_and_readyz_before_and_after_init(monkeypatch):
+    for module in ("flask", "flask_cors", "ollama", "chromadb", "langchain", "langchain_community"):
+        pytest.importorskip(module)
+    import app1
+
+    tracker = StartupTracker(app1.STARTUP_STEPS)
+    monkeypatch.setattr(app1, "startup", tracker)
+    client = app1.app.test_client()
+
+    # 启动步骤未完成：进程存活，但未就绪
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.get_json()["ready"] is False
+
+    for step in app1.STARTUP_STEPS:
+        tracker.run(step, lambda: None)
+    assert client.get("/healthz").status_code == 200
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    assert response.get_json()["ready"] is True